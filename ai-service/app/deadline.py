@@ -0,0 +1,107 @@
+import asyncio
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+# Remaining budget in milliseconds, set by the API gateway (relative, so clock skew does not matter)
+DEADLINE_HEADER = b"x-deadline-ms"
+
+request_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+def parse_budget(scope) -> Optional[float]:
+    for key, value in scope["headers"]:
+        if key == DEADLINE_HEADER:
+            try:
+                return max(int(value) / 1000, 0.0)
+            except ValueError:
+                return None
+    return None
+
+def remaining() -> Optional[float]:
+    # Seconds left for the current request, for asyncpg's timeout= and pymongo.timeout(); None without a deadline
+    deadline = request_deadline.get()
+    if deadline is None:
+        return None
+    return max(deadline - time.monotonic(), 0.001)
+
+def max_time_ms() -> Optional[int]:
+    # Same budget as Mongo's maxTimeMS: the server aborts the query instead of finishing it for nobody
+    left = remaining()
+    return None if left is None else max(1, int(left * 1000))
+
+async def deadline_exceeded(send):
+    await send({"type": "http.response.start", "status": 504, "headers": [(b"content-type", b"application/json")]})
+    await send({"type": "http.response.body", "body": b'{"detail":"Deadline exceeded"}'})
+
+class DeadlineMiddleware:
+    # Pure ASGI middleware: the endpoint runs in its own task, cancelled when the caller's deadline
+    # passes (504) or when the client disconnects before the response is complete
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        budget = parse_budget(scope)
+        if budget == 0:
+            # Budget already spent upstream: nobody is waiting for the result
+            return await deadline_exceeded(send)
+        deadline = None if budget is None else time.monotonic() + budget
+        messages = asyncio.Queue()
+        response_started = False
+        response_complete = False
+
+        async def receive_request():
+            message = await messages.get()
+            messages.task_done()
+            return message
+
+        async def send_tracked(message):
+            nonlocal response_started, response_complete
+            if message["type"] == "http.response.start":
+                response_started = True
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                response_complete = True
+            await send(message)
+
+        async def listen():
+            # Owns receive(): relays the body to the endpoint (one chunk ahead at most), then waits for the disconnect
+            while True:
+                message = await receive()
+                messages.put_nowait(message)
+                if message["type"] == "http.disconnect":
+                    return
+                if message.get("more_body", False):
+                    await messages.join()
+
+        async def run():
+            request_deadline.set(deadline)
+            await self.app(scope, receive_request, send_tracked)
+
+        handler = asyncio.ensure_future(run())
+        listener = asyncio.ensure_future(listen())
+        try:
+            timeout = budget
+            while True:
+                done, _ = await asyncio.wait((handler, listener), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if handler in done:
+                    break
+                if listener in done:
+                    # After the last body chunk the server reports a disconnect too; only an early one cancels
+                    if not response_complete:
+                        scope["client_disconnected"] = True
+                        handler.cancel()
+                    break
+                if not response_started:
+                    handler.cancel()
+                    await deadline_exceeded(send)
+                    break
+                # Response already under way: let it finish
+                timeout = None
+            await asyncio.wait((handler,))
+            if not handler.cancelled():
+                handler.result()
+        finally:
+            handler.cancel()
+            listener.cancel()
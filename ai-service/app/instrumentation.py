@@ -0,0 +1,71 @@
+import os
+import time
+from prometheus_client import CollectorRegistry, REGISTRY, multiprocess
+from starlette.routing import Match
+
+KNOWN_METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+
+def route_template(scope) -> str:
+    # The router sets scope["route"]; responses produced before routing (middlewares, 404s)
+    # are matched here so the label stays bounded
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    app = scope.get("app")
+    for candidate in getattr(getattr(app, "router", None), "routes", ()):
+        match, _ = candidate.matches(scope)
+        if match != Match.NONE and hasattr(candidate, "path"):
+            return candidate.path
+    return "unmatched"
+
+def metrics_registry():
+    # Multi-worker mode (serve.py): aggregate the metric files of every process
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+class MetricsMiddleware:
+    # Pure ASGI middleware: labels by route template (/users/{user_id}) instead of the raw path,
+    # which keeps the number of Prometheus series bounded
+    def __init__(self, app, request_count, request_latency):
+        self.app = app
+        self.request_count = request_count
+        self.request_latency = request_latency
+        self.children = {}
+
+    def labelled(self, method: str, endpoint: str, status_code: int):
+        key = (method, endpoint, status_code)
+        children = self.children.get(key)
+        if children is None:
+            labels = {"method": method, "endpoint": endpoint, "status_code": status_code}
+            children = self.children[key] = (
+                self.request_count.labels(**labels),
+                self.request_latency.labels(**labels),
+            )
+        return children
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # Endpoint cancelled by DeadlineMiddleware because the client went away (nginx convention)
+            if scope.get("client_disconnected"):
+                status_code = 499
+            method = scope["method"] if scope["method"] in KNOWN_METHODS else "OTHER"
+            count, latency = self.labelled(method, route_template(scope), status_code)
+            count.inc()
+            latency.observe(time.perf_counter() - start)
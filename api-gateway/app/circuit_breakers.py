@@ -1,44 +1,154 @@
 import time
-import asyncio
 from functools import wraps
+from typing import Optional
+from deadline import DeadlineExceeded
 from logging_config import log_structured
-from config import CIRCUIT_BREAKER_FAILURE_THRESHOLD, CIRCUIT_BREAKER_RECOVERY_TIMEOUT
+from config import (
+    UPSTREAMS,
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+    CIRCUIT_BREAKER_FAILURE_RATE,
+    CIRCUIT_BREAKER_WINDOW,
+    CIRCUIT_BREAKER_BUCKETS,
+    CIRCUIT_BREAKER_RECOVERY_TIMEOUT,
+    CIRCUIT_BREAKER_HALF_OPEN_CALLS,
+)
+from metrics import CIRCUIT_BREAKER_STATE, CIRCUIT_BREAKER_TRANSITIONS
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+STATE_VALUES = {CLOSED: 0, OPEN: 1, HALF_OPEN: 2}
+
+# Réponses upstream comptées comme des échecs (service surchargé ou en redémarrage)
+FAILURE_STATUS_CODES = frozenset({502, 503, 504})
+
+DEFAULT_SETTINGS = {
+    "min_calls": CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+    "failure_rate": CIRCUIT_BREAKER_FAILURE_RATE,
+    "window": CIRCUIT_BREAKER_WINDOW,
+    "buckets": CIRCUIT_BREAKER_BUCKETS,
+    "recovery_timeout": CIRCUIT_BREAKER_RECOVERY_TIMEOUT,
+    "half_open_calls": CIRCUIT_BREAKER_HALF_OPEN_CALLS,
+}
+
+class CircuitOpenError(Exception):
+    pass
+
+class SlidingWindow:
+    # Ring buffer de taille fixe : un slot [index de bucket, succès, échecs] par tranche de temps
+    def __init__(self, window: float, buckets: int):
+        self.bucket_width = window / buckets
+        self.slots = [[-1, 0, 0] for _ in range(buckets)]
+
+    def record(self, success: bool, now: float):
+        index = int(now / self.bucket_width)
+        slot = self.slots[index % len(self.slots)]
+        if slot[0] != index:
+            slot[:] = [index, 0, 0]
+        slot[1 if success else 2] += 1
+
+    def counts(self, now: float):
+        oldest = int(now / self.bucket_width) - len(self.slots) + 1
+        successes = failures = 0
+        for index, slot_successes, slot_failures in self.slots:
+            if index >= oldest:
+                successes += slot_successes
+                failures += slot_failures
+        return successes, failures
+
+    def reset(self):
+        for slot in self.slots:
+            slot[:] = [-1, 0, 0]
 
 class CircuitBreaker:
-    def __init__(self):
-        self.failures = {}
-        self.last_failure_time = {}
+    def __init__(self, key: str, settings: dict):
+        self.key = key
+        self.settings = settings
+        self.window = SlidingWindow(settings["window"], settings["buckets"])
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.trials = 0  # appels d'essai en cours en half-open
+        self.trial_successes = 0
+        CIRCUIT_BREAKER_STATE.labels(upstream=key).set(STATE_VALUES[CLOSED])
+
+    def transition(self, state: str):
+        CIRCUIT_BREAKER_TRANSITIONS.labels(upstream=self.key, from_state=self.state, to_state=state).inc()
+        CIRCUIT_BREAKER_STATE.labels(upstream=self.key).set(STATE_VALUES[state])
+        log_structured("Circuit breaker transition", level="warning", service=self.key, from_state=self.state, to_state=state)
+        self.state = state
+        self.trials = 0
+        self.trial_successes = 0
+        if state == OPEN:
+            self.opened_at = time.monotonic()
+        elif state == CLOSED:
+            self.window.reset()
+
+    def allow(self) -> Optional[str]:
+        # Retourne l'état au moment de l'admission, ou None si l'appel est refusé
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.settings["recovery_timeout"]:
+                return None
+            self.transition(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self.trials + self.trial_successes >= self.settings["half_open_calls"]:
+                return None
+            self.trials += 1
+        return self.state
 
-    def is_open(self, key):
-        if key in self.failures and self.failures[key] >= CIRCUIT_BREAKER_FAILURE_THRESHOLD:
-            elapsed = time.time() - self.last_failure_time.get(key, 0)
-            return elapsed < CIRCUIT_BREAKER_RECOVERY_TIMEOUT
-        return False
+    def release(self, admitted: str):
+        if admitted == HALF_OPEN and self.state == HALF_OPEN:
+            self.trials -= 1
 
-    def record_failure(self, key):
-        self.failures[key] = self.failures.get(key, 0) + 1
-        self.last_failure_time[key] = time.time()
+    def record(self, admitted: str, success: bool):
+        if self.state == HALF_OPEN:
+            if admitted != HALF_OPEN:
+                return
+            self.trials -= 1
+            if not success:
+                self.transition(OPEN)
+                return
+            self.trial_successes += 1
+            if self.trial_successes >= self.settings["half_open_calls"]:
+                self.transition(CLOSED)
+        elif self.state == CLOSED:
+            now = time.monotonic()
+            self.window.record(success, now)
+            if success:
+                return
+            successes, failures = self.window.counts(now)
+            total = successes + failures
+            if total >= self.settings["min_calls"] and failures / total >= self.settings["failure_rate"]:
+                self.transition(OPEN)
 
-    def reset(self, key):
-        self.failures[key] = 0
+breakers = {}
 
-breaker = CircuitBreaker()
+def get_breaker(key: str) -> CircuitBreaker:
+    if key not in breakers:
+        breakers[key] = CircuitBreaker(key, UPSTREAMS.get(key, {}).get("breaker", DEFAULT_SETTINGS))
+    return breakers[key]
 
 def circuit_breaker(key):
     def decorator(func):
         @wraps(func)
         async def wrapper(*args, **kwargs):
-            if breaker.is_open(key):
+            breaker = get_breaker(key)
+            admitted = breaker.allow()
+            if admitted is None:
                 log_structured("Circuit breaker open", level="warning", service=key)
-                raise Exception(f"{key} temporarily unavailable")
+                raise CircuitOpenError(f"{key} temporarily unavailable")
 
             try:
                 response = await func(*args, **kwargs)
-                breaker.reset(key)
-                return response
+            except DeadlineExceeded:
+                breaker.release(admitted)
+                raise
             except Exception as e:
-                breaker.record_failure(key)
+                breaker.record(admitted, False)
                 log_structured("Request failed", level="error", error=str(e), service=key)
                 raise e
+            except BaseException:
+                # Annulation (client parti) : libère l'essai sans verdict
+                breaker.release(admitted)
+                raise
+            breaker.record(admitted, response.status_code not in FAILURE_STATUS_CODES)
+            return response
         return wrapper
     return decorator
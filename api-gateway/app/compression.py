@@ -0,0 +1,190 @@
+import time
+import zlib
+from typing import Optional
+from starlette.datastructures import Headers, MutableHeaders
+from config import COMPRESSION_ENABLED, COMPRESSION_MIN_SIZE, COMPRESSION_ENCODINGS
+from metrics import COMPRESSION_RATIO, COMPRESSION_CPU_SECONDS, COMPRESSION_BYTES
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+    "text/",
+)
+
+# Niveaux modérés pour la compression à la volée, plus élevés pour les copies en cache (compressées une seule fois)
+STREAM_LEVELS = {"gzip": 6, "br": 4, "zstd": 3}
+CACHED_LEVELS = {"gzip": 9, "br": 9, "zstd": 10}
+
+class GzipEncoder:
+    def __init__(self, level: int):
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        if final:
+            return self.compressor.compress(data) + self.compressor.flush(zlib.Z_FINISH)
+        # Z_SYNC_FLUSH : chaque chunk relayé est décodable immédiatement par le client
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH) if data else b""
+
+class BrotliEncoder:
+    def __init__(self, level: int):
+        self.compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        if final:
+            return self.compressor.process(data) + self.compressor.finish()
+        return self.compressor.process(data) + self.compressor.flush() if data else b""
+
+class ZstdEncoder:
+    def __init__(self, level: int):
+        self.compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        if final:
+            return self.compressor.compress(data) + self.compressor.flush()
+        return self.compressor.compress(data) + self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK) if data else b""
+
+AVAILABLE_ENCODERS = {"gzip": GzipEncoder}
+if brotli is not None:
+    AVAILABLE_ENCODERS["br"] = BrotliEncoder
+if zstandard is not None:
+    AVAILABLE_ENCODERS["zstd"] = ZstdEncoder
+
+# Ordre de préférence côté serveur, à qualité égale dans Accept-Encoding
+ENCODERS = {name: AVAILABLE_ENCODERS[name] for name in COMPRESSION_ENCODINGS if name in AVAILABLE_ENCODERS}
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    if not COMPRESSION_ENABLED or not accept_encoding:
+        return None
+    qualities = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[name.strip().lower()] = quality
+    wildcard = qualities.get("*", 0.0)
+    best, best_quality = None, 0.0
+    for name in ENCODERS:
+        quality = qualities.get(name, wildcard)
+        if quality > best_quality:
+            best, best_quality = name, quality
+    return best
+
+def is_compressible(headers: Headers) -> bool:
+    content_type = headers.get("content-type", "")
+    # SSE exclu : le codeur retiendrait les événements au lieu de les relayer un par un
+    return (
+        "content-encoding" not in headers
+        and content_type.startswith(COMPRESSIBLE_TYPES)
+        and not content_type.startswith("text/event-stream")
+    )
+
+def add_vary(headers: MutableHeaders):
+    # Réponse relayée telle quelle mais compressée pour d'autres clients ou d'autres tailles :
+    # les caches partagés doivent distinguer les variantes
+    if is_compressible(headers):
+        headers.add_vary_header("Accept-Encoding")
+
+def record(encoding: str, original: int, compressed: int, cpu_seconds: float):
+    COMPRESSION_CPU_SECONDS.labels(encoding=encoding).inc(cpu_seconds)
+    COMPRESSION_BYTES.labels(encoding=encoding, stage="in").inc(original)
+    COMPRESSION_BYTES.labels(encoding=encoding, stage="out").inc(compressed)
+    if original:
+        COMPRESSION_RATIO.labels(encoding=encoding).observe(compressed / original)
+
+def compress_cached(encoding: str, body: bytes) -> bytes:
+    start = time.thread_time()
+    compressed = ENCODERS[encoding](CACHED_LEVELS[encoding]).compress(body, final=True)
+    record(encoding, len(body), len(compressed), time.thread_time() - start)
+    return compressed
+
+def encoded_headers(headers: MutableHeaders, encoding: str):
+    headers["content-encoding"] = encoding
+    headers.add_vary_header("Accept-Encoding")
+    if "content-length" in headers:
+        del headers["content-length"]
+    # La représentation compressée n'est plus identique octet pour octet : ETag faible
+    etag = headers.get("etag")
+    if etag and not etag.startswith("W/"):
+        headers["etag"] = f"W/{etag}"
+
+class CompressionMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not COMPRESSION_ENABLED:
+            return await self.app(scope, receive, send)
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            async def send_with_vary(message):
+                if message["type"] == "http.response.start":
+                    add_vary(MutableHeaders(raw=message.setdefault("headers", [])))
+                await send(message)
+
+            return await self.app(scope, receive, send_with_vary)
+
+        start_message = None
+        encoder = None
+        passthrough = False
+        original = compressed = 0
+        cpu_seconds = 0.0
+
+        async def send_compressed(message):
+            nonlocal start_message, encoder, passthrough, original, compressed, cpu_seconds
+            if message["type"] == "http.response.start":
+                # Les en-têtes ne partent qu'avec le premier chunk, une fois la décision prise
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if encoder is None:
+                headers = MutableHeaders(raw=start_message.setdefault("headers", []))
+                length = headers.get("content-length")
+                size = int(length) if length else (None if more_body else len(body))
+                if (
+                    start_message["status"] in (204, 304)
+                    or not is_compressible(headers)
+                    or (size is not None and size < COMPRESSION_MIN_SIZE)
+                ):
+                    passthrough = True
+                    add_vary(headers)
+                    await send(start_message)
+                    await send(message)
+                    return
+                encoded_headers(headers, encoding)
+                encoder = ENCODERS[encoding](STREAM_LEVELS[encoding])
+                await send(start_message)
+
+            started = time.thread_time()
+            chunk = encoder.compress(body, final=not more_body)
+            cpu_seconds += time.thread_time() - started
+            original += len(body)
+            compressed += len(chunk)
+            if chunk or not more_body:
+                await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+            if not more_body:
+                record(encoding, original, compressed, cpu_seconds)
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,119 @@
+import time
+from functools import wraps
+from typing import Optional
+from fastapi.responses import JSONResponse
+from starlette.responses import StreamingResponse
+from config import (
+    LIMITER_ENABLED,
+    LIMITER_INITIAL_LIMIT,
+    LIMITER_MIN_LIMIT,
+    LIMITER_MAX_LIMIT,
+    LIMITER_LATENCY_TOLERANCE,
+    LIMITER_BACKOFF_RATIO,
+    LIMITER_RTT_WINDOW,
+    LIMITER_PRIORITY_RESERVE,
+    LIMITER_PRIORITY_METHODS,
+    LIMITER_RETRY_AFTER,
+)
+from circuit_breakers import FAILURE_STATUS_CODES, CircuitOpenError
+from deadline import DeadlineExceeded
+from metrics import CONCURRENCY_LIMIT, CONCURRENCY_IN_FLIGHT, SHED_REQUESTS
+from proxy import after_body
+
+class AdaptiveLimiter:
+    # AIMD piloté par la latence : +1 par "fenêtre" de requêtes rapides, x BACKOFF quand la latence
+    # dépasse TOLERANCE x la latence minimale récente ou que l'upstream échoue
+    def __init__(self, key: str):
+        self.key = key
+        self.limit = float(LIMITER_INITIAL_LIMIT)
+        self.in_flight = 0
+        self.min_rtt = None
+        self.min_rtt_reset_at = time.monotonic() + LIMITER_RTT_WINDOW
+        self.last_decrease = 0.0
+        self.limit_gauge = CONCURRENCY_LIMIT.labels(upstream=key)
+        self.in_flight_gauge = CONCURRENCY_IN_FLIGHT.labels(upstream=key)
+        self.limit_gauge.set(self.limit)
+
+    def try_acquire(self, priority: bool) -> bool:
+        # Les lectures laissent une réserve de capacité aux écritures du même upstream
+        capacity = self.limit if priority else self.limit * (1 - LIMITER_PRIORITY_RESERVE)
+        if self.in_flight >= max(1, int(capacity)):
+            return False
+        self.in_flight += 1
+        self.in_flight_gauge.inc()
+        return True
+
+    def release(self, rtt: float, success: Optional[bool]):
+        self.in_flight -= 1
+        self.in_flight_gauge.dec()
+        if success is None:
+            return  # appel annulé côté client : aucune information sur l'upstream
+        now = time.monotonic()
+        if now >= self.min_rtt_reset_at:
+            # Oublie périodiquement la latence minimale pour suivre les changements de l'upstream
+            self.min_rtt = None
+            self.min_rtt_reset_at = now + LIMITER_RTT_WINDOW
+        if success and (self.min_rtt is None or rtt < self.min_rtt):
+            self.min_rtt = rtt
+
+        if success and rtt <= self.min_rtt * LIMITER_LATENCY_TOLERANCE:
+            self.limit = min(LIMITER_MAX_LIMIT, self.limit + 1 / self.limit)
+        elif now - self.last_decrease >= (self.min_rtt or 0):
+            # Une seule réduction par RTT pour un même épisode de congestion
+            self.limit = max(LIMITER_MIN_LIMIT, self.limit * LIMITER_BACKOFF_RATIO)
+            self.last_decrease = now
+        self.limit_gauge.set(self.limit)
+
+limiters = {}
+
+def get_limiter(key: str) -> AdaptiveLimiter:
+    if key not in limiters:
+        limiters[key] = AdaptiveLimiter(key)
+    return limiters[key]
+
+def overloaded(key: str) -> JSONResponse:
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"{key} overloaded, retry later"},
+        headers={"Retry-After": str(LIMITER_RETRY_AFTER)},
+    )
+
+def concurrency_limit(key):
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(path: str, request):
+            if not LIMITER_ENABLED:
+                return await func(path, request)
+
+            limiter = get_limiter(key)
+            priority = request.method in LIMITER_PRIORITY_METHODS
+            if not limiter.try_acquire(priority):
+                lane = "priority" if priority else "default"
+                SHED_REQUESTS.labels(upstream=key, lane=lane).inc()
+                return overloaded(key)
+
+            start = time.perf_counter()
+            try:
+                response = await func(path, request)
+            except (DeadlineExceeded, CircuitOpenError):
+                # Rejet local, sans aller-retour vers l'upstream : rien à apprendre sur sa latence
+                limiter.release(time.perf_counter() - start, None)
+                raise
+            except Exception:
+                limiter.release(time.perf_counter() - start, False)
+                raise
+            except BaseException:
+                limiter.release(time.perf_counter() - start, None)
+                raise
+            # Latence mesurée aux en-têtes, mais la place n'est rendue qu'à la fin du corps streamé
+            rtt = time.perf_counter() - start
+            success = response.status_code not in FAILURE_STATUS_CODES
+            if not isinstance(response, StreamingResponse):
+                limiter.release(rtt, success)
+                return response
+
+            async def release():
+                limiter.release(rtt, success)
+            return after_body(response, release)
+        return wrapper
+    return decorator
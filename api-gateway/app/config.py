@@ -1,9 +1,4 @@
 import os
-import logging
-import json
-from datetime import datetime
-from contextlib import asynccontextmanager
-from fastapi import FastAPI
 from http_client import http_client  # Ton client httpx centralisé
 
 # =========================
@@ -16,46 +11,176 @@ AI_SERVICE_URL = os.getenv("AI_SERVICE_URL", "http://ai-service:8000")
 REPORT_SERVICE_URL = os.getenv("REPORT_SERVICE_URL", "http://report-service:8000")
 ENVIRONMENT = os.getenv("ENVIRONMENT", "development")
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# Taux d'échantillonnage par niveau des logs à fort volume : "INFO=0.1,DEBUG=0"
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
 ALLOWED_HOSTS = os.getenv("ALLOWED_HOSTS", "*").split(",")
 CORS_ORIGINS = os.getenv("CORS_ORIGINS", "*").split(",")
 REQUEST_TIMEOUT = int(os.getenv("REQUEST_TIMEOUT", "30"))
+# En dessous, un X-Deadline-Ms client est refusé (504) sans solliciter l'upstream
+DEADLINE_MIN_BUDGET = float(os.getenv("DEADLINE_MIN_BUDGET", "0.05"))  # secondes
 CIRCUIT_BREAKER_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_BREAKER_FAILURE_THRESHOLD", "5"))
 CIRCUIT_BREAKER_RECOVERY_TIMEOUT = int(os.getenv("CIRCUIT_BREAKER_RECOVERY_TIMEOUT", "60"))
+CIRCUIT_BREAKER_FAILURE_RATE = float(os.getenv("CIRCUIT_BREAKER_FAILURE_RATE", "0.5"))
+CIRCUIT_BREAKER_WINDOW = float(os.getenv("CIRCUIT_BREAKER_WINDOW", "30"))
+CIRCUIT_BREAKER_BUCKETS = int(os.getenv("CIRCUIT_BREAKER_BUCKETS", "10"))
+CIRCUIT_BREAKER_HALF_OPEN_CALLS = int(os.getenv("CIRCUIT_BREAKER_HALF_OPEN_CALLS", "3"))
+PROXY_STREAMING = os.getenv("PROXY_STREAMING", "true").lower() == "true"
+PROXY_CHUNK_SIZE = int(os.getenv("PROXY_CHUNK_SIZE", "65536"))
+POOL_MAX_CONNECTIONS = int(os.getenv("POOL_MAX_CONNECTIONS", "100"))
+POOL_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("POOL_MAX_KEEPALIVE_CONNECTIONS", "20"))
+POOL_KEEPALIVE_EXPIRY = float(os.getenv("POOL_KEEPALIVE_EXPIRY", "30"))
+POOL_CONNECT_TIMEOUT = float(os.getenv("POOL_CONNECT_TIMEOUT", "5"))
+POOL_WARMUP_CONNECTIONS = int(os.getenv("POOL_WARMUP_CONNECTIONS", "2"))
+LB_STRATEGY = os.getenv("LB_STRATEGY", "p2c")  # p2c | least_outstanding
+LB_EJECTION_THRESHOLD = int(os.getenv("LB_EJECTION_THRESHOLD", "5"))
+LB_EJECTION_TIME = float(os.getenv("LB_EJECTION_TIME", "30"))
+LB_DNS_REFRESH_INTERVAL = float(os.getenv("LB_DNS_REFRESH_INTERVAL", "30"))
+# Préfixes dont les GET sont doublés vers un autre réplica s'ils dépassent le percentile de latence récent
+HEDGE_ROUTES = [prefix for prefix in os.getenv("HEDGE_ROUTES", "").split(",") if prefix]
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0.95"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.01"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "50"))
+HEDGE_BUDGET_RATIO = float(os.getenv("HEDGE_BUDGET_RATIO", "0.1"))  # hedges max par requête éligible
+LIMITER_ENABLED = os.getenv("LIMITER_ENABLED", "true").lower() == "true"
+LIMITER_INITIAL_LIMIT = int(os.getenv("LIMITER_INITIAL_LIMIT", "20"))
+LIMITER_MIN_LIMIT = int(os.getenv("LIMITER_MIN_LIMIT", "5"))
+LIMITER_MAX_LIMIT = int(os.getenv("LIMITER_MAX_LIMIT", "200"))
+LIMITER_LATENCY_TOLERANCE = float(os.getenv("LIMITER_LATENCY_TOLERANCE", "2.0"))  # x latence minimale observée
+LIMITER_BACKOFF_RATIO = float(os.getenv("LIMITER_BACKOFF_RATIO", "0.9"))
+LIMITER_RTT_WINDOW = float(os.getenv("LIMITER_RTT_WINDOW", "30"))
+# Part de la limite de chaque upstream réservée aux écritures : sous surcharge les lectures, rejouables
+# et souvent servies depuis le cache (stale-if-error), sont délestées en premier
+LIMITER_PRIORITY_RESERVE = float(os.getenv("LIMITER_PRIORITY_RESERVE", "0.2"))
+LIMITER_PRIORITY_METHODS = frozenset(
+    method.strip().upper() for method in os.getenv("LIMITER_PRIORITY_METHODS", "POST,PUT,PATCH,DELETE").split(",") if method.strip()
+)
+LIMITER_RETRY_AFTER = int(os.getenv("LIMITER_RETRY_AFTER", "1"))
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+# Règles "préfixe=requêtes/secondes:clé" (clé : ip, sub ou route) ; la règle au préfixe le plus long s'applique
+def parse_rate_limit_rules(spec: str) -> list:
+    rules = []
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        prefix, _, rate = item.strip().partition("=")
+        rate, _, key = rate.partition(":")
+        limit, _, window = rate.partition("/")
+        rules.append({"prefix": prefix, "limit": int(limit), "window": float(window or 1), "key": key or "ip"})
+    return sorted(rules, key=lambda rule: len(rule["prefix"]), reverse=True)
 
+RATE_LIMIT_RULES = parse_rate_limit_rules(
+    os.getenv("RATE_LIMIT_RULES", "/auth/login=5/60:ip,/auth/=20/1:ip,/api/v1/=50/1:sub")
+)
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "")  # vide : limitation locale à chaque instance
+RATE_LIMIT_BATCH_SIZE = int(os.getenv("RATE_LIMIT_BATCH_SIZE", "10"))  # jetons pré-débités par appel Redis
+RATE_LIMIT_LEASE_TTL = float(os.getenv("RATE_LIMIT_LEASE_TTL", "1"))
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+RATE_LIMIT_TRUST_FORWARDED_FOR = os.getenv("RATE_LIMIT_TRUST_FORWARDED_FOR", "false").lower() == "true"
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", "20"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "6"))  # sous-requêtes simultanées par batch
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() == "true"
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))  # octets
+# Encodages proposés, par ordre de préférence (br et zstd seulement si brotli / zstandard sont installés)
+COMPRESSION_ENCODINGS = [name.strip() for name in os.getenv("COMPRESSION_ENCODINGS", "zstd,br,gzip").split(",") if name.strip()]
+IDEMPOTENCY_ENABLED = os.getenv("IDEMPOTENCY_ENABLED", "true").lower() == "true"
+IDEMPOTENCY_METHODS = [method.strip().upper() for method in os.getenv("IDEMPOTENCY_METHODS", "POST").split(",") if method.strip()]
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", "86400"))  # durée de conservation des réponses (s)
+IDEMPOTENCY_MAX_BYTES = int(os.getenv("IDEMPOTENCY_MAX_BYTES", str(16 * 1024 * 1024)))  # store mémoire
+IDEMPOTENCY_MAX_BODY_BYTES = int(os.getenv("IDEMPOTENCY_MAX_BODY_BYTES", str(1024 * 1024)))  # réponses plus grosses non conservées
+IDEMPOTENCY_REDIS_URL = os.getenv("IDEMPOTENCY_REDIS_URL", "")  # vide : store local à chaque instance
+IDEMPOTENCY_LOCK_TTL = float(os.getenv("IDEMPOTENCY_LOCK_TTL", "60"))  # marqueur "en cours" dans Redis
+IDEMPOTENCY_WAIT_TIMEOUT = float(os.getenv("IDEMPOTENCY_WAIT_TIMEOUT", str(REQUEST_TIMEOUT)))
+# Trafic miroir : échantillon des requêtes rejoué vers <PREFIX>_SHADOW_URL, sans effet sur la réponse au client
+SHADOW_SAMPLE_RATE = float(os.getenv("SHADOW_SAMPLE_RATE", "0.05"))  # part des requêtes éligibles, surchargeable par upstream
+SHADOW_METHODS = [method.strip().upper() for method in os.getenv("SHADOW_METHODS", "GET,HEAD").split(",") if method.strip()]
+SHADOW_MAX_CONNECTIONS = int(os.getenv("SHADOW_MAX_CONNECTIONS", "10"))  # pool dédié, partagé par tous les shadows
+SHADOW_MAX_CONCURRENCY = int(os.getenv("SHADOW_MAX_CONCURRENCY", "20"))  # au-delà, les requêtes ne sont pas dupliquées
+SHADOW_TIMEOUT = float(os.getenv("SHADOW_TIMEOUT", "10"))
+SHADOW_MAX_BODY_BYTES = int(os.getenv("SHADOW_MAX_BODY_BYTES", str(64 * 1024)))  # corps plus gros : pas de miroir
+# Flux longs (WebSocket, SSE) : fermés après STREAM_IDLE_TIMEOUT secondes sans message, plafonnés par upstream
+STREAM_IDLE_TIMEOUT = float(os.getenv("STREAM_IDLE_TIMEOUT", "60"))
+STREAM_MAX_CONNECTIONS = int(os.getenv("STREAM_MAX_CONNECTIONS", "100"))
+STREAM_MAX_MESSAGE_SIZE = int(os.getenv("STREAM_MAX_MESSAGE_SIZE", str(1024 * 1024)))  # octets, par message WebSocket
+# Table de routage : fichier JSON {"upstreams": {...}, "routes": [...]}, relu à chaud quand il change ;
+# vide : DEFAULT_ROUTES vers les upstreams de UPSTREAMS
+ROUTES_FILE = os.getenv("ROUTES_FILE", "")
+ROUTES_RELOAD_INTERVAL = float(os.getenv("ROUTES_RELOAD_INTERVAL", "5"))
+# /admin/stats : vue instantanée de la gateway, protégée par Authorization: Bearer <ADMIN_TOKEN> (vide : désactivée)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+ADMIN_RECENT_REQUESTS = int(os.getenv("ADMIN_RECENT_REQUESTS", "1024"))  # ring buffer des requêtes terminées
+ADMIN_SLOWEST_REQUESTS = int(os.getenv("ADMIN_SLOWEST_REQUESTS", "20"))  # plus lentes renvoyées parmi celles-ci
+LOOP_MONITOR_INTERVAL = float(os.getenv("LOOP_MONITOR_INTERVAL", "0.5"))  # période de mesure du retard de la boucle
+LOOP_SLOW_CALLBACK_THRESHOLD = float(os.getenv("LOOP_SLOW_CALLBACK_THRESHOLD", "0.1"))  # blocage journalisé avec sa pile (s)
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", "10"))
+HEALTH_CHECK_TIMEOUT = float(os.getenv("HEALTH_CHECK_TIMEOUT", "2"))
+JWT_SECRET = os.getenv("JWT_SECRET", "changeme")
+JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
+JWT_PROTECTED_PATHS = os.getenv("JWT_PROTECTED_PATHS", "/api/v1/,/auth/verify").split(",")
+JWT_CACHE_SIZE = int(os.getenv("JWT_CACHE_SIZE", "10000"))
+JWT_CACHE_TTL = int(os.getenv("JWT_CACHE_TTL", "300"))  # tokens sans claim exp
+INTERNAL_AUTH_TOKEN = os.getenv("INTERNAL_AUTH_TOKEN", "")
+# Préfixes dont les GET identiques concurrents partagent un seul appel upstream (réponse bufferisée)
+SINGLE_FLIGHT_ROUTES = [prefix for prefix in os.getenv("SINGLE_FLIGHT_ROUTES", "").split(",") if prefix]
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "30"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Routes mises en cache (opt-in) : "/api/v1/maps/=60,/api/v1/reports/" (TTL par défaut si omis)
+RESPONSE_CACHE_ROUTES = {
+    prefix: int(ttl) if ttl else RESPONSE_CACHE_TTL
+    for prefix, _, ttl in (
+        item.strip().partition("=") for item in os.getenv("RESPONSE_CACHE_ROUTES", "").split(",") if item.strip()
+    )
+}
+# Au-delà du TTL : copie servie "STALE" pendant sa revalidation en arrière-plan, puis en secours si l'upstream échoue
+RESPONSE_CACHE_STALE_WHILE_REVALIDATE = int(os.getenv("RESPONSE_CACHE_STALE_WHILE_REVALIDATE", "10"))
+RESPONSE_CACHE_STALE_IF_ERROR = int(os.getenv("RESPONSE_CACHE_STALE_IF_ERROR", "300"))
 
-http_client.timeout = REQUEST_TIMEOUT
 
-# =========================
-# 📝 LOGGING CONFIG
-# =========================
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=getattr(logging, LOG_LEVEL.upper())
-)
-logger = logging.getLogger(__name__)
-
-def log_structured(message: str, **kwargs):
-    log_data = {
-        "timestamp": datetime.utcnow().isoformat(),
-        "environment": ENVIRONMENT,
-        "service": "api-gateway",
-        "message": message,
-        **kwargs
+# Chaque upstream a son propre pool, surchargeable via <PREFIX>_MAX_CONNECTIONS, etc.
+# <PREFIX>_URL accepte plusieurs réplicas séparés par des virgules ; avec <PREFIX>_DNS_DISCOVERY=true
+# chaque URL est résolue périodiquement et toutes ses adresses deviennent des réplicas.
+def upstream_config(prefix: str, url: str) -> dict:
+    return {
+        "urls": [item.strip() for item in url.split(",") if item.strip()],
+        "dns_discovery": os.getenv(f"{prefix}_DNS_DISCOVERY", "false").lower() == "true",
+        "max_connections": int(os.getenv(f"{prefix}_MAX_CONNECTIONS", POOL_MAX_CONNECTIONS)),
+        "max_keepalive_connections": int(os.getenv(f"{prefix}_MAX_KEEPALIVE_CONNECTIONS", POOL_MAX_KEEPALIVE_CONNECTIONS)),
+        "keepalive_expiry": float(os.getenv(f"{prefix}_KEEPALIVE_EXPIRY", POOL_KEEPALIVE_EXPIRY)),
+        "connect_timeout": float(os.getenv(f"{prefix}_CONNECT_TIMEOUT", POOL_CONNECT_TIMEOUT)),
+        "read_timeout": float(os.getenv(f"{prefix}_READ_TIMEOUT", REQUEST_TIMEOUT)),
+        "stream_max_connections": int(os.getenv(f"{prefix}_STREAM_MAX_CONNECTIONS", STREAM_MAX_CONNECTIONS)),
+        "stream_idle_timeout": float(os.getenv(f"{prefix}_STREAM_IDLE_TIMEOUT", STREAM_IDLE_TIMEOUT)),
+        "shadow_url": os.getenv(f"{prefix}_SHADOW_URL", "").rstrip("/"),
+        "shadow_sample_rate": float(os.getenv(f"{prefix}_SHADOW_SAMPLE_RATE", SHADOW_SAMPLE_RATE)),
+        "breaker": {
+            # Nombre minimal d'appels dans la fenêtre avant d'évaluer le taux d'échec
+            "min_calls": int(os.getenv(f"{prefix}_CB_MIN_CALLS", CIRCUIT_BREAKER_FAILURE_THRESHOLD)),
+            "failure_rate": float(os.getenv(f"{prefix}_CB_FAILURE_RATE", CIRCUIT_BREAKER_FAILURE_RATE)),
+            "window": float(os.getenv(f"{prefix}_CB_WINDOW", CIRCUIT_BREAKER_WINDOW)),
+            "buckets": int(os.getenv(f"{prefix}_CB_BUCKETS", CIRCUIT_BREAKER_BUCKETS)),
+            "recovery_timeout": float(os.getenv(f"{prefix}_CB_RECOVERY_TIMEOUT", CIRCUIT_BREAKER_RECOVERY_TIMEOUT)),
+            "half_open_calls": int(os.getenv(f"{prefix}_CB_HALF_OPEN_CALLS", CIRCUIT_BREAKER_HALF_OPEN_CALLS)),
+        },
     }
-    logger.info(json.dumps(log_data))
 
-# =========================
-# 🔁 LIFESPAN HANDLER
-# =========================
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    # Startup: initialise le client HTTP
-    await http_client.start()
-    
-    # Tu peux aussi ajouter un health check ici si tu veux
-    # ex: await check_services_health() si tu veux pré-vérifier
-
-    yield  # Place où l’app tourne (entre startup et shutdown)
-    
-    # Shutdown: ferme le client HTTP
-    await http_client.stop()
+
+UPSTREAMS = {
+    "auth_service": upstream_config("AUTH_SERVICE", AUTH_SERVICE_URL),
+    "user_service": upstream_config("USER_SERVICE", USER_SERVICE_URL),
+    "map_service": upstream_config("MAP_SERVICE", MAP_SERVICE_URL),
+    "ai_service": upstream_config("AI_SERVICE", AI_SERVICE_URL),
+    "report_service": upstream_config("REPORT_SERVICE", REPORT_SERVICE_URL),
+}
+
+# Préfixe public -> upstream ; le préfixe est retiré du chemin relayé. Politiques optionnelles par route :
+# methods, timeout (s), cache_ttl (s), auth (true/false, sinon JWT_PROTECTED_PATHS), upstream_prefix
+DEFAULT_ROUTES = [
+    {"prefix": "/auth", "upstream": "auth_service"},
+    {"prefix": "/api/v1/users", "upstream": "user_service"},
+    {"prefix": "/api/v1/maps", "upstream": "map_service"},
+    {"prefix": "/api/v1/ais", "upstream": "ai_service"},
+    {"prefix": "/api/v1/reports", "upstream": "report_service"},
+]
+
+
+http_client.timeout = REQUEST_TIMEOUT
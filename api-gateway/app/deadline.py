@@ -0,0 +1,57 @@
+import time
+from functools import wraps
+from typing import Optional
+import httpx
+from config import UPSTREAMS, DEADLINE_MIN_BUDGET
+
+# Budget restant en millisecondes (relatif : insensible au décalage d'horloge entre conteneurs)
+DEADLINE_HEADER = "x-deadline-ms"
+
+class DeadlineExceeded(httpx.TimeoutException):
+    # Budget épuisé côté gateway ou raccourci par le client : jamais compté comme un échec de l'upstream
+    # (breaker, limiteur, éjection de réplica), sans quoi n'importe quel client pourrait ouvrir le circuit
+    pass
+
+def parse_budget(value: Optional[str]) -> Optional[float]:
+    try:
+        budget = int(value) / 1000
+    except (TypeError, ValueError):
+        return None
+    return budget if budget >= 0 else None
+
+def start_deadline(request, route):
+    # Budget de la route (timeout, sinon read timeout de l'upstream), posé dès l'arrivée :
+    # l'attente dans le limiteur ou le coalescing est décomptée. Un X-Deadline-Ms client ne peut que le réduire.
+    budget = route.timeout or UPSTREAMS[route.upstream]["read_timeout"]
+    inbound = parse_budget(request.headers.get(DEADLINE_HEADER))
+    request.state.client_deadline = inbound is not None and inbound < budget
+    if inbound is not None:
+        if inbound < DEADLINE_MIN_BUDGET:
+            raise DeadlineExceeded("deadline too short to reach the upstream")
+        budget = min(budget, inbound)
+    request.state.deadline = time.monotonic() + budget
+
+def client_deadline(request) -> bool:
+    return getattr(request.state, "client_deadline", False)
+
+def within_deadline(func):
+    # Placé avant limiteur et breaker : un budget déjà épuisé (coalescing, attente d'idempotence) donne un 504
+    # sans occuper de place ni laisser de verdict
+    @wraps(func)
+    async def wrapper(path: str, request):
+        deadline = getattr(request.state, "deadline", None)
+        if deadline is not None and deadline <= time.monotonic():
+            raise DeadlineExceeded("deadline exceeded before reaching the upstream")
+        return await func(path, request)
+    return wrapper
+
+def propagate_deadline(request, headers: dict):
+    # Timeout httpx de la tentative = temps restant, transmis aussi à l'upstream pour qu'il abandonne en même temps
+    deadline = getattr(request.state, "deadline", None)
+    if deadline is None:
+        return httpx.USE_CLIENT_DEFAULT
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceeded("deadline exceeded before reaching the upstream")
+    headers[DEADLINE_HEADER] = str(max(1, int(remaining * 1000)))
+    return httpx.Timeout(remaining)
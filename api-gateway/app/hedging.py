@@ -0,0 +1,108 @@
+import asyncio
+from collections import defaultdict, deque
+from typing import Optional
+from config import (
+    UPSTREAMS,
+    HEDGE_ROUTES,
+    HEDGE_PERCENTILE,
+    HEDGE_MIN_DELAY,
+    HEDGE_MIN_SAMPLES,
+    HEDGE_BUDGET_RATIO,
+)
+from metrics import HEDGED_REQUESTS, HEDGE_BUDGET_EXHAUSTED
+
+class LatencyTracker:
+    def __init__(self, size: int = 1000, refresh_every: int = 100):
+        self.samples = deque(maxlen=size)
+        self.refresh_every = refresh_every
+        self.recorded = 0
+        self.threshold: Optional[float] = None
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+        self.recorded += 1
+        # Le percentile n'est recalculé que périodiquement pour ne pas trier à chaque requête
+        if self.recorded % self.refresh_every == 0 or (self.threshold is None and len(self.samples) >= HEDGE_MIN_SAMPLES):
+            ordered = sorted(self.samples)
+            self.threshold = ordered[min(len(ordered) - 1, int(len(ordered) * HEDGE_PERCENTILE))]
+
+class HedgeBudget:
+    # Chaque requête éligible crédite HEDGE_BUDGET_RATIO jeton, chaque hedge en consomme un
+    def __init__(self, ratio: float = HEDGE_BUDGET_RATIO, max_tokens: float = 10.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = 0.0
+
+    def deposit(self):
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+# defaultdict : un upstream ajouté par rechargement de la table de routage obtient ses compteurs
+latencies = defaultdict(LatencyTracker, {name: LatencyTracker() for name in UPSTREAMS})
+budgets = defaultdict(HedgeBudget, {name: HedgeBudget() for name in UPSTREAMS})
+
+def hedge_eligible(request) -> bool:
+    # Seules les lectures idempotentes sur les routes configurées peuvent être dupliquées
+    return request.method == "GET" and any(request.url.path.startswith(prefix) for prefix in HEDGE_ROUTES)
+
+def hedge_delay(service: str, balancer, request) -> Optional[float]:
+    if not hedge_eligible(request):
+        return None
+    # Un seul réplica : la copie irait au réplica déjà lent et doublerait sa charge
+    if len(balancer.endpoints) < 2:
+        return None
+    threshold = latencies[service].threshold
+    if threshold is None:
+        return None
+    budgets[service].deposit()
+    return max(threshold, HEDGE_MIN_DELAY)
+
+async def discard(task: asyncio.Task, endpoint, balancer):
+    # Tentative perdante : annulée, ou fermée si elle a répondu entre-temps
+    task.cancel()
+    try:
+        upstream = await task
+    except BaseException:
+        return
+    await upstream.aclose()
+    balancer.release(endpoint, None)
+
+async def send_hedged(service: str, balancer, attempt, delay: float):
+    endpoint = balancer.acquire()
+    tasks = {asyncio.ensure_future(attempt(endpoint)): endpoint}
+    winner = None
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        # Réplicas réduits à un seul pendant l'attente (résolution DNS) : pas de copie
+        if not done and len(balancer.endpoints) > 1:
+            if budgets[service].withdraw():
+                hedge_endpoint = balancer.acquire(exclude=endpoint)
+                tasks[asyncio.ensure_future(attempt(hedge_endpoint))] = hedge_endpoint
+            else:
+                HEDGE_BUDGET_EXHAUSTED.labels(upstream=service).inc()
+
+        pending, error = set(tasks), None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    winner = task
+                    break
+                error = task.exception()
+            if winner is not None:
+                break
+        if winner is None:
+            raise error
+
+        if len(tasks) > 1:
+            HEDGED_REQUESTS.labels(upstream=service, winner="primary" if tasks[winner] is endpoint else "hedge").inc()
+        return tasks[winner], winner.result()
+    finally:
+        for task, task_endpoint in tasks.items():
+            if task is not winner:
+                asyncio.ensure_future(discard(task, task_endpoint, balancer))
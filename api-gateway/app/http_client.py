@@ -1,22 +1,98 @@
+import asyncio
 import httpx
-from typing import Optional
+from typing import Dict, Optional
+from metrics import UPSTREAM_POOL_CONNECTIONS, UPSTREAM_POOL_MAX_CONNECTIONS
 
 class HttpClient:
     def __init__(self, timeout: int = 30):  # valeur par défaut, pas d'import
         self.timeout = timeout
         self.client: Optional[httpx.AsyncClient] = None
+        self.pools: Dict[str, httpx.AsyncClient] = {}
+        self.transports: Dict[str, httpx.AsyncHTTPTransport] = {}
+        self.stats_task: Optional[asyncio.Task] = None
+        self.stream_client: Optional[httpx.AsyncClient] = None
 
-    async def start(self):
+    async def start(self, upstreams: Optional[dict] = None):
         self.client = httpx.AsyncClient(timeout=self.timeout)
+        # Flux SSE sur un client séparé : ils occuperaient durablement les connexions des pools upstream.
+        # Le nombre de flux est borné par upstream dans streaming.py
+        self.stream_client = httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=0),
+        )
+        for name, settings in (upstreams or {}).items():
+            self.add_pool(name, settings)
+        self.stats_task = asyncio.create_task(self.export_pool_stats_forever())
+
+    def add_pool(self, name: str, settings: dict):
+        # Aussi appelé au rechargement de la table de routage pour un upstream nouvellement déclaré
+        limits = httpx.Limits(
+            max_connections=settings["max_connections"],
+            max_keepalive_connections=settings["max_keepalive_connections"],
+            keepalive_expiry=settings["keepalive_expiry"],
+        )
+        timeout = httpx.Timeout(
+            self.timeout,
+            connect=settings["connect_timeout"],
+            read=settings["read_timeout"],
+        )
+        self.transports[name] = httpx.AsyncHTTPTransport(limits=limits)
+        self.pools[name] = httpx.AsyncClient(timeout=timeout, transport=self.transports[name])
+        UPSTREAM_POOL_MAX_CONNECTIONS.labels(upstream=name).set(settings["max_connections"])
+
+    async def export_pool_stats_forever(self, interval: float = 5.0):
+        # Échantillonnage périodique plutôt que set_function : en multi-workers seules les valeurs
+        # écrites dans PROMETHEUS_MULTIPROC_DIR sont visibles du worker qui répond à /metrics
+        while True:
+            for name in list(self.pools):
+                for state, count in self.pool_stats(name).items():
+                    UPSTREAM_POOL_CONNECTIONS.labels(upstream=name, state=state).set(count)
+            await asyncio.sleep(interval)
 
     async def stop(self):
+        if self.stats_task:
+            self.stats_task.cancel()
+            try:
+                await self.stats_task
+            except asyncio.CancelledError:
+                pass
+        for pool in self.pools.values():
+            await pool.aclose()
+        self.pools.clear()
+        self.transports.clear()
+        if self.stream_client:
+            await self.stream_client.aclose()
         if self.client:
             await self.client.aclose()
 
-    async def request(self, method: str, url: str, **kwargs):
+    def get_client(self, upstream: Optional[str] = None) -> httpx.AsyncClient:
         if not self.client:
             raise RuntimeError("HTTP client not initialized.")
-        return await self.client.request(method, url, **kwargs)
+        return self.pools.get(upstream, self.client)
+
+    def pool_stats(self, upstream: str) -> dict:
+        # httpx n'expose pas l'état du pool : attributs privés d'httpcore, stats vides s'ils changent
+        pool = getattr(self.transports.get(upstream), "_pool", None)
+        connections = getattr(pool, "connections", None) or []
+        idle = sum(1 for connection in connections if connection.is_idle())
+        return {"active": len(connections) - idle, "idle": idle}
+
+    async def warm_up(self, upstream: str, url: str, connections: int) -> int:
+        # Des requêtes concurrentes forcent l'ouverture de connexions distinctes, gardées ensuite en keep-alive
+        client = self.get_client(upstream)
+        results = await asyncio.gather(
+            *(client.get(url) for _ in range(connections)), return_exceptions=True
+        )
+        return sum(1 for result in results if not isinstance(result, Exception))
+
+    async def request(self, method: str, url: str, upstream: Optional[str] = None, **kwargs):
+        return await self.get_client(upstream).request(method, url, **kwargs)
+
+    async def stream(self, method: str, url: str, upstream: Optional[str] = None, **kwargs) -> httpx.Response:
+        # Envoie la requête sans lire le corps : l'appelant doit consommer puis fermer la réponse
+        client = self.get_client(upstream)
+        request = client.build_request(method, url, **kwargs)
+        return await client.send(request, stream=True)
 
 # Initialise sans config pour éviter l'import croisé
 http_client = HttpClient()
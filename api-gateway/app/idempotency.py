@@ -0,0 +1,244 @@
+import asyncio
+import base64
+import hashlib
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Optional
+import orjson
+from fastapi.responses import JSONResponse
+from starlette.responses import Response
+from config import (
+    IDEMPOTENCY_ENABLED,
+    IDEMPOTENCY_METHODS,
+    IDEMPOTENCY_TTL,
+    IDEMPOTENCY_MAX_BYTES,
+    IDEMPOTENCY_MAX_BODY_BYTES,
+    IDEMPOTENCY_REDIS_URL,
+    IDEMPOTENCY_LOCK_TTL,
+    IDEMPOTENCY_WAIT_TIMEOUT,
+)
+from logging_config import log_structured
+from metrics import IDEMPOTENCY_REQUESTS, IDEMPOTENCY_STORE_BYTES
+from proxy import buffer_response
+
+OWNER, REPLAY, CONFLICT = "owner", "replay", "conflict"
+IN_FLIGHT = b"in-flight"
+POLL_INTERVAL = 0.05
+MAX_KEY_LENGTH = 255
+
+# Réponses non conservées : la requête n'a pas abouti (ou pas été exécutée) et doit pouvoir être rejouée
+UNSTORED_STATUS_CODES = frozenset({408, 409, 425, 429})
+
+class StoredResponse:
+    def __init__(self, fingerprint: str, status_code: int, headers: list, body: bytes):
+        self.fingerprint = fingerprint
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+        self.expires_at = time.monotonic() + IDEMPOTENCY_TTL
+        self.size = len(body) + sum(len(key) + len(value) for key, value in headers)
+
+    def dumps(self) -> bytes:
+        return orjson.dumps({
+            "fingerprint": self.fingerprint,
+            "status_code": self.status_code,
+            "headers": [[key.decode("latin-1"), value.decode("latin-1")] for key, value in self.headers],
+            "body": base64.b64encode(self.body).decode("ascii"),
+        })
+
+    @classmethod
+    def loads(cls, raw: bytes) -> "StoredResponse":
+        data = orjson.loads(raw)
+        headers = [(key.encode("latin-1"), value.encode("latin-1")) for key, value in data["headers"]]
+        return cls(data["fingerprint"], data["status_code"], headers, base64.b64decode(data["body"]))
+
+class IdempotencyStore:
+    def __init__(self, max_bytes: int = IDEMPOTENCY_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+        # Requêtes originales en cours dans ce processus : les retries concurrents attendent leur fin
+        self.in_flight = {}
+        self.redis = None
+        self.backend_available = True
+
+    async def start(self):
+        if IDEMPOTENCY_REDIS_URL:
+            import redis.asyncio as redis
+            self.redis = redis.from_url(IDEMPOTENCY_REDIS_URL, socket_timeout=0.5, socket_connect_timeout=0.5)
+
+    async def stop(self):
+        if self.redis is not None:
+            await self.redis.aclose()
+
+    def get_local(self, key: str) -> Optional[StoredResponse]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.monotonic():
+            self.remove_local(key)
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def set_local(self, key: str, entry: StoredResponse):
+        self.remove_local(key)
+        self.entries[key] = entry
+        self.size += entry.size
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= evicted.size
+        IDEMPOTENCY_STORE_BYTES.set(self.size)
+
+    def remove_local(self, key: str):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry.size
+            IDEMPOTENCY_STORE_BYTES.set(self.size)
+
+    def backend_failed(self, error: Exception):
+        if self.backend_available:
+            self.backend_available = False
+            log_structured("Idempotency backend unavailable, using local store", level="warning", error=str(error))
+
+    def backend_recovered(self):
+        if not self.backend_available:
+            self.backend_available = True
+            log_structured("Idempotency backend recovered")
+
+    async def acquire(self, key: str):
+        # -> (OWNER, None) : exécuter la requête ; (REPLAY, réponse) ; (CONFLICT, None) : original toujours en cours
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT_TIMEOUT
+        while True:
+            stored = self.get_local(key)
+            if stored is not None:
+                return REPLAY, stored
+            future = self.in_flight.get(key)
+            if future is None:
+                break
+            try:
+                await asyncio.wait_for(asyncio.shield(future), deadline - time.monotonic())
+            except asyncio.TimeoutError:
+                return CONFLICT, None
+
+        self.in_flight[key] = asyncio.get_running_loop().create_future()
+        if self.redis is None:
+            return OWNER, None
+        try:
+            state, stored = await self.acquire_shared(key, deadline)
+        except Exception as e:
+            # Redis indisponible : dédoublonnage limité à cette instance plutôt que refuser la requête
+            self.backend_failed(e)
+            return OWNER, None
+        self.backend_recovered()
+        if state != OWNER:
+            self.release(key)
+        return state, stored
+
+    async def acquire_shared(self, key: str, deadline: float):
+        shared_key = f"idempotency:{key}"
+        while True:
+            # Marqueur "en cours" expirant : une instance tuée en pleine requête ne bloque pas la clé indéfiniment
+            if await self.redis.set(shared_key, IN_FLIGHT, nx=True, px=int(IDEMPOTENCY_LOCK_TTL * 1000)):
+                return OWNER, None
+            raw = await self.redis.get(shared_key)
+            if raw is not None and raw != IN_FLIGHT:
+                return REPLAY, StoredResponse.loads(raw)
+            if time.monotonic() >= deadline:
+                return CONFLICT, None
+            await asyncio.sleep(POLL_INTERVAL)
+
+    async def complete(self, key: str, entry: StoredResponse):
+        try:
+            if self.redis is not None:
+                try:
+                    await self.redis.set(f"idempotency:{key}", entry.dumps(), px=IDEMPOTENCY_TTL * 1000)
+                    return
+                except Exception as e:
+                    self.backend_failed(e)
+            self.set_local(key, entry)
+        finally:
+            self.release(key)
+
+    def abandon(self, key: str):
+        # Pas de réponse à conserver : la clé est libérée et le prochain retry exécute la requête
+        self.release(key)
+        if self.redis is not None:
+            asyncio.ensure_future(self.delete_shared(key))
+
+    async def delete_shared(self, key: str):
+        try:
+            await self.redis.delete(f"idempotency:{key}")
+        except Exception as e:
+            self.backend_failed(e)
+
+    def release(self, key: str):
+        future = self.in_flight.pop(key, None)
+        if future is not None and not future.done():
+            future.set_result(None)
+
+store = IdempotencyStore()
+
+def fingerprint(request, body: bytes) -> str:
+    digest = hashlib.blake2b(request.url.query.encode("latin-1"), digest_size=16)
+    digest.update(body)
+    return digest.hexdigest()
+
+def store_key(request, idempotency_key: str) -> str:
+    # Clé propre au sujet authentifié et à la ressource visée
+    claims = getattr(request.state, "claims", None) or {}
+    return f"{claims.get('sub', '')}|{request.method}|{request.url.path}|{idempotency_key}"
+
+def storable(response: Response) -> bool:
+    return (
+        response.status_code < 500
+        and response.status_code not in UNSTORED_STATUS_CODES
+        and len(response.body) <= IDEMPOTENCY_MAX_BODY_BYTES
+    )
+
+def replayed(entry: StoredResponse) -> Response:
+    response = Response(content=entry.body, status_code=entry.status_code)
+    response.raw_headers = entry.headers + [(b"idempotent-replayed", b"true")]
+    return response
+
+def idempotency(func):
+    @wraps(func)
+    async def wrapper(path: str, request):
+        idempotency_key = request.headers.get("idempotency-key")
+        if idempotency_key is None or not IDEMPOTENCY_ENABLED or request.method not in IDEMPOTENCY_METHODS:
+            return await func(path, request)
+        if not idempotency_key or len(idempotency_key) > MAX_KEY_LENGTH:
+            return JSONResponse(status_code=400, content={"detail": "Invalid Idempotency-Key header"})
+
+        # Corps lu en entier pour l'empreinte ; request.stream() le relaie ensuite depuis la copie en mémoire
+        request_fingerprint = fingerprint(request, await request.body())
+        key = store_key(request, idempotency_key)
+        state, entry = await store.acquire(key)
+        if state == CONFLICT:
+            IDEMPOTENCY_REQUESTS.labels(result="conflict").inc()
+            return JSONResponse(
+                status_code=409,
+                content={"detail": "A request with this Idempotency-Key is still in progress"},
+                headers={"Retry-After": "1"},
+            )
+        if state == REPLAY:
+            if entry.fingerprint != request_fingerprint:
+                IDEMPOTENCY_REQUESTS.labels(result="mismatch").inc()
+                return JSONResponse(status_code=422, content={"detail": "Idempotency-Key reused with a different request"})
+            IDEMPOTENCY_REQUESTS.labels(result="replayed").inc()
+            return replayed(entry)
+
+        try:
+            response = await buffer_response(await func(path, request))
+        except BaseException:
+            store.abandon(key)
+            raise
+        if not storable(response):
+            store.abandon(key)
+            IDEMPOTENCY_REQUESTS.labels(result="not_stored").inc()
+            return response
+        IDEMPOTENCY_REQUESTS.labels(result="stored").inc()
+        await store.complete(key, StoredResponse(request_fingerprint, response.status_code, list(response.raw_headers), response.body))
+        return response
+    return wrapper
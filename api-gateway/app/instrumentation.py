@@ -0,0 +1,77 @@
+import os
+import time
+from prometheus_client import CollectorRegistry, REGISTRY, multiprocess
+from starlette.routing import Match
+from introspection import recent_requests
+
+KNOWN_METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+
+def route_template(scope) -> str:
+    # Gabarit posé par le dispatcher de la table de routage (route catch-all unique)
+    template = scope.get("route_template")
+    if template is not None:
+        return template
+    # Le routeur renseigne scope["route"] ; sinon (réponse émise par un middleware, 404...)
+    # on cherche la route correspondante pour garder un label borné
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    app = scope.get("app")
+    for candidate in getattr(getattr(app, "router", None), "routes", ()):
+        match, _ = candidate.matches(scope)
+        if match != Match.NONE and hasattr(candidate, "path"):
+            return candidate.path
+    return "unmatched"
+
+def metrics_registry():
+    # Multi-workers (serve.py) : agrège les fichiers de métriques de tous les processus
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+class MetricsMiddleware:
+    # Middleware ASGI pur : labels par gabarit de route (/users/{user_id}) et non par chemin brut,
+    # ce qui borne le nombre de séries Prometheus
+    def __init__(self, app, request_count, request_latency):
+        self.app = app
+        self.request_count = request_count
+        self.request_latency = request_latency
+        self.children = {}
+
+    def labelled(self, method: str, endpoint: str, status_code: int):
+        key = (method, endpoint, status_code)
+        children = self.children.get(key)
+        if children is None:
+            labels = {"method": method, "endpoint": endpoint, "status_code": status_code}
+            children = self.children[key] = (
+                self.request_count.labels(**labels),
+                self.request_latency.labels(**labels),
+            )
+        return children
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration = time.perf_counter() - start
+            method = scope["method"] if scope["method"] in KNOWN_METHODS else "OTHER"
+            template = route_template(scope)
+            count, latency = self.labelled(method, template, status_code)
+            count.inc()
+            latency.observe(duration)
+            # Chemin brut et request id conservés pour /admin/stats (jamais en label Prometheus)
+            recent_requests.record(duration, method, scope["path"], template, status_code, scope.get("state", {}).get("request_id"))
@@ -0,0 +1,63 @@
+import heapq
+import itertools
+import time
+from collections import defaultdict, deque
+from operator import itemgetter
+from config import ADMIN_RECENT_REQUESTS, LOOP_MONITOR_INTERVAL, LOOP_SLOW_CALLBACK_THRESHOLD
+from logging_config import log_structured
+from loop_monitor import LoopMonitor
+
+class InFlightRequests:
+    # Appels upstream en cours, du départ vers l'upstream jusqu'à la fin du corps relayé
+    def __init__(self):
+        self.requests = defaultdict(dict)
+        self.ids = itertools.count()
+
+    def start(self, upstream: str, method: str, path: str) -> int:
+        request_id = next(self.ids)
+        self.requests[upstream][request_id] = (time.monotonic(), method, path)
+        return request_id
+
+    def finish(self, upstream: str, request_id: int):
+        self.requests[upstream].pop(request_id, None)
+
+    def snapshot(self, oldest: int = 5) -> dict:
+        now = time.monotonic()
+        result = {}
+        for upstream, requests in self.requests.items():
+            started = sorted(requests.values(), key=itemgetter(0))
+            result[upstream] = {
+                "count": len(started),
+                "oldest": [
+                    {"method": method, "path": path, "age_ms": round((now - start) * 1000, 1)}
+                    for start, method, path in started[:oldest]
+                ],
+            }
+        return result
+
+class RecentRequests:
+    # Ring buffer de taille fixe : enregistrer coûte un append, le tri n'a lieu qu'à la lecture
+    def __init__(self, size: int = ADMIN_RECENT_REQUESTS):
+        self.entries = deque(maxlen=size)
+
+    def record(self, duration: float, method: str, path: str, template: str, status_code: int, request_id):
+        self.entries.append((duration, method, path, template, status_code, request_id, time.time()))
+
+    def slowest(self, count: int) -> list:
+        return [
+            {
+                "duration_ms": round(duration * 1000, 1),
+                "method": method,
+                "path": path,
+                "route": template,
+                "status_code": status_code,
+                "request_id": request_id,
+                "finished_at": finished_at,
+            }
+            for duration, method, path, template, status_code, request_id, finished_at
+            in heapq.nlargest(count, self.entries, key=itemgetter(0))
+        ]
+
+in_flight = InFlightRequests()
+recent_requests = RecentRequests()
+loop_monitor = LoopMonitor("api-gateway", LOOP_MONITOR_INTERVAL, LOOP_SLOW_CALLBACK_THRESHOLD, log_structured)
@@ -0,0 +1,62 @@
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI
+from http_client import http_client
+from config import UPSTREAMS, POOL_WARMUP_CONNECTIONS
+from logging_config import log_structured
+from services.health_check import health_monitor
+from load_balancer import balancers
+from rate_limiter import rate_limiter
+from idempotency import store as idempotency_store
+from mirroring import shadows
+from route_table import route_table
+from introspection import loop_monitor
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Startup: initialise un pool de connexions par upstream
+    await http_client.start(UPSTREAMS)
+
+    # Résolution DNS périodique des réplicas (upstreams avec <SERVICE>_DNS_DISCOVERY=true)
+    await balancers.start()
+
+    # Table de routage déclarative (ROUTES_FILE) : peut déclarer de nouveaux upstreams, relue quand le fichier change
+    await route_table.start()
+
+    # Pré-ouvre des connexions keep-alive vers chaque réplica pour éviter le handshake TCP aux premières requêtes
+    if POOL_WARMUP_CONNECTIONS > 0:
+        warmed = await asyncio.gather(*(
+            asyncio.gather(*(
+                http_client.warm_up(name, f"{endpoint.url}/health", POOL_WARMUP_CONNECTIONS)
+                for endpoint in balancer.endpoints
+            ))
+            for name, balancer in balancers.items()
+        ))
+        log_structured("Upstream pools warmed up", pools={name: sum(counts) for name, counts in zip(balancers, warmed)})
+
+    # Tier partagé de limitation de débit (si RATE_LIMIT_REDIS_URL est défini)
+    await rate_limiter.start()
+
+    # Réponses des requêtes Idempotency-Key partagées entre instances (si IDEMPOTENCY_REDIS_URL est défini)
+    await idempotency_store.start()
+
+    # Pool dédié au trafic miroir (upstreams avec <SERVICE>_SHADOW_URL)
+    await shadows.start()
+
+    # /health lit un snapshot rafraîchi en tâche de fond au lieu d'interroger les services
+    health_monitor.start()
+
+    # Retard de la boucle asyncio (histogramme, /admin/stats) et pile des callbacks qui la bloquent
+    loop_monitor.start()
+
+    yield  # Place où l’app tourne (entre startup et shutdown)
+
+    # Shutdown: arrête les tâches de fond puis ferme les clients HTTP
+    await loop_monitor.stop()
+    await health_monitor.stop()
+    await rate_limiter.stop()
+    await idempotency_store.stop()
+    await shadows.stop()
+    await route_table.stop()
+    await balancers.stop()
+    await http_client.stop()
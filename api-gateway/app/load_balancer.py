@@ -0,0 +1,140 @@
+import asyncio
+import random
+import socket
+import time
+from typing import List, Optional
+from urllib.parse import urlsplit
+from config import UPSTREAMS, LB_STRATEGY, LB_EJECTION_THRESHOLD, LB_EJECTION_TIME, LB_DNS_REFRESH_INTERVAL
+from logging_config import log_structured
+from metrics import UPSTREAM_ENDPOINT_IN_FLIGHT, UPSTREAM_ENDPOINT_EJECTIONS
+
+class Endpoint:
+    def __init__(self, upstream: str, url: str):
+        self.upstream = upstream
+        self.url = url
+        self.in_flight = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.gauge = UPSTREAM_ENDPOINT_IN_FLIGHT.labels(upstream=upstream, endpoint=url)
+
+    def is_available(self, now: float) -> bool:
+        return self.ejected_until <= now
+
+class LoadBalancer:
+    def __init__(self, name: str, urls: List[str], dns_discovery: bool = False):
+        self.name = name
+        self.urls = urls
+        self.dns_discovery = dns_discovery
+        self.endpoints = [Endpoint(name, url) for url in urls]
+
+    def choose(self, exclude: Optional[Endpoint] = None) -> Endpoint:
+        if len(self.endpoints) == 1:
+            return self.endpoints[0]
+        now = time.monotonic()
+        # Si tous les réplicas sont éjectés, mieux vaut tenter quand même que tout refuser
+        candidates = [
+            endpoint for endpoint in self.endpoints
+            if endpoint.is_available(now) and endpoint is not exclude
+        ] or [endpoint for endpoint in self.endpoints if endpoint is not exclude]
+        if LB_STRATEGY == "least_outstanding":
+            fewest = min(endpoint.in_flight for endpoint in candidates)
+            return random.choice([endpoint for endpoint in candidates if endpoint.in_flight == fewest])
+        if len(candidates) == 1:
+            return candidates[0]
+        # Power of two choices : deux réplicas tirés au hasard, le moins chargé l'emporte
+        first, second = random.sample(candidates, 2)
+        return first if first.in_flight <= second.in_flight else second
+
+    def acquire(self, exclude: Optional[Endpoint] = None) -> Endpoint:
+        endpoint = self.choose(exclude)
+        endpoint.in_flight += 1
+        endpoint.gauge.inc()
+        return endpoint
+
+    def release(self, endpoint: Endpoint, success: Optional[bool]):
+        # success=None : appel annulé, sans verdict sur le réplica
+        endpoint.in_flight -= 1
+        endpoint.gauge.dec()
+        if success:
+            endpoint.consecutive_failures = 0
+        elif success is False:
+            endpoint.consecutive_failures += 1
+            if endpoint.consecutive_failures >= LB_EJECTION_THRESHOLD and len(self.endpoints) > 1:
+                endpoint.consecutive_failures = 0
+                endpoint.ejected_until = time.monotonic() + LB_EJECTION_TIME
+                UPSTREAM_ENDPOINT_EJECTIONS.labels(upstream=self.name, endpoint=endpoint.url).inc()
+                log_structured("Upstream replica ejected", level="warning", service=self.name, endpoint=endpoint.url)
+
+    async def resolve(self):
+        loop = asyncio.get_running_loop()
+        resolved = []
+        for url in self.urls:
+            parts = urlsplit(url)
+            port = parts.port or (443 if parts.scheme == "https" else 80)
+            infos = await loop.getaddrinfo(parts.hostname, port, type=socket.SOCK_STREAM)
+            for address in sorted({info[4][0] for info in infos}):
+                host = f"[{address}]" if ":" in address else address
+                resolved.append(f"{parts.scheme}://{host}:{port}")
+        if resolved and resolved != [endpoint.url for endpoint in self.endpoints]:
+            # Conserve les compteurs des réplicas toujours présents
+            current = {endpoint.url: endpoint for endpoint in self.endpoints}
+            self.endpoints = [current.get(url) or Endpoint(self.name, url) for url in resolved]
+            log_structured("Upstream replicas updated", service=self.name, endpoints=resolved)
+
+    def set_urls(self, urls: List[str], dns_discovery: bool):
+        # Réplicas redéfinis par la table de routage : conserve les compteurs des URLs inchangées
+        self.urls = urls
+        self.dns_discovery = dns_discovery
+        current = {endpoint.url: endpoint for endpoint in self.endpoints}
+        self.endpoints = [current.get(url) or Endpoint(self.name, url) for url in urls]
+
+class LoadBalancers(dict):
+    def __init__(self):
+        super().__init__(
+            (name, LoadBalancer(name, upstream["urls"], upstream["dns_discovery"]))
+            for name, upstream in UPSTREAMS.items()
+        )
+        self.task = None
+
+    async def resolve_all(self):
+        for balancer in list(self.values()):
+            if balancer.dns_discovery:
+                try:
+                    await balancer.resolve()
+                except Exception as e:
+                    log_structured("DNS resolution failed", level="warning", service=balancer.name, error=str(e))
+
+    async def refresh_forever(self):
+        while True:
+            await asyncio.sleep(LB_DNS_REFRESH_INTERVAL)
+            await self.resolve_all()
+
+    async def configure(self, name: str, upstream: dict):
+        if name in self:
+            if self[name].urls == upstream["urls"] and self[name].dns_discovery == upstream["dns_discovery"]:
+                return
+            self[name].set_urls(upstream["urls"], upstream["dns_discovery"])
+        else:
+            self[name] = LoadBalancer(name, upstream["urls"], upstream["dns_discovery"])
+        if self[name].dns_discovery:
+            try:
+                await self[name].resolve()
+            except Exception as e:
+                log_structured("DNS resolution failed", level="warning", service=name, error=str(e))
+            if self.task is None:
+                self.task = asyncio.create_task(self.refresh_forever())
+
+    async def start(self):
+        if any(balancer.dns_discovery for balancer in self.values()):
+            await self.resolve_all()
+            self.task = asyncio.create_task(self.refresh_forever())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+balancers = LoadBalancers()
@@ -0,0 +1,101 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Optional
+from prometheus_client import Counter, Histogram
+
+EVENT_LOOP_LAG = Histogram(
+    "event_loop_lag_seconds",
+    "Delay between the scheduled and actual wake-up of a periodic event loop timer",
+    ["service"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+
+EVENT_LOOP_BLOCKED = Counter(
+    "event_loop_blocked_total",
+    "Callbacks that held the event loop longer than the slow callback threshold",
+    ["service"]
+)
+
+STACK_DEPTH = 25
+
+class LoopMonitor:
+    # Retard de la boucle asyncio : écart entre le réveil prévu d'un sleep et son réveil effectif.
+    # Tout travail synchrone sur la boucle (CPU, I/O bloquante) retarde d'autant chaque requête en cours
+    def __init__(self, service: str, interval: float, threshold: float, log, history: int = 120):
+        self.interval = interval
+        self.threshold = threshold
+        self.log = log
+        self.lags = deque(maxlen=history)
+        self.lag_histogram = EVENT_LOOP_LAG.labels(service=service)
+        self.blocked = EVENT_LOOP_BLOCKED.labels(service=service)
+        self.heartbeat = time.monotonic()
+        self.loop_thread_id = None
+        self.task: Optional[asyncio.Task] = None
+        self.watchdog: Optional[threading.Thread] = None
+        self.stopping = threading.Event()
+
+    async def measure_forever(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            self.heartbeat = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+            self.heartbeat = time.monotonic()
+            self.lags.append(lag)
+            self.lag_histogram.observe(lag)
+            if lag >= self.threshold:
+                self.blocked.inc()
+
+    def watch(self):
+        # Thread à part : tant que la boucle est bloquée, lui seul peut observer ce qu'elle exécute.
+        # Une pile par blocage, capturée pendant qu'il dure
+        reported = None
+        while not self.stopping.wait(self.threshold / 2):
+            heartbeat = self.heartbeat
+            blocked_for = time.monotonic() - heartbeat - self.interval
+            if blocked_for < self.threshold or heartbeat == reported:
+                continue
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is None:
+                continue
+            reported = heartbeat
+            self.log(
+                "Event loop blocked",
+                level="WARNING",
+                blocked_ms=round(blocked_for * 1000, 1),
+                stack=[line.rstrip() for line in traceback.format_stack(frame, limit=STACK_DEPTH)],
+            )
+
+    def start(self):
+        # À appeler depuis la boucle surveillée (lifespan)
+        self.loop_thread_id = threading.get_ident()
+        self.task = asyncio.create_task(self.measure_forever())
+        self.stopping.clear()
+        self.watchdog = threading.Thread(target=self.watch, name="loop-monitor", daemon=True)
+        self.watchdog.start()
+
+    async def stop(self):
+        self.stopping.set()
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+    def snapshot(self) -> dict:
+        lags = sorted(self.lags)
+        if not lags:
+            return {"samples": 0}
+        return {
+            "samples": len(lags),
+            "last_ms": round(self.lags[-1] * 1000, 2),
+            "p50_ms": round(lags[len(lags) // 2] * 1000, 2),
+            "max_ms": round(lags[-1] * 1000, 2),
+            "window_s": round(len(lags) * self.interval, 1),
+        }
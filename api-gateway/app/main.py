@@ -500,29 +500,42 @@
 
 
 from fastapi import FastAPI
-from middlewares.request_id import request_id_middleware
+from middlewares.request_id import RequestIdMiddleware
+from middlewares.jwt_auth import JWTAuthMiddleware
+from middlewares.rate_limit import RateLimitMiddleware
 from middlewares.cors import setup_cors
-from routes import auth_routes, user_routes, health, metrics, map_routes, ai_routes, report_routes
+from routes import auth_routes, health, metrics, admin, batch_routes, proxy_routes
 from exceptions import setup_exception_handlers
-from config import lifespan, ENVIRONMENT, ALLOWED_HOSTS
+from config import ENVIRONMENT, ALLOWED_HOSTS
+from lifespan import lifespan
+from instrumentation import MetricsMiddleware
+from compression import CompressionMiddleware
+from metrics import REQUEST_COUNT, REQUEST_LATENCY
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 
 app = FastAPI(lifespan=lifespan, title="API Gateway v1", version="1.0.0")
 
-setup_cors(app)
-app.middleware("http")(request_id_middleware)
+# Enregistré avant JWTAuthMiddleware : s'exécute après lui et peut limiter par sujet du token
+app.add_middleware(RateLimitMiddleware)
+app.add_middleware(JWTAuthMiddleware)
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(MetricsMiddleware, request_count=REQUEST_COUNT, request_latency=REQUEST_LATENCY)
+app.add_middleware(RequestIdMiddleware)
 
 if ENVIRONMENT == "production":
     app.add_middleware(TrustedHostMiddleware, allowed_hosts=ALLOWED_HOSTS)
+# Enregistré en dernier, donc le plus externe : les 401, 429 et 503 émis par la gateway restent lisibles par le navigateur
+setup_cors(app)
 
 app.include_router(auth_routes.router, prefix="/auth", tags=["Authentication"])
-app.include_router(user_routes.router, prefix="/api/v1/users", tags=["Users"])
-app.include_router(map_routes.router, prefix="/api/v1/maps", tags=["Maps"])
-app.include_router(ai_routes.router, prefix="/api/v1/ais", tags=["AI"])
-app.include_router(report_routes.router, prefix="/api/v1/reports", tags=["Reports"])
+app.include_router(batch_routes.router, prefix="/api/v1", tags=["Batch"])
 
 app.include_router(health.router, tags=["System"])
 app.include_router(metrics.router, tags=["System"])
+app.include_router(admin.router, tags=["System"])
+
+# Upstreams (ROUTES_FILE / DEFAULT_ROUTES) : doit rester le dernier router inclus
+app.include_router(proxy_routes.router)
 
 setup_exception_handlers(app)
 
@@ -1,4 +1,6 @@
-from prometheus_client import Counter, Histogram
+from prometheus_client import Counter, Gauge, Histogram
+
+# multiprocess_mode (multi-workers) : "livesum" additionne les workers, "liveall" garde une série par worker (label pid)
 
 REQUEST_COUNT = Counter(
     "api_gateway_requests_total",
@@ -11,3 +13,197 @@ REQUEST_LATENCY = Histogram(
     "Request latency",
     ["method", "endpoint", "status_code"]
 )
+
+UPSTREAM_POOL_CONNECTIONS = Gauge(
+    "api_gateway_upstream_pool_connections",
+    "Open connections in each upstream pool",
+    ["upstream", "state"],
+    multiprocess_mode="livesum"
+)
+
+UPSTREAM_POOL_MAX_CONNECTIONS = Gauge(
+    "api_gateway_upstream_pool_max_connections",
+    "Configured connection limit of each upstream pool",
+    ["upstream"],
+    multiprocess_mode="livesum"
+)
+
+JWT_VERIFICATIONS = Counter(
+    "api_gateway_jwt_verifications_total",
+    "Bearer token verifications at the gateway",
+    ["result"]
+)
+
+RESPONSE_CACHE_REQUESTS = Counter(
+    "api_gateway_response_cache_requests_total",
+    "Response cache lookups for cacheable requests",
+    ["result"]
+)
+
+RESPONSE_CACHE_EVICTIONS = Counter(
+    "api_gateway_response_cache_evictions_total",
+    "Response cache entries evicted to stay under the byte limit"
+)
+
+RESPONSE_CACHE_BYTES = Gauge(
+    "api_gateway_response_cache_bytes",
+    "Bytes currently held by the response cache",
+    multiprocess_mode="livesum"
+)
+
+COALESCED_REQUESTS = Counter(
+    "api_gateway_coalesced_requests_total",
+    "Requests served from an identical in-flight upstream call",
+    ["upstream"]
+)
+
+CIRCUIT_BREAKER_STATE = Gauge(
+    "api_gateway_circuit_breaker_state",
+    "Circuit breaker state per upstream (0=closed, 1=open, 2=half_open)",
+    ["upstream"],
+    multiprocess_mode="liveall"
+)
+
+CIRCUIT_BREAKER_TRANSITIONS = Counter(
+    "api_gateway_circuit_breaker_transitions_total",
+    "Circuit breaker state transitions per upstream",
+    ["upstream", "from_state", "to_state"]
+)
+
+UPSTREAM_ENDPOINT_IN_FLIGHT = Gauge(
+    "api_gateway_upstream_endpoint_in_flight",
+    "Outstanding requests per upstream replica",
+    ["upstream", "endpoint"],
+    multiprocess_mode="livesum"
+)
+
+UPSTREAM_ENDPOINT_EJECTIONS = Counter(
+    "api_gateway_upstream_endpoint_ejections_total",
+    "Replicas passively ejected after consecutive failures",
+    ["upstream", "endpoint"]
+)
+
+HEDGED_REQUESTS = Counter(
+    "api_gateway_hedged_requests_total",
+    "Hedged upstream requests by winning attempt",
+    ["upstream", "winner"]
+)
+
+HEDGE_BUDGET_EXHAUSTED = Counter(
+    "api_gateway_hedge_budget_exhausted_total",
+    "Slow requests not hedged because the hedge budget was empty",
+    ["upstream"]
+)
+
+CONCURRENCY_LIMIT = Gauge(
+    "api_gateway_concurrency_limit",
+    "Adaptive concurrency limit per upstream",
+    ["upstream"],
+    multiprocess_mode="liveall"
+)
+
+CONCURRENCY_IN_FLIGHT = Gauge(
+    "api_gateway_concurrency_in_flight",
+    "Requests currently admitted by the concurrency limiter per upstream",
+    ["upstream"],
+    multiprocess_mode="livesum"
+)
+
+SHED_REQUESTS = Counter(
+    "api_gateway_shed_requests_total",
+    "Requests rejected with 503 by the concurrency limiter",
+    ["upstream", "lane"]
+)
+
+RATE_LIMIT_DECISIONS = Counter(
+    "api_gateway_rate_limit_decisions_total",
+    "Rate limit decisions per rule",
+    ["rule", "result"]
+)
+
+RATE_LIMIT_BACKEND_CALLS = Counter(
+    "api_gateway_rate_limit_backend_calls_total",
+    "Calls to the shared Redis rate limit tier",
+    ["result"]
+)
+
+COMPRESSION_RATIO = Histogram(
+    "api_gateway_compression_ratio",
+    "Compressed size divided by original size per compressed response",
+    ["encoding"],
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.8, 1.0)
+)
+
+COMPRESSION_CPU_SECONDS = Counter(
+    "api_gateway_compression_cpu_seconds_total",
+    "CPU time spent compressing responses",
+    ["encoding"]
+)
+
+COMPRESSION_BYTES = Counter(
+    "api_gateway_compression_bytes_total",
+    "Bytes before (in) and after (out) response compression",
+    ["encoding", "stage"]
+)
+
+ACTIVE_STREAMS = Gauge(
+    "api_gateway_active_streams",
+    "Open WebSocket and SSE streams per upstream",
+    ["upstream", "protocol"],
+    multiprocess_mode="livesum"
+)
+
+STREAMS_CLOSED = Counter(
+    "api_gateway_streams_total",
+    "Finished or rejected WebSocket and SSE streams by outcome",
+    ["upstream", "protocol", "outcome"]
+)
+
+STREAM_DURATION = Histogram(
+    "api_gateway_stream_duration_seconds",
+    "Lifetime of WebSocket and SSE streams",
+    ["protocol"],
+    buckets=(1, 5, 15, 60, 300, 900, 1800, 3600)
+)
+
+STREAM_MESSAGES = Counter(
+    "api_gateway_stream_messages_total",
+    "WebSocket messages or SSE chunks relayed",
+    ["upstream", "protocol", "direction"]
+)
+
+IDEMPOTENCY_REQUESTS = Counter(
+    "api_gateway_idempotency_requests_total",
+    "Requests carrying an Idempotency-Key by outcome",
+    ["result"]
+)
+
+IDEMPOTENCY_STORE_BYTES = Gauge(
+    "api_gateway_idempotency_store_bytes",
+    "Size of the in-memory idempotency store",
+    multiprocess_mode="livesum"
+)
+
+SHADOW_REQUESTS = Counter(
+    "api_gateway_shadow_requests_total",
+    "Mirrored requests by outcome (match, status_mismatch, error, dropped)",
+    ["upstream", "outcome"]
+)
+
+SHADOW_DURATION = Histogram(
+    "api_gateway_shadow_duration_seconds",
+    "Time to response headers of mirrored requests, for the primary and the shadow upstream",
+    ["upstream", "target"]
+)
+
+SHADOW_STATUS_MISMATCHES = Counter(
+    "api_gateway_shadow_status_mismatches_total",
+    "Mirrored requests whose shadow status differs from the primary status",
+    ["upstream", "primary_status", "shadow_status"]
+)
+
+SHADOW_IN_FLIGHT = Gauge(
+    "api_gateway_shadow_in_flight",
+    "Shadow requests currently in flight",
+    multiprocess_mode="livesum"
+)
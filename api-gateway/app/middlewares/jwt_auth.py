@@ -0,0 +1,63 @@
+from typing import Optional
+from fastapi import Request
+from starlette.requests import HTTPConnection
+from fastapi.responses import JSONResponse
+from config import JWT_PROTECTED_PATHS
+from logging_config import log_structured
+from route_table import route_table
+from token_verifier import token_verifier
+
+def unauthorized():
+    return JSONResponse(
+        status_code=401,
+        content={"detail": "Could not validate credentials"},
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+def is_protected(route, path: str) -> bool:
+    # La politique "auth" de la route l'emporte ; sans politique explicite, JWT_PROTECTED_PATHS s'applique
+    if route is not None and route.auth is not None:
+        return route.auth
+    return any(path.startswith(prefix) for prefix in JWT_PROTECTED_PATHS)
+
+def rejected(request: Request, route):
+    # Réponse émise avant le routage : comptée sous le gabarit de la route visée
+    if route is not None:
+        request.scope["route_template"] = route.template
+    return unauthorized()
+
+class JWTAuthMiddleware:
+    # Middleware ASGI pur : pas de tâche ni de flux intermédiaire par requête (BaseHTTPMiddleware)
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        request = Request(scope)
+        request.state.claims = None
+        path = request.url.path
+        route, _ = route_table.match(path)
+        # Les preflight CORS n'ont pas d'en-tête Authorization
+        if request.method == "OPTIONS" or not is_protected(route, path):
+            return await self.app(scope, receive, send)
+
+        scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            return await rejected(request, route)(scope, receive, send)
+
+        claims = token_verifier.verify(token)
+        if claims is None:
+            log_structured("Rejected invalid token", level="warning", path=path)
+            return await rejected(request, route)(scope, receive, send)
+
+        request.state.claims = claims
+        await self.app(scope, receive, send)
+
+def websocket_claims(websocket: HTTPConnection) -> Optional[dict]:
+    # Les navigateurs ne peuvent pas poser Authorization sur un WebSocket : token accepté en ?access_token=
+    scheme, _, token = websocket.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        token = websocket.query_params.get("access_token")
+    return token_verifier.verify(token) if token else None
@@ -0,0 +1,57 @@
+from typing import Optional
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from starlette.datastructures import MutableHeaders
+from config import RATE_LIMIT_ENABLED, RATE_LIMIT_RULES, RATE_LIMIT_TRUST_FORWARDED_FOR
+from metrics import RATE_LIMIT_DECISIONS
+from rate_limiter import Decision, rate_limiter
+
+def client_ip(request: Request) -> str:
+    forwarded = request.headers.get("X-Forwarded-For")
+    if RATE_LIMIT_TRUST_FORWARDED_FOR and forwarded:
+        # Dernière adresse : celle ajoutée par le proxy de confiance, la seule non falsifiable
+        return forwarded.split(",")[-1].strip()
+    return request.client.host if request.client else "unknown"
+
+def rate_limit_key(rule: dict, request: Request) -> str:
+    if rule["key"] == "route":
+        identity = "*"
+    elif rule["key"] == "sub" and getattr(request.state, "claims", None):
+        identity = f"sub:{request.state.claims.get('sub')}"
+    else:
+        identity = f"ip:{client_ip(request)}"
+    return f"{rule['prefix']}|{identity}"
+
+async def check_rate_limit(request: Request) -> Optional[Decision]:
+    path = request.url.path
+    rule = next((rule for rule in RATE_LIMIT_RULES if path.startswith(rule["prefix"])), None)
+    if not RATE_LIMIT_ENABLED or rule is None or request.method == "OPTIONS":
+        return None
+    decision = await rate_limiter.check(rule, rate_limit_key(rule, request))
+    RATE_LIMIT_DECISIONS.labels(rule=rule["prefix"], result="allowed" if decision.allowed else "limited").inc()
+    return decision
+
+def too_many_requests(decision: Decision) -> JSONResponse:
+    return JSONResponse(status_code=429, content={"detail": "Too many requests"}, headers=decision.headers)
+
+class RateLimitMiddleware:
+    # Middleware ASGI pur : les en-têtes RateLimit-* sont ajoutés au message http.response.start
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        decision = await check_rate_limit(Request(scope))
+        if decision is None:
+            return await self.app(scope, receive, send)
+        if not decision.allowed:
+            return await too_many_requests(decision)(scope, receive, send)
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).update(decision.headers)
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
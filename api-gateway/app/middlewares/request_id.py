@@ -1,22 +1,45 @@
 import time
 from logging_config import log_structured
-from metrics import REQUEST_COUNT, REQUEST_LATENCY
-from fastapi import Request
 
-async def request_id_middleware(request: Request, call_next):
-    request_id = request.headers.get("X-Request-ID", str(time.time()))
-    request.state.request_id = request_id
+class RequestIdMiddleware:
+    def __init__(self, app):
+        self.app = app
 
-    start_time = time.time()
-    response = await call_next(request)
-    process_time = time.time() - start_time
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
 
-    response.headers["X-Request-ID"] = request_id
-    response.headers["X-Process-Time"] = str(process_time)
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")
+                break
+        request_id = request_id or str(time.time())
+        scope.setdefault("state", {})["request_id"] = request_id
 
-    log_structured("Request processed", method=request.method, path=request.url.path, status_code=response.status_code, process_time=process_time, request_id=request_id)
+        start = time.perf_counter()
+        status_code = 500
 
-    REQUEST_COUNT.labels(method=request.method, endpoint=request.url.path, status_code=response.status_code).inc()
-    REQUEST_LATENCY.labels(method=request.method, endpoint=request.url.path, status_code=response.status_code).observe(process_time)
+        async def send_with_headers(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (b"x-request-id", request_id.encode("latin-1")),
+                    (b"x-process-time", str(time.perf_counter() - start).encode("latin-1")),
+                ]
+            await send(message)
 
-    return response
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            log_structured(
+                "Request processed",
+                sampled=True,
+                method=scope["method"],
+                path=scope["path"],
+                status_code=status_code,
+                process_time=time.perf_counter() - start,
+                request_id=request_id,
+            )
@@ -0,0 +1,129 @@
+import asyncio
+import random
+import time
+from functools import wraps
+from typing import Optional
+import httpx
+from config import (
+    UPSTREAMS,
+    SHADOW_METHODS,
+    SHADOW_MAX_CONNECTIONS,
+    SHADOW_MAX_CONCURRENCY,
+    SHADOW_TIMEOUT,
+    SHADOW_MAX_BODY_BYTES,
+)
+from logging_config import log_structured
+from metrics import SHADOW_REQUESTS, SHADOW_DURATION, SHADOW_STATUS_MISMATCHES, SHADOW_IN_FLIGHT
+from proxy import upstream_headers, upstream_url
+
+# Permet au build shadow de reconnaître le trafic rejoué (pas d'effets de bord externes, logs séparés...)
+SHADOW_HEADER = "x-shadow-request"
+
+class ShadowTraffic:
+    def __init__(self, max_concurrency: int = SHADOW_MAX_CONCURRENCY):
+        self.max_concurrency = max_concurrency
+        self.client: Optional[httpx.AsyncClient] = None
+        self.tasks = set()
+
+    async def start(self):
+        # Pool séparé et réduit : un shadow lent ne peut pas consommer les connexions des upstreams réels
+        self.client = httpx.AsyncClient(
+            timeout=SHADOW_TIMEOUT,
+            limits=httpx.Limits(max_connections=SHADOW_MAX_CONNECTIONS, max_keepalive_connections=SHADOW_MAX_CONNECTIONS),
+        )
+
+    async def stop(self):
+        for task in list(self.tasks):
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        if self.client:
+            await self.client.aclose()
+
+    def submit(self, upstream: str, method: str, url: str, headers: dict, body: bytes, primary_status: int, primary_latency: float):
+        if self.client is None:
+            return
+        # Plafond atteint : la requête n'est pas dupliquée plutôt que mise en file
+        if len(self.tasks) >= self.max_concurrency:
+            SHADOW_REQUESTS.labels(upstream=upstream, outcome="dropped").inc()
+            return
+        request = self.client.build_request(method, url, headers=headers, content=body)
+        task = asyncio.ensure_future(self.send(upstream, request, primary_status, primary_latency))
+        self.tasks.add(task)
+        SHADOW_IN_FLIGHT.inc()
+        task.add_done_callback(self.forget)
+
+    def forget(self, task):
+        self.tasks.discard(task)
+        SHADOW_IN_FLIGHT.dec()
+
+    async def send(self, upstream: str, request: httpx.Request, primary_status: int, primary_latency: float):
+        start = time.perf_counter()
+        try:
+            response = await self.client.send(request, stream=True)
+            latency = time.perf_counter() - start
+            try:
+                # Corps lu puis jeté : la connexion retourne au pool
+                async for _ in response.aiter_raw():
+                    pass
+            finally:
+                await response.aclose()
+        except Exception as e:
+            SHADOW_REQUESTS.labels(upstream=upstream, outcome="error").inc()
+            log_structured("Shadow request failed", level="warning", service=upstream, path=request.url.path, error=str(e))
+            return
+
+        SHADOW_DURATION.labels(upstream=upstream, target="primary").observe(primary_latency)
+        SHADOW_DURATION.labels(upstream=upstream, target="shadow").observe(latency)
+        if response.status_code == primary_status:
+            SHADOW_REQUESTS.labels(upstream=upstream, outcome="match").inc()
+            return
+        SHADOW_REQUESTS.labels(upstream=upstream, outcome="status_mismatch").inc()
+        SHADOW_STATUS_MISMATCHES.labels(
+            upstream=upstream, primary_status=primary_status, shadow_status=response.status_code
+        ).inc()
+        log_structured(
+            "Shadow status mismatch",
+            service=upstream,
+            method=request.method,
+            path=request.url.path,
+            primary_status=primary_status,
+            shadow_status=response.status_code,
+        )
+
+shadows = ShadowTraffic()
+
+def sampled(upstream: str, request) -> bool:
+    settings = UPSTREAMS.get(upstream, {})
+    if not settings.get("shadow_url") or request.method not in SHADOW_METHODS:
+        return False
+    return random.random() < settings["shadow_sample_rate"]
+
+def mirrorable_body(request) -> bool:
+    # Corps chunked sans longueur : il faudrait le bufferiser en entier avant de l'envoyer au primaire
+    if "transfer-encoding" in request.headers:
+        return False
+    try:
+        return int(request.headers.get("content-length", 0)) <= SHADOW_MAX_BODY_BYTES
+    except ValueError:
+        return False
+
+def mirror(upstream: str, upstream_prefix: str = ""):
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(path: str, request):
+            if not sampled(upstream, request) or not mirrorable_body(request):
+                return await func(path, request)
+
+            # Corps lu avant l'appel primaire (au plus SHADOW_MAX_BODY_BYTES) ; request.stream() le relaie ensuite
+            body = await request.body() if "content-length" in request.headers else b""
+            start = time.perf_counter()
+            response = await func(path, request)
+            latency = time.perf_counter() - start
+            # Lancé une fois les en-têtes primaires reçus : le client n'attend jamais le shadow
+            headers = upstream_headers(request)
+            headers[SHADOW_HEADER] = "1"
+            url = upstream_url(UPSTREAMS[upstream]["shadow_url"], upstream_prefix + path, request)
+            shadows.submit(upstream, request.method, url, headers, body, response.status_code, latency)
+            return response
+        return wrapper
+    return decorator
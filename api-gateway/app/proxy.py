@@ -0,0 +1,201 @@
+import json
+import time
+import httpx
+from fastapi import Request
+from starlette.background import BackgroundTask
+from starlette.responses import Response, StreamingResponse
+from http_client import http_client
+from load_balancer import balancers
+from circuit_breakers import FAILURE_STATUS_CODES
+from deadline import DEADLINE_HEADER, DeadlineExceeded, client_deadline, propagate_deadline
+from hedging import hedge_delay, hedge_eligible, send_hedged, latencies
+from introspection import in_flight
+from config import PROXY_STREAMING, PROXY_CHUNK_SIZE, INTERNAL_AUTH_TOKEN, COMPRESSION_ENABLED
+
+# En-têtes propres à une connexion, à ne jamais relayer (RFC 7230 §6.1)
+HOP_BY_HOP_HEADERS = frozenset({
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",
+    "trailer",
+    "transfer-encoding",
+    "upgrade",
+})
+
+# En-têtes de confiance posés par la gateway : jamais acceptés depuis le client
+CLAIMS_HEADER = "x-auth-claims"
+INTERNAL_AUTH_HEADER = "x-internal-auth"
+# X-Deadline-Ms est recalculé par la gateway à chaque tentative (jamais relayé tel quel)
+STRIPPED_REQUEST_HEADERS = HOP_BY_HOP_HEADERS | {"host", CLAIMS_HEADER, INTERNAL_AUTH_HEADER, DEADLINE_HEADER}
+
+
+def upstream_headers(request: Request) -> dict:
+    headers = {
+        key: value
+        for key, value in request.headers.items()
+        if key not in STRIPPED_REQUEST_HEADERS
+    }
+    # La gateway négocie elle-même la compression avec le client (et met en cache le corps brut)
+    if COMPRESSION_ENABLED:
+        headers["accept-encoding"] = "identity"
+    # Claims déjà vérifiés par la gateway : les services peuvent éviter un second jwt.decode
+    claims = getattr(request.state, "claims", None)
+    if claims and INTERNAL_AUTH_TOKEN:
+        headers[CLAIMS_HEADER] = json.dumps(claims, separators=(",", ":"))
+        headers[INTERNAL_AUTH_HEADER] = INTERNAL_AUTH_TOKEN
+    return headers
+
+
+def downstream_headers(response: httpx.Response) -> list:
+    # multi_items() conserve les en-têtes répétés (Set-Cookie...)
+    return [
+        (key.encode("latin-1"), value.encode("latin-1"))
+        for key, value in response.headers.multi_items()
+        if key not in HOP_BY_HOP_HEADERS
+    ]
+
+
+def upstream_url(base_url: str, path: str, request: Request) -> str:
+    query = request.url.query
+    return f"{base_url}{path}?{query}" if query else f"{base_url}{path}"
+
+
+def request_content(request: Request):
+    # Le corps est relayé chunk par chunk, sans être chargé en mémoire
+    if "content-length" in request.headers or "transfer-encoding" in request.headers:
+        return request.stream()
+    return None
+
+
+def upstream_error(upstream: str, error: Exception):
+    # (statut, détail) renvoyés quand l'appel upstream lève : même correspondance pour le proxy et les batchs
+    if isinstance(error, DeadlineExceeded):
+        return 504, "Deadline exceeded"
+    if isinstance(error, httpx.TimeoutException):
+        return 504, f"{upstream} timed out"
+    return 502, f"{upstream} error: {str(error)}"
+
+
+async def forward(service: str, path: str, request: Request) -> Response:
+    balancer = balancers[service]
+
+    async def attempt(endpoint):
+        try:
+            headers = upstream_headers(request)
+            # Recalculé à chaque tentative : une requête couverte reçoit le budget qu'il lui reste
+            request_timeout = propagate_deadline(request, headers)
+            return await http_client.stream(
+                request.method,
+                upstream_url(endpoint.url, path, request),
+                upstream=service,
+                headers=headers,
+                content=request_content(request),
+                timeout=request_timeout,
+            )
+        except DeadlineExceeded:
+            balancer.release(endpoint, None)
+            raise
+        except httpx.TimeoutException as e:
+            # Délai raccourci par le client : le réplica n'est pas en cause
+            if client_deadline(request):
+                balancer.release(endpoint, None)
+                raise DeadlineExceeded("deadline set by the client exceeded") from e
+            balancer.release(endpoint, False)
+            raise
+        except Exception:
+            balancer.release(endpoint, False)
+            raise
+        except BaseException:
+            balancer.release(endpoint, None)
+            raise
+
+    start = time.perf_counter()
+    tracked = in_flight.start(service, request.method, path)
+    delay = hedge_delay(service, balancer, request)
+    try:
+        if delay is None:
+            endpoint = balancer.acquire()
+            upstream = await attempt(endpoint)
+        else:
+            endpoint, upstream = await send_hedged(service, balancer, attempt, delay)
+    except BaseException:
+        in_flight.finish(service, tracked)
+        raise
+    # Percentile calculé sur les seules requêtes éligibles : les écritures lentes ne retardent pas les hedges
+    if hedge_eligible(request):
+        latencies[service].record(time.perf_counter() - start)
+    success = upstream.status_code not in FAILURE_STATUS_CODES
+
+    if not PROXY_STREAMING:
+        try:
+            body = b"".join([chunk async for chunk in upstream.aiter_raw()])
+        finally:
+            await upstream.aclose()
+            balancer.release(endpoint, success)
+            in_flight.finish(service, tracked)
+        response = Response(content=body, status_code=upstream.status_code)
+        response.raw_headers = downstream_headers(upstream)
+        return response
+
+    # Le réplica reste compté "en cours" jusqu'à la fin du streaming du corps
+    async def finish():
+        balancer.release(endpoint, success)
+        in_flight.finish(service, tracked)
+        await upstream.aclose()
+
+    # aiter_raw() ne lit le chunk suivant qu'une fois le précédent envoyé au client (backpressure)
+    response = StreamingResponse(upstream.aiter_raw(PROXY_CHUNK_SIZE), status_code=upstream.status_code)
+    response.raw_headers = downstream_headers(upstream)
+    return after_body(response, finish)
+
+def after_body(response: StreamingResponse, callback) -> StreamingResponse:
+    # callback() exécuté une seule fois quand le corps se termine : envoyé en entier, interrompu
+    # (upstream coupé, client parti) ou jamais itéré. Starlette saute la tâche de fond quand
+    # stream_response lève : le try/finally couvre ce cas, la tâche de fond le corps jamais lu.
+    # Comptabilité synchrone avant tout await dans callback : une annulation ne doit pas l'interrompre
+    called = False
+
+    async def finish():
+        nonlocal called
+        if not called:
+            called = True
+            await callback()
+
+    body = response.body_iterator
+
+    async def relay():
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            await finish()
+            if hasattr(body, "aclose"):
+                await body.aclose()
+
+    background = response.background
+
+    async def cleanup():
+        await finish()
+        if background is not None:
+            await background()
+
+    response.body_iterator = relay()
+    response.background = BackgroundTask(cleanup)
+    return response
+
+async def buffer_response(response: Response) -> Response:
+    # Matérialise une réponse streamée quand le corps complet est nécessaire (cache...)
+    if not isinstance(response, StreamingResponse):
+        return response
+    try:
+        body = b"".join([chunk async for chunk in response.body_iterator])
+    finally:
+        if response.background is not None:
+            await response.background()
+    buffered = Response(content=body, status_code=response.status_code)
+    buffered.raw_headers = [
+        (key, value) for key, value in response.raw_headers if key != b"content-length"
+    ] + [(b"content-length", str(len(body)).encode("latin-1"))]
+    return buffered
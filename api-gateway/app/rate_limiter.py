@@ -0,0 +1,144 @@
+import math
+import time
+from collections import OrderedDict
+from config import (
+    RATE_LIMIT_REDIS_URL,
+    RATE_LIMIT_BATCH_SIZE,
+    RATE_LIMIT_LEASE_TTL,
+    RATE_LIMIT_MAX_KEYS,
+)
+from logging_config import log_structured
+from metrics import RATE_LIMIT_BACKEND_CALLS
+
+# GCRA atomique : accorde jusqu'à ARGV[3] jetons d'un coup (pré-débit par lot).
+# L'horloge Redis sert de référence commune à toutes les instances de la gateway.
+GCRA_SCRIPT = """
+local interval = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = clock[1] * 1000 + clock[2] / 1000
+local tolerance = interval * burst
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then
+    tat = now
+end
+local granted = math.min(requested, math.floor((now + tolerance - tat) / interval))
+if granted <= 0 then
+    return {0, 0, math.ceil(tat + interval - tolerance - now)}
+end
+tat = tat + granted * interval
+redis.call('SET', KEYS[1], tostring(tat), 'PX', math.ceil(tat - now))
+return {granted, math.floor((now + tolerance - tat) / interval), math.ceil(tat - now)}
+"""
+
+class Decision:
+    def __init__(self, allowed: bool, limit: int, remaining: int, reset: float):
+        self.allowed = allowed
+        self.limit = limit
+        self.remaining = remaining
+        self.reset = reset  # secondes avant réapprovisionnement complet (ou avant le prochain jeton si refusé)
+
+    @property
+    def headers(self) -> dict:
+        headers = {
+            "RateLimit-Limit": str(self.limit),
+            "RateLimit-Remaining": str(max(0, self.remaining)),
+            "RateLimit-Reset": str(math.ceil(self.reset)),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(max(1, math.ceil(self.reset)))
+        return headers
+
+class TokenBucket:
+    def __init__(self, limit: int, window: float, now: float):
+        self.capacity = limit
+        self.rate = limit / window
+        self.tokens = float(limit)
+        self.updated = now
+
+    def take(self, now: float) -> bool:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+class Lease:
+    # Jetons déjà débités dans Redis, consommés localement sans aller-retour réseau
+    def __init__(self, tokens: int, expires_at: float, remaining: int, reset_at: float):
+        self.tokens = tokens
+        self.expires_at = expires_at
+        self.remaining = remaining
+        self.reset_at = reset_at
+
+class RateLimiter:
+    def __init__(self):
+        self.buckets = OrderedDict()
+        self.leases = OrderedDict()
+        self.redis = None
+        self.script = None
+        self.backend_available = True
+
+    async def start(self):
+        if RATE_LIMIT_REDIS_URL:
+            import redis.asyncio as redis
+            self.redis = redis.from_url(RATE_LIMIT_REDIS_URL, socket_timeout=0.2, socket_connect_timeout=0.2)
+            self.script = self.redis.register_script(GCRA_SCRIPT)
+
+    async def stop(self):
+        if self.redis is not None:
+            await self.redis.aclose()
+
+    def remember(self, table: OrderedDict, key: str, value):
+        # Borne la mémoire face à un grand nombre de clés (IP usurpées, scans)
+        table[key] = value
+        table.move_to_end(key)
+        while len(table) > RATE_LIMIT_MAX_KEYS:
+            table.popitem(last=False)
+
+    def check_local(self, rule: dict, key: str, now: float) -> Decision:
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(rule["limit"], rule["window"], now)
+        self.remember(self.buckets, key, bucket)
+        allowed = bucket.take(now)
+        reset = (1 - bucket.tokens) / bucket.rate if not allowed else (bucket.capacity - bucket.tokens) / bucket.rate
+        return Decision(allowed, rule["limit"], int(bucket.tokens), reset)
+
+    async def check_shared(self, rule: dict, key: str, now: float) -> Decision:
+        lease = self.leases.get(key)
+        if lease is not None and lease.tokens > 0 and lease.expires_at > now:
+            lease.tokens -= 1
+            return Decision(True, rule["limit"], lease.remaining + lease.tokens, lease.reset_at - now)
+
+        # Lots plus petits pour les règles strictes : une instance ne doit pas accaparer tout le quota
+        batch = max(1, min(RATE_LIMIT_BATCH_SIZE, rule["limit"] // 10))
+        interval = rule["window"] * 1000 / rule["limit"]
+        granted, remaining, reset_ms = await self.script(keys=[f"ratelimit:{key}"], args=[interval, rule["limit"], batch])
+        if not granted:
+            return Decision(False, rule["limit"], 0, reset_ms / 1000)
+        self.remember(self.leases, key, Lease(granted - 1, now + RATE_LIMIT_LEASE_TTL, remaining, now + reset_ms / 1000))
+        return Decision(True, rule["limit"], remaining + granted - 1, reset_ms / 1000)
+
+    async def check(self, rule: dict, key: str) -> Decision:
+        now = time.monotonic()
+        if self.redis is None:
+            return self.check_local(rule, key, now)
+        try:
+            decision = await self.check_shared(rule, key, now)
+        except Exception as e:
+            # Redis indisponible : repli sur le seau local plutôt que de tout bloquer ou tout laisser passer
+            RATE_LIMIT_BACKEND_CALLS.labels(result="error").inc()
+            if self.backend_available:
+                self.backend_available = False
+                log_structured("Rate limit backend unavailable, using local buckets", level="warning", error=str(e))
+            return self.check_local(rule, key, now)
+        RATE_LIMIT_BACKEND_CALLS.labels(result="ok").inc()
+        if not self.backend_available:
+            self.backend_available = True
+            log_structured("Rate limit backend recovered")
+        return decision
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,237 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Optional
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import Response
+from compression import negotiate, is_compressible, compress_cached, encoded_headers
+from config import (
+    RESPONSE_CACHE_ROUTES,
+    RESPONSE_CACHE_MAX_BYTES,
+    RESPONSE_CACHE_STALE_WHILE_REVALIDATE,
+    RESPONSE_CACHE_STALE_IF_ERROR,
+    COMPRESSION_MIN_SIZE,
+)
+from metrics import RESPONSE_CACHE_REQUESTS, RESPONSE_CACHE_EVICTIONS, RESPONSE_CACHE_BYTES
+from proxy import buffer_response
+
+# HEAD et OPTIONS ne modifient rien côté upstream : ils traversent le cache sans l'invalider
+INVALIDATING_METHODS = frozenset({"POST", "PUT", "PATCH", "DELETE"})
+
+class CachedResponse:
+    def __init__(self, route: str, status_code: int, headers: list, body: bytes, etag: str, ttl: int):
+        self.route = route
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+        self.etag = etag
+        self.created_at = time.monotonic()
+        self.expires_at = self.created_at + ttl
+        self.size = len(body) + sum(len(key) + len(value) for key, value in headers)
+        # Copies compressées par encodage, calculées au premier hit qui les demande
+        self.variants = {}
+        self.compressible = len(body) >= COMPRESSION_MIN_SIZE and is_compressible(Headers(raw=headers))
+        self.stored = False
+        # must-revalidate : l'upstream interdit de servir la copie une fois expirée
+        stale_window = 0 if "must-revalidate" in Headers(raw=headers).get("cache-control", "") else max(
+            RESPONSE_CACHE_STALE_WHILE_REVALIDATE, RESPONSE_CACHE_STALE_IF_ERROR
+        )
+        self.stale_until = self.expires_at + stale_window
+
+    def revalidatable(self, now: float) -> bool:
+        return now < min(self.expires_at + RESPONSE_CACHE_STALE_WHILE_REVALIDATE, self.stale_until)
+
+    def usable_on_error(self, now: float) -> bool:
+        return now < min(self.expires_at + RESPONSE_CACHE_STALE_IF_ERROR, self.stale_until)
+
+class ResponseCache:
+    def __init__(self, max_bytes: int = RESPONSE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+        # Revalidations en arrière-plan en cours, une seule par clé
+        self.revalidating = {}
+
+    def get(self, key) -> Optional[CachedResponse]:
+        # Entrée éventuellement expirée mais encore servable en secours : à l'appelant de vérifier expires_at
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry.stale_until <= time.monotonic():
+            self.remove(key)
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def set(self, key, entry: CachedResponse):
+        if entry.size > self.max_bytes:
+            return
+        if key in self.entries:
+            self.remove(key)
+        self.entries[key] = entry
+        entry.stored = True
+        self.size += entry.size
+        self.evict()
+
+    def evict(self):
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            evicted.stored = False
+            self.size -= evicted.size
+            RESPONSE_CACHE_EVICTIONS.inc()
+        RESPONSE_CACHE_BYTES.set(self.size)
+
+    def add_variant(self, entry: CachedResponse, encoding: str, body: bytes):
+        entry.variants[encoding] = body
+        entry.size += len(body)
+        if entry.stored:
+            self.size += len(body)
+            self.evict()
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            entry.stored = False
+            self.size -= entry.size
+            RESPONSE_CACHE_BYTES.set(self.size)
+
+    def invalidate(self, route: str):
+        for key in [key for key, entry in self.entries.items() if entry.route == route]:
+            self.remove(key)
+
+    def revalidate(self, key, refresh):
+        if key in self.revalidating:
+            return
+        # Tâche détachée : survit à la réponse déjà envoyée au client
+        task = asyncio.ensure_future(refresh())
+        self.revalidating[key] = task
+        task.add_done_callback(lambda done: self.forget(key, done))
+
+    def forget(self, key, task):
+        if self.revalidating.get(key) is task:
+            del self.revalidating[key]
+        if not task.cancelled():
+            task.exception()  # échec déjà journalisé par le circuit breaker ; la copie reste servie
+
+cache = ResponseCache()
+
+def cache_route(path: str, default: Optional[tuple] = None) -> Optional[tuple]:
+    # (préfixe, TTL) : RESPONSE_CACHE_ROUTES l'emporte sur le cache_ttl de la route
+    matches = [prefix for prefix in RESPONSE_CACHE_ROUTES if path.startswith(prefix)]
+    if not matches:
+        return default
+    prefix = max(matches, key=len)
+    return prefix, RESPONSE_CACHE_ROUTES[prefix]
+
+def cache_key(request) -> tuple:
+    claims = getattr(request.state, "claims", None) or {}
+    return (request.method, request.url.path, request.url.query, claims.get("sub"))
+
+def etag_matches(request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag.removeprefix("W/") in candidates
+
+def cached_response(entry: CachedResponse, cache_status: str, request) -> Response:
+    headers = entry.headers + [
+        (b"etag", entry.etag.encode("latin-1")),
+        (b"x-cache", cache_status.encode("latin-1")),
+    ]
+    encoding = negotiate(request.headers.get("accept-encoding", "")) if entry.compressible else None
+    if encoding is None:
+        response = Response(content=entry.body, status_code=entry.status_code)
+        response.raw_headers = headers
+        return response
+
+    # Copie compressée conservée avec l'entrée : les hits suivants ne coûtent aucun CPU
+    body = entry.variants.get(encoding)
+    if body is None:
+        body = compress_cached(encoding, entry.body)
+        cache.add_variant(entry, encoding, body)
+    response = Response(content=body, status_code=entry.status_code)
+    encoded = MutableHeaders(raw=list(headers))
+    encoded_headers(encoded, encoding)
+    response.raw_headers = encoded.raw + [(b"content-length", str(len(body)).encode("latin-1"))]
+    return response
+
+def not_modified(entry: CachedResponse, cache_status: str) -> Response:
+    return Response(status_code=304, headers={"ETag": entry.etag, "X-Cache": cache_status})
+
+def serve(entry: CachedResponse, cache_status: str, request) -> Response:
+    return not_modified(entry, cache_status) if etag_matches(request, entry.etag) else cached_response(entry, cache_status, request)
+
+def stale_response(entry: CachedResponse, request) -> Response:
+    response = serve(entry, "STALE", request)
+    response.headers["Age"] = str(int(time.monotonic() - entry.created_at))
+    return response
+
+def store(key, route: str, ttl: int, response: Response) -> Optional[CachedResponse]:
+    if response.status_code != 200 or "no-store" in response.headers.get("cache-control", ""):
+        return None
+    etag = response.headers.get("etag") or '"%s"' % hashlib.blake2b(response.body, digest_size=16).hexdigest()
+    headers = [(name, value) for name, value in response.raw_headers if name != b"etag"]
+    entry = CachedResponse(route, response.status_code, headers, response.body, etag, ttl)
+    cache.set(key, entry)
+    return entry
+
+def response_cache(prefix: str, ttl: Optional[int] = None):
+    default = (prefix, ttl) if ttl else None
+
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(path: str, request):
+            policy = cache_route(request.url.path, default)
+            if policy is None:
+                return await func(path, request)
+            route, route_ttl = policy
+
+            # Une écriture via la gateway invalide les listings mis en cache sous cette route
+            if request.method in INVALIDATING_METHODS:
+                response = await func(path, request)
+                if response.status_code < 400:
+                    cache.invalidate(route)
+                return response
+            if request.method != "GET":
+                return await func(path, request)
+
+            # Authorization non vérifié par la gateway : impossible de cloisonner le cache par sujet
+            if "authorization" in request.headers and not getattr(request.state, "claims", None):
+                return await func(path, request)
+
+            key = cache_key(request)
+            entry = cache.get(key)
+            now = time.monotonic()
+            if entry is not None and "no-cache" not in request.headers.get("cache-control", ""):
+                if entry.expires_at > now:
+                    RESPONSE_CACHE_REQUESTS.labels(result="hit").inc()
+                    return serve(entry, "HIT", request)
+                if entry.revalidatable(now):
+                    # Copie expirée servie immédiatement, rafraîchie par un seul appel upstream en arrière-plan
+                    async def refresh():
+                        store(key, route, route_ttl, await buffer_response(await func(path, request)))
+                    cache.revalidate(key, refresh)
+                    RESPONSE_CACHE_REQUESTS.labels(result="stale").inc()
+                    return stale_response(entry, request)
+
+            # Circuit ouvert, upstream en erreur ou injoignable : dernière réponse valide plutôt qu'une 502
+            fallback = entry if entry is not None and entry.usable_on_error(now) else None
+            try:
+                response = await buffer_response(await func(path, request))
+            except Exception:
+                if fallback is None:
+                    raise
+                RESPONSE_CACHE_REQUESTS.labels(result="stale_if_error").inc()
+                return stale_response(fallback, request)
+            if response.status_code >= 500 and fallback is not None:
+                RESPONSE_CACHE_REQUESTS.labels(result="stale_if_error").inc()
+                return stale_response(fallback, request)
+
+            RESPONSE_CACHE_REQUESTS.labels(result="miss").inc()
+            entry = store(key, route, route_ttl, response)
+            return response if entry is None else serve(entry, "MISS", request)
+        return wrapper
+    return decorator
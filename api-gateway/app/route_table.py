@@ -0,0 +1,161 @@
+import asyncio
+import json
+import os
+from typing import Optional
+from circuit_breakers import circuit_breaker
+from concurrency_limiter import concurrency_limit
+from config import UPSTREAMS, DEFAULT_ROUTES, ROUTES_FILE, ROUTES_RELOAD_INTERVAL, upstream_config
+from deadline import within_deadline
+from http_client import http_client
+from idempotency import idempotency
+from load_balancer import balancers
+from mirroring import mirror
+from logging_config import log_structured
+from proxy import forward
+from response_cache import response_cache
+from single_flight import single_flight
+
+DEFAULT_METHODS = ("GET", "POST", "PUT", "DELETE", "PATCH")
+ROUTE_FIELDS = {"prefix", "upstream", "methods", "timeout", "cache_ttl", "auth", "upstream_prefix"}
+
+class Route:
+    def __init__(
+        self,
+        prefix: str,
+        upstream: str,
+        methods=DEFAULT_METHODS,
+        timeout: Optional[float] = None,
+        cache_ttl: Optional[int] = None,
+        auth: Optional[bool] = None,
+        upstream_prefix: str = "",
+    ):
+        self.prefix = prefix.rstrip("/")
+        self.upstream = upstream
+        self.methods = frozenset(method.upper() for method in methods)
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+        self.auth = auth
+        self.upstream_prefix = upstream_prefix.rstrip("/")
+        # Label des métriques : même gabarit que les anciens routers par service
+        self.template = f"{self.prefix}/{{path:path}}"
+        self.proxy = build_proxy(self)
+
+def build_proxy(route: Route):
+    # Breaker, limiteur et coalescing sont indexés par upstream : leur état survit au rechargement
+    @idempotency
+    @response_cache(route.prefix, route.cache_ttl)
+    @single_flight(route.upstream)
+    @within_deadline
+    @concurrency_limit(route.upstream)
+    @circuit_breaker(route.upstream)
+    @mirror(route.upstream, route.upstream_prefix)
+    async def proxy(path: str, request):
+        return await forward(route.upstream, route.upstream_prefix + path, request)
+    return proxy
+
+class RouteNode:
+    __slots__ = ("children", "route")
+
+    def __init__(self):
+        self.children = {}
+        self.route = None
+
+class RouteTrie:
+    def __init__(self, routes: list):
+        self.root = RouteNode()
+        self.routes = routes
+        for route in routes:
+            node = self.root
+            for segment in route.prefix.split("/")[1:]:
+                node = node.children.setdefault(segment, RouteNode())
+            if node.route is not None:
+                raise ValueError(f"Duplicate route prefix {route.prefix or '/'}")
+            node.route = route
+
+    def match(self, path: str):
+        # Descente segment par segment : coût proportionnel à la longueur du chemin, pas au nombre de routes.
+        # Renvoie la route au préfixe le plus long et le reste du chemin à relayer.
+        parts = path.split("/")
+        node = self.root
+        best, depth = node.route, 0
+        for index in range(1, len(parts)):
+            node = node.children.get(parts[index])
+            if node is None:
+                break
+            if node.route is not None:
+                best, depth = node.route, index
+        if best is None:
+            return None, None
+        return best, "/" + "/".join(parts[depth + 1:])
+
+def parse_routes(definitions: list, upstreams: dict) -> list:
+    routes = []
+    for definition in definitions:
+        unknown = set(definition) - ROUTE_FIELDS
+        if unknown:
+            raise ValueError(f"Route {definition.get('prefix')}: unknown fields {sorted(unknown)}")
+        if definition.get("upstream") not in upstreams:
+            raise ValueError(f"Route {definition.get('prefix')}: unknown upstream {definition.get('upstream')}")
+        routes.append(Route(**definition))
+    return routes
+
+def read_routes_file(path: str):
+    with open(path) as f:
+        document = json.load(f)
+    # "upstreams": {"billing_service": "http://billing:8000"} ; réglages de pool via BILLING_SERVICE_MAX_CONNECTIONS...
+    upstreams = {name: upstream_config(name.upper(), url) for name, url in document.get("upstreams", {}).items()}
+    return upstreams, document.get("routes", DEFAULT_ROUTES)
+
+class RouteTable:
+    def __init__(self, path: str = ROUTES_FILE):
+        self.path = path
+        self.mtime = None
+        self.task = None
+        self.trie = RouteTrie(parse_routes(DEFAULT_ROUTES, UPSTREAMS))
+
+    def match(self, path: str):
+        return self.trie.match(path)
+
+    async def register_upstream(self, name: str, upstream: dict):
+        # Seuls les réplicas d'un upstream existant sont mis à jour : pool et breaker gardent leurs réglages
+        UPSTREAMS[name] = upstream
+        if name not in http_client.pools:
+            http_client.add_pool(name, upstream)
+        await balancers.configure(name, upstream)
+
+    async def load(self):
+        self.mtime = os.stat(self.path).st_mtime_ns
+        upstreams, definitions = read_routes_file(self.path)
+        # Validée entièrement avant d'être appliquée : une table invalide laisse l'ancienne en place
+        trie = RouteTrie(parse_routes(definitions, {**UPSTREAMS, **upstreams}))
+        for name, upstream in upstreams.items():
+            await self.register_upstream(name, upstream)
+        self.trie = trie
+        log_structured("Route table loaded", source=self.path, routes=[route.prefix or "/" for route in trie.routes])
+
+    async def watch_forever(self):
+        while True:
+            await asyncio.sleep(ROUTES_RELOAD_INTERVAL)
+            try:
+                if os.stat(self.path).st_mtime_ns != self.mtime:
+                    await self.load()
+            except Exception as e:
+                log_structured("Route table reload failed", level="error", source=self.path, error=str(e))
+
+    async def start(self):
+        if not self.path:
+            return
+        # Au démarrage une table invalide empêche de lancer la gateway
+        await self.load()
+        if ROUTES_RELOAD_INTERVAL > 0:
+            self.task = asyncio.create_task(self.watch_forever())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+route_table = RouteTable()
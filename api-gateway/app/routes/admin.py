@@ -0,0 +1,64 @@
+import hmac
+import os
+import time
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse
+from circuit_breakers import CLOSED, breakers
+from concurrency_limiter import limiters
+from config import ADMIN_TOKEN, ADMIN_SLOWEST_REQUESTS, UPSTREAMS
+from http_client import http_client
+from introspection import in_flight, recent_requests, loop_monitor
+from load_balancer import balancers
+
+router = APIRouter()
+
+def authorized(request: Request) -> bool:
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    return scheme.lower() == "bearer" and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+def breaker_stats() -> dict:
+    now = time.monotonic()
+    stats = {}
+    for key, breaker in breakers.items():
+        successes, failures = breaker.window.counts(now)
+        stats[key] = {"state": breaker.state, "successes": successes, "failures": failures}
+        if breaker.state != CLOSED:
+            stats[key]["opened_for_s"] = round(now - breaker.opened_at, 1)
+    return stats
+
+def pool_stats() -> dict:
+    return {
+        name: {**http_client.pool_stats(name), "max": UPSTREAMS.get(name, {}).get("max_connections")}
+        for name in http_client.pools
+    }
+
+def replica_stats() -> dict:
+    now = time.monotonic()
+    return {
+        name: [
+            {"url": endpoint.url, "in_flight": endpoint.in_flight, "ejected": endpoint.ejected_until > now}
+            for endpoint in balancer.endpoints
+        ]
+        for name, balancer in balancers.items()
+    }
+
+# Vue propre au worker qui répond (pid) : à interroger sur chaque worker en multi-workers.
+# Uniquement des lectures de structures en mémoire, sans I/O : interrogeable chaque seconde
+@router.get("/admin/stats", include_in_schema=False)
+async def admin_stats(request: Request):
+    if not ADMIN_TOKEN:
+        return JSONResponse(status_code=404, content={"detail": "Not Found"})
+    if not authorized(request):
+        return JSONResponse(status_code=401, content={"detail": "Invalid admin token"}, headers={"WWW-Authenticate": "Bearer"})
+    return {
+        "pid": os.getpid(),
+        "event_loop_lag": loop_monitor.snapshot(),
+        "in_flight": in_flight.snapshot(),
+        "pools": pool_stats(),
+        "replicas": replica_stats(),
+        "circuit_breakers": breaker_stats(),
+        "concurrency_limits": {
+            key: {"limit": round(limiter.limit, 1), "in_flight": limiter.in_flight} for key, limiter in limiters.items()
+        },
+        "slowest_requests": recent_requests.slowest(ADMIN_SLOWEST_REQUESTS),
+    }
@@ -1,13 +1,13 @@
-from fastapi import APIRouter, Request, Response
-from services.auth_service import proxy_auth
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Request
+from middlewares.jwt_auth import unauthorized
 
 router = APIRouter()
 
-@router.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH"])
-async def auth_proxy(path: str, request: Request):
-    try:
-        response = await proxy_auth(f"/{path}", request)
-        return Response(content=response.content, status_code=response.status_code, headers=dict(response.headers))
-    except Exception as e:
-        return JSONResponse(status_code=502, content={"detail": f"Auth service error: {str(e)}"})
+# Le token est déjà vérifié par JWTAuthMiddleware : inutile de solliciter auth-service
+@router.get("/verify")
+async def verify_token(request: Request):
+    # Route déclarée "auth: false" dans la table de routage : le middleware n'a vérifié aucun token
+    claims = getattr(request.state, "claims", None)
+    if not claims:
+        return unauthorized()
+    return {"username": claims["sub"], "valid": True}
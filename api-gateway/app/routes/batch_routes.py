@@ -0,0 +1,12 @@
+from fastapi import APIRouter, Request
+from fastapi.responses import Response, StreamingResponse
+from services.batch_service import BatchRequest, run_batch, stream_batch
+
+router = APIRouter()
+
+@router.post("/batch")
+async def batch(batch: BatchRequest, request: Request):
+    # Accept: application/x-ndjson -> chaque résultat est envoyé dès qu'il est prêt
+    if "application/x-ndjson" in request.headers.get("accept", ""):
+        return StreamingResponse(stream_batch(request, batch), media_type="application/x-ndjson")
+    return Response(await run_batch(request, batch), media_type="application/json")
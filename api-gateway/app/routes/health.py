@@ -1,8 +1,8 @@
 from fastapi import APIRouter
-from services.health_check import check_services_health
+from services.health_check import health_monitor
 
 router = APIRouter()
 
 @router.get("/health")
 async def health():
-    return await check_services_health()
+    return health_monitor.snapshot
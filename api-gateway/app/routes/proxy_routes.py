@@ -0,0 +1,44 @@
+from fastapi import APIRouter, Request, WebSocket
+from fastapi.responses import JSONResponse
+from deadline import start_deadline
+from middlewares.jwt_auth import is_protected, websocket_claims
+from proxy import upstream_error
+from route_table import route_table
+from streaming import forward_events, is_event_stream, proxy_websocket
+
+router = APIRouter()
+
+# Route unique enregistrée en dernier : l'upstream est choisi par la table de routage (trie de préfixes)
+@router.api_route("/{path:path}", methods=["GET", "HEAD", "POST", "PUT", "DELETE", "PATCH", "OPTIONS"], include_in_schema=False)
+async def gateway_proxy(request: Request):
+    route, path = route_table.match(request.scope["path"])
+    if route is None:
+        request.scope["route_template"] = "unmatched"
+        return JSONResponse(status_code=404, content={"detail": "Not Found"})
+    request.scope["route_template"] = route.template
+    if request.method not in route.methods:
+        return JSONResponse(status_code=405, content={"detail": "Method Not Allowed"})
+    try:
+        # SSE : flux long relayé hors cache, coalescing et limiteur adaptatif
+        if is_event_stream(request):
+            return await forward_events(route.upstream, route.upstream_prefix + path, request)
+        start_deadline(request, route)
+        return await route.proxy(path, request)
+    except Exception as e:
+        status_code, detail = upstream_error(route.upstream, e)
+        return JSONResponse(status_code=status_code, content={"detail": detail})
+
+@router.websocket("/{path:path}")
+async def gateway_websocket(websocket: WebSocket):
+    route, path = route_table.match(websocket.scope["path"])
+    if route is None:
+        await websocket.close(code=1008)
+        return
+    # JWTAuthMiddleware ne traite que les requêtes HTTP : même politique appliquée ici
+    if is_protected(route, websocket.scope["path"]):
+        claims = websocket_claims(websocket)
+        if claims is None:
+            await websocket.close(code=1008)
+            return
+        websocket.state.claims = claims
+    await proxy_websocket(route.upstream, route.upstream_prefix + path, websocket)
@@ -0,0 +1,63 @@
+import math
+import os
+import shutil
+
+APP_MODULE = os.getenv("APP_MODULE", "main:app")
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+GRACEFUL_SHUTDOWN_TIMEOUT = int(os.getenv("GRACEFUL_SHUTDOWN_TIMEOUT", "20"))
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus_multiproc")
+
+def available_cpus() -> int:
+    # Quota cgroup v2 du conteneur (docker --cpus), sinon les cœurs visibles par le processus
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            return max(1, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    return len(os.sched_getaffinity(0))
+
+def worker_count() -> int:
+    return int(os.getenv("WEB_CONCURRENCY") or available_cpus())
+
+def prepare_metrics_dir():
+    # Chaque worker écrit ses métriques dans ce dossier ; /metrics les agrège (fichiers d'un run précédent supprimés)
+    shutil.rmtree(PROMETHEUS_MULTIPROC_DIR, ignore_errors=True)
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR)
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = PROMETHEUS_MULTIPROC_DIR
+
+def main():
+    import uvicorn
+
+    workers = worker_count()
+    config = uvicorn.Config(
+        APP_MODULE,
+        host=HOST,
+        port=PORT,
+        workers=workers,
+        timeout_graceful_shutdown=GRACEFUL_SHUTDOWN_TIMEOUT,
+    )
+    if workers == 1:
+        uvicorn.Server(config).run()
+        return
+
+    # Avant tout import de prometheus_client : les workers héritent de la variable d'environnement
+    prepare_metrics_dir()
+    from prometheus_client import multiprocess
+    from uvicorn.supervisors import Multiprocess
+
+    class Supervisor(Multiprocess):
+        # SIGTERM est relayé à chaque worker, qui termine ses requêtes en cours et exécute son shutdown
+        # avant que le superviseur ne s'arrête ; un worker mort est remplacé et ses jauges "live" retirées
+        def keep_subprocess_alive(self):
+            before = {process.pid for process in self.processes}
+            super().keep_subprocess_alive()
+            for pid in before - {process.pid for process in self.processes}:
+                multiprocess.mark_process_dead(pid)
+
+    Supervisor(config, target=uvicorn.Server(config).run, sockets=[config.bind_socket()]).run()
+
+if __name__ == "__main__":
+    main()
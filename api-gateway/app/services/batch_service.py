@@ -0,0 +1,148 @@
+import asyncio
+import orjson
+from typing import Any, Dict, List, Optional
+from fastapi import Request
+from pydantic import BaseModel, Field
+from config import BATCH_MAX_REQUESTS, BATCH_CONCURRENCY
+from deadline import DeadlineExceeded, start_deadline
+from middlewares.rate_limit import check_rate_limit
+from proxy import HOP_BY_HOP_HEADERS, buffer_response, upstream_error
+from route_table import route_table
+
+# Le corps de chaque sous-réponse est inclus tel quel dans le JSON du batch :
+# pas de compression ni de réponse conditionnelle (304) héritées de la requête englobante
+BATCH_STRIPPED_HEADERS = frozenset({
+    "content-length",
+    "content-type",
+    "accept",
+    "accept-encoding",
+    "if-none-match",
+    "if-modified-since",
+    # Une clé d'idempotence ne vaut que pour une requête : chaque sous-requête fournit la sienne
+    "idempotency-key",
+})
+BATCH_RESPONSE_HEADERS_SKIPPED = HOP_BY_HOP_HEADERS | {"content-length", "content-encoding"}
+
+class SubRequest(BaseModel):
+    id: Optional[str] = None
+    method: str = "GET"
+    path: str
+    headers: Dict[str, str] = Field(default_factory=dict)
+    body: Optional[Any] = None
+
+class BatchRequest(BaseModel):
+    requests: List[SubRequest] = Field(..., min_length=1, max_length=BATCH_MAX_REQUESTS)
+
+
+def build_request(parent: Request, sub: SubRequest) -> Request:
+    path, _, query = sub.path.partition("?")
+    body = orjson.dumps(sub.body) if sub.body is not None else b""
+    headers = [
+        (key, value) for key, value in parent.headers.raw
+        if key.decode("latin-1") not in BATCH_STRIPPED_HEADERS
+    ]
+    headers += [(key.lower().encode("latin-1"), value.encode("latin-1")) for key, value in sub.headers.items()]
+    headers.append((b"accept-encoding", b"identity"))
+    if body:
+        headers += [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode("latin-1"))]
+
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return {"type": "http.disconnect"}
+
+    scope = {
+        **parent.scope,
+        "method": sub.method.upper(),
+        "path": path,
+        "raw_path": path.encode("latin-1"),
+        "query_string": query.encode("latin-1"),
+        "headers": headers,
+        # Claims et request id de la requête englobante
+        "state": dict(parent.scope.get("state", {})),
+    }
+    return Request(scope, receive)
+
+def is_json(body: bytes) -> bool:
+    try:
+        orjson.loads(body)
+    except orjson.JSONDecodeError:
+        return False
+    return True
+
+def encode_result(sub_id, status_code: int, headers: dict, body: bytes, content_type: str) -> bytes:
+    # Corps JSON de l'upstream inséré sans être réencodé ; validé d'abord pour ne jamais corrompre le batch entier
+    if content_type.startswith("application/json") and body and is_json(body):
+        encoded_body = body
+    else:
+        encoded_body = orjson.dumps(body.decode("utf-8", "replace") or None)
+    return (
+        b'{"id":' + orjson.dumps(sub_id)
+        + b',"status":' + str(status_code).encode()
+        + b',"headers":' + orjson.dumps(headers)
+        + b',"body":' + encoded_body + b"}"
+    )
+
+def error_result(sub_id, status_code: int, detail: str) -> bytes:
+    return orjson.dumps({"id": sub_id, "status": status_code, "headers": {}, "body": {"detail": detail}})
+
+async def execute(parent: Request, index: int, sub: SubRequest, semaphore: asyncio.Semaphore) -> bytes:
+    sub_id = sub.id if sub.id is not None else str(index)
+    # Même table de routage que les appels directs
+    route, path = route_table.match(sub.path.partition("?")[0])
+    if route is None or sub.method.upper() not in route.methods:
+        return error_result(sub_id, 404, f"No batchable route for {sub.method.upper()} {sub.path}")
+
+    try:
+        request = build_request(parent, sub)
+    except UnicodeEncodeError:
+        return error_result(sub_id, 400, "Path and headers must be latin-1 encodable")
+    try:
+        start_deadline(request, route)
+    except DeadlineExceeded as e:
+        return error_result(sub_id, *upstream_error(route.upstream, e))
+    # Chaque sous-requête consomme le quota de limitation de débit comme un appel direct
+    decision = await check_rate_limit(request)
+    if decision is not None and not decision.allowed:
+        return error_result(sub_id, 429, "Too many requests")
+
+    async with semaphore:
+        try:
+            response = await buffer_response(await route.proxy(path, request))
+        except Exception as e:
+            # Une sous-requête en échec ne doit jamais faire échouer le batch entier
+            return error_result(sub_id, *upstream_error(route.upstream, e))
+    headers = {
+        key.decode("latin-1"): value.decode("latin-1")
+        for key, value in response.raw_headers
+        if key.decode("latin-1") not in BATCH_RESPONSE_HEADERS_SKIPPED
+    }
+    return encode_result(sub_id, response.status_code, headers, response.body, headers.get("content-type", ""))
+
+def start_batch(parent: Request, batch: BatchRequest) -> List[asyncio.Task]:
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    return [asyncio.ensure_future(execute(parent, index, sub, semaphore)) for index, sub in enumerate(batch.requests)]
+
+async def run_batch(parent: Request, batch: BatchRequest) -> bytes:
+    tasks = start_batch(parent, batch)
+    try:
+        results = await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+    return b'{"responses":[' + b",".join(results) + b"]}"
+
+async def stream_batch(parent: Request, batch: BatchRequest):
+    # NDJSON : une ligne par sous-requête, dans l'ordre de complétion
+    tasks = start_batch(parent, batch)
+    try:
+        for next_result in asyncio.as_completed(tasks):
+            yield await next_result + b"\n"
+    finally:
+        # Client déconnecté : inutile de poursuivre les sous-requêtes restantes
+        for task in tasks:
+            task.cancel()
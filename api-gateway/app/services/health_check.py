@@ -1,18 +1,68 @@
+import asyncio
+import time
+from datetime import datetime
 from http_client import http_client
-from config import AUTH_SERVICE_URL, USER_SERVICE_URL, MAP_SERVICE_URL, AI_SERVICE_URL, REPORT_SERVICE_URL
-
-async def check_services_health():
-    results = {}
-    for name, url in {
-        "auth_service": f"{AUTH_SERVICE_URL}/health",
-        "user_service": f"{USER_SERVICE_URL}/health",
-        "map_service": f"{MAP_SERVICE_URL}/health",
-        "ai_service": f"{AI_SERVICE_URL}/health",
-        "report_service": f"{REPORT_SERVICE_URL}/health"
-    }.items():
-        try:
-            resp = await http_client.client.get(url)
-            results[name] = resp.json() if resp.status_code == 200 else {"status": "unhealthy"}
-        except Exception:
-            results[name] = {"status": "unreachable"}
-    return results
+from config import HEALTH_CHECK_INTERVAL, HEALTH_CHECK_TIMEOUT
+from load_balancer import balancers
+from logging_config import log_structured
+
+async def probe_service(name: str, url: str) -> dict:
+    start = time.perf_counter()
+    try:
+        resp = await asyncio.wait_for(http_client.get_client(name).get(f"{url}/health"), HEALTH_CHECK_TIMEOUT)
+        result = resp.json() if resp.status_code == 200 else {"status": "unhealthy"}
+    except asyncio.TimeoutError:
+        result = {"status": "timeout"}
+    except Exception:
+        result = {"status": "unreachable"}
+    result["latency_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    return result
+
+async def check_upstream_health(name: str, balancer) -> dict:
+    results = await asyncio.gather(*(probe_service(name, endpoint.url) for endpoint in balancer.endpoints))
+    if len(results) == 1:
+        return results[0]
+    # Plusieurs réplicas : le service est sain tant qu'au moins un réplica l'est
+    healthy = [result for result in results if result.get("status") == "healthy"]
+    return {
+        "status": "healthy" if healthy else results[0].get("status"),
+        "latency_ms": min(result["latency_ms"] for result in healthy or results),
+        "instances": {endpoint.url: result for endpoint, result in zip(balancer.endpoints, results)},
+    }
+
+async def check_services_health() -> dict:
+    # Sondes concurrentes : la durée totale est bornée par HEALTH_CHECK_TIMEOUT
+    results = await asyncio.gather(*(check_upstream_health(name, balancer) for name, balancer in balancers.items()))
+    services = dict(zip(balancers, results))
+    return {
+        "status": "healthy" if all(result.get("status") == "healthy" for result in results) else "degraded",
+        "service": "api-gateway",
+        "timestamp": datetime.utcnow().isoformat(),
+        "services": services,
+    }
+
+class HealthMonitor:
+    def __init__(self):
+        self.snapshot = {"status": "starting", "service": "api-gateway", "services": {}}
+        self.task = None
+
+    async def refresh_forever(self):
+        while True:
+            try:
+                self.snapshot = await check_services_health()
+            except Exception as e:
+                log_structured("Health refresh failed", level="error", error=str(e))
+            await asyncio.sleep(HEALTH_CHECK_INTERVAL)
+
+    def start(self):
+        self.task = asyncio.create_task(self.refresh_forever())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+health_monitor = HealthMonitor()
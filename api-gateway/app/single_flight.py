@@ -0,0 +1,56 @@
+import asyncio
+import hashlib
+from functools import wraps
+from starlette.responses import Response
+from config import SINGLE_FLIGHT_ROUTES
+from metrics import COALESCED_REQUESTS
+from proxy import buffer_response
+
+class SingleFlight:
+    def __init__(self):
+        self.calls = {}
+
+    async def do(self, key, fn):
+        task = self.calls.get(key)
+        if task is None:
+            # Tâche détachée : l'annulation du premier client n'interrompt pas les autres
+            task = asyncio.ensure_future(fn())
+            self.calls[key] = task
+            task.add_done_callback(lambda done: self.forget(key, done))
+            return await asyncio.shield(task), False
+        return await asyncio.shield(task), True
+
+    def forget(self, key, task):
+        if self.calls.get(key) is task:
+            del self.calls[key]
+        if not task.cancelled():
+            task.exception()  # évite "Task exception was never retrieved"
+
+flights = SingleFlight()
+
+def flight_key(request) -> tuple:
+    claims = getattr(request.state, "claims", None) or {}
+    subject = claims.get("sub")
+    if subject is None and "authorization" in request.headers:
+        subject = hashlib.sha256(request.headers["authorization"].encode()).hexdigest()
+    return (request.method, request.url.path, request.url.query, subject)
+
+def single_flight(key):
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(path: str, request):
+            if request.method != "GET" or not any(request.url.path.startswith(prefix) for prefix in SINGLE_FLIGHT_ROUTES):
+                return await func(path, request)
+
+            async def call():
+                response = await buffer_response(await func(path, request))
+                return response.status_code, response.raw_headers, response.body
+
+            (status_code, headers, body), coalesced = await flights.do(flight_key(request), call)
+            if coalesced:
+                COALESCED_REQUESTS.labels(upstream=key).inc()
+            response = Response(content=body, status_code=status_code)
+            response.raw_headers = list(headers)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,233 @@
+import asyncio
+import time
+from collections import defaultdict
+import httpx
+from fastapi import Request, WebSocket
+from fastapi.responses import JSONResponse
+from starlette.background import BackgroundTask
+from starlette.responses import Response, StreamingResponse
+from starlette.websockets import WebSocketState
+from websockets.asyncio.client import connect
+from websockets.exceptions import ConnectionClosed, InvalidHandshake
+from config import (
+    UPSTREAMS,
+    STREAM_MAX_CONNECTIONS,
+    STREAM_IDLE_TIMEOUT,
+    STREAM_MAX_MESSAGE_SIZE,
+    LIMITER_RETRY_AFTER,
+)
+from http_client import http_client
+from load_balancer import balancers
+from logging_config import log_structured
+from metrics import ACTIVE_STREAMS, STREAMS_CLOSED, STREAM_DURATION, STREAM_MESSAGES
+from proxy import downstream_headers, upstream_headers, upstream_url
+
+SSE, WEBSOCKET = "sse", "websocket"
+
+# Négociés par le client websockets lui-même (les sous-protocoles sont relayés via subprotocols=)
+WEBSOCKET_HANDSHAKE_HEADERS = frozenset({
+    "sec-websocket-key",
+    "sec-websocket-version",
+    "sec-websocket-extensions",
+    "sec-websocket-protocol",
+})
+# Codes réservés (RFC 6455 §7.4.1) : constatés localement, jamais envoyés dans une trame de fermeture
+RESERVED_CLOSE_CODES = frozenset({1005, 1006, 1015})
+
+def is_event_stream(request: Request) -> bool:
+    return request.method == "GET" and "text/event-stream" in request.headers.get("accept", "")
+
+def close_code(code, default: int = 1000) -> int:
+    return default if code is None or code in RESERVED_CLOSE_CODES else code
+
+class StreamSlots:
+    # Flux ouverts par upstream, WebSocket et SSE confondus : hors du limiteur adaptatif,
+    # dont ils fausseraient les mesures de latence en occupant durablement sa capacité
+    def __init__(self):
+        self.open = defaultdict(int)
+
+    def try_acquire(self, upstream: str, protocol: str) -> bool:
+        limit = UPSTREAMS.get(upstream, {}).get("stream_max_connections", STREAM_MAX_CONNECTIONS)
+        if self.open[upstream] >= limit:
+            STREAMS_CLOSED.labels(upstream=upstream, protocol=protocol, outcome="rejected").inc()
+            return False
+        self.open[upstream] += 1
+        ACTIVE_STREAMS.labels(upstream=upstream, protocol=protocol).inc()
+        return True
+
+    def release(self, upstream: str, protocol: str, outcome: str, started: float):
+        self.open[upstream] -= 1
+        ACTIVE_STREAMS.labels(upstream=upstream, protocol=protocol).dec()
+        STREAMS_CLOSED.labels(upstream=upstream, protocol=protocol, outcome=outcome).inc()
+        STREAM_DURATION.labels(protocol=protocol).observe(time.monotonic() - started)
+
+slots = StreamSlots()
+
+def idle_timeout(upstream: str) -> float:
+    return UPSTREAMS.get(upstream, {}).get("stream_idle_timeout", STREAM_IDLE_TIMEOUT)
+
+def too_many_streams(upstream: str) -> JSONResponse:
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"{upstream} stream limit reached, retry later"},
+        headers={"Retry-After": str(LIMITER_RETRY_AFTER)},
+    )
+
+async def forward_events(upstream: str, path: str, request: Request) -> Response:
+    if not slots.try_acquire(upstream, SSE):
+        return too_many_streams(upstream)
+    started = time.monotonic()
+    balancer = balancers[upstream]
+    endpoint = balancer.acquire()
+    client = http_client.stream_client
+    # Timeout de lecture = délai maximal entre deux chunks, soit l'inactivité tolérée sur le flux
+    timeout = httpx.Timeout(idle_timeout(upstream), connect=UPSTREAMS[upstream]["connect_timeout"])
+    try:
+        response = await client.send(
+            client.build_request("GET", upstream_url(endpoint.url, path, request), headers=upstream_headers(request), timeout=timeout),
+            stream=True,
+        )
+    except Exception:
+        balancer.release(endpoint, False)
+        slots.release(upstream, SSE, "error", started)
+        raise
+    except BaseException:
+        balancer.release(endpoint, None)
+        slots.release(upstream, SSE, "client_closed", started)
+        raise
+
+    outcome = "upstream_closed"
+    released = False
+    chunks = STREAM_MESSAGES.labels(upstream=upstream, protocol=SSE, direction="downstream")
+
+    async def finish():
+        # Appelé par le finally du flux ou, s'il n'a jamais été itéré, par la tâche de fond.
+        # Comptabilité avant l'await : une annulation ne doit pas laisser le slot occupé
+        nonlocal released
+        if released:
+            return
+        released = True
+        balancer.release(endpoint, response.status_code < 500 and outcome != "error")
+        slots.release(upstream, SSE, outcome, started)
+        await response.aclose()
+
+    async def relay():
+        nonlocal outcome
+        try:
+            # Sans chunk_size : httpx regrouperait les événements jusqu'à remplir un chunk
+            async for chunk in response.aiter_raw():
+                chunks.inc()
+                yield chunk
+        except httpx.ReadTimeout:
+            # Fin de flux côté client : EventSource se reconnecte avec Last-Event-ID
+            outcome = "idle_timeout"
+        except httpx.HTTPError:
+            # Upstream coupé en plein flux : même reconnexion côté client
+            outcome = "error"
+        except (asyncio.CancelledError, GeneratorExit):
+            outcome = "client_closed"
+            raise
+        finally:
+            await finish()
+
+    streamed = StreamingResponse(relay(), status_code=response.status_code, background=BackgroundTask(finish))
+    streamed.raw_headers = downstream_headers(response)
+    return streamed
+
+def websocket_url(base_url: str, path: str, websocket: WebSocket) -> str:
+    # http:// -> ws://, https:// -> wss://
+    return "ws" + upstream_url(base_url, path, websocket)[4:]
+
+async def relay_websocket(upstream: str, websocket: WebSocket, connection, timeout: float) -> str:
+    loop = asyncio.get_running_loop()
+    last_activity = loop.time()
+    sent = STREAM_MESSAGES.labels(upstream=upstream, protocol=WEBSOCKET, direction="upstream")
+    received = STREAM_MESSAGES.labels(upstream=upstream, protocol=WEBSOCKET, direction="downstream")
+
+    async def client_to_upstream():
+        nonlocal last_activity
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                await connection.close(close_code(message.get("code")))
+                return "client_closed"
+            last_activity = loop.time()
+            sent.inc()
+            try:
+                await connection.send(message["text"] if message.get("text") is not None else message["bytes"])
+            except ConnectionClosed:
+                return "upstream_closed"
+
+    async def upstream_to_client():
+        nonlocal last_activity
+        try:
+            async for data in connection:
+                last_activity = loop.time()
+                received.inc()
+                if isinstance(data, str):
+                    await websocket.send_text(data)
+                else:
+                    await websocket.send_bytes(data)
+        except ConnectionClosed:
+            pass
+        except Exception:
+            # Client parti pendant un envoi
+            return "client_closed"
+        return "upstream_closed"
+
+    tasks = [asyncio.ensure_future(client_to_upstream()), asyncio.ensure_future(upstream_to_client())]
+    try:
+        while True:
+            done, _ = await asyncio.wait(tasks, timeout=max(0.0, last_activity + timeout - loop.time()), return_when=asyncio.FIRST_COMPLETED)
+            if done:
+                outcome = done.pop().result()
+                break
+            if loop.time() - last_activity >= timeout:
+                outcome = "idle_timeout"
+                break
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    # Le client reçoit le code de fermeture de l'upstream ; 1001 (going away) après inactivité
+    if outcome == "idle_timeout":
+        await connection.close(1001)
+    if websocket.client_state == WebSocketState.CONNECTED and websocket.application_state == WebSocketState.CONNECTED:
+        code = 1001 if outcome == "idle_timeout" else close_code(connection.close_code, default=1011)
+        await websocket.close(code=code)
+    return outcome
+
+async def proxy_websocket(upstream: str, path: str, websocket: WebSocket):
+    if not slots.try_acquire(upstream, WEBSOCKET):
+        # 1013 "try again later" ; avant accept(), le client voit un refus de la poignée de main (403)
+        await websocket.close(code=1013)
+        return
+    started = time.monotonic()
+    balancer = balancers[upstream]
+    endpoint = balancer.acquire()
+    headers = {
+        key: value for key, value in upstream_headers(websocket).items()
+        if key not in WEBSOCKET_HANDSHAKE_HEADERS
+    }
+    outcome, success = "error", False
+    try:
+        async with connect(
+            websocket_url(endpoint.url, path, websocket),
+            additional_headers=headers,
+            subprotocols=websocket.scope.get("subprotocols") or None,
+            open_timeout=UPSTREAMS[upstream]["connect_timeout"],
+            max_size=STREAM_MAX_MESSAGE_SIZE,
+            # Réseau interne : pas de permessage-deflate ni de proxy HTTP entre la gateway et l'upstream
+            compression=None,
+            proxy=None,
+        ) as connection:
+            success = True
+            await websocket.accept(subprotocol=connection.subprotocol)
+            outcome = await relay_websocket(upstream, websocket, connection, idle_timeout(upstream))
+    except (OSError, InvalidHandshake, asyncio.TimeoutError) as e:
+        log_structured("WebSocket upstream unavailable", level="warning", service=upstream, error=str(e))
+        if websocket.application_state == WebSocketState.CONNECTING:
+            await websocket.close(code=1014)
+    finally:
+        balancer.release(endpoint, success)
+        slots.release(upstream, WEBSOCKET, outcome, started)
@@ -0,0 +1,75 @@
+import atexit
+import logging
+import queue
+import random
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+import orjson
+from prometheus_client import Counter
+
+LOG_RECORDS_DROPPED = Counter(
+    "structured_log_records_dropped_total",
+    "Structured log records dropped because the log queue was full",
+    ["service"]
+)
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+class JsonFormatter(logging.Formatter):
+    # Exécuté dans le thread du QueueListener : la sérialisation ne bloque plus la boucle asyncio
+    def format(self, record):
+        if isinstance(record.msg, dict):
+            record.msg = orjson.dumps(
+                {"timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(), **record.msg},
+                default=str,
+            ).decode()
+        return super().format(record)
+
+class DroppingQueueHandler(QueueHandler):
+    def __init__(self, log_queue, dropped):
+        super().__init__(log_queue)
+        self.dropped = dropped
+
+    def prepare(self, record):
+        # Pas de formatage côté appelant : le dict est sérialisé par le listener
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # File pleine : on perd l'enregistrement plutôt que de ralentir les requêtes
+            self.dropped.inc()
+
+def parse_sample_rates(spec: str) -> dict:
+    rates = {}
+    for item in spec.split(","):
+        level, _, rate = item.strip().partition("=")
+        if level and rate:
+            rates[level.upper()] = float(rate)
+    return rates
+
+class StructuredLogger:
+    def __init__(self, service: str, environment: str, level: str = "INFO", sample_rates: str = "", queue_size: int = 10000):
+        self.service = service
+        self.environment = environment
+        self.level = logging.getLevelName(level.upper())
+        self.sample_rates = parse_sample_rates(sample_rates)
+        self.handler = DroppingQueueHandler(queue.Queue(queue_size), LOG_RECORDS_DROPPED.labels(service=service))
+        output = logging.StreamHandler()
+        output.setFormatter(JsonFormatter(LOG_FORMAT))
+        self.listener = QueueListener(self.handler.queue, output)
+        self.listener.start()
+        # Vide la file avant l'arrêt du processus
+        atexit.register(self.listener.stop)
+
+    def __call__(self, message: str, level: str = "INFO", sampled: bool = False, **kwargs):
+        levelno = logging.getLevelName(level.upper())
+        if levelno < self.level:
+            return
+        # sampled=True : messages à fort volume, échantillonnés selon LOG_SAMPLE_RATES pour leur niveau
+        if sampled and random.random() >= self.sample_rates.get(level.upper(), 1.0):
+            return
+        data = {"environment": self.environment, "service": self.service, "message": message, **kwargs}
+        # LogRecord construit directement : évite findCaller() et la hiérarchie des loggers
+        self.handler.enqueue(logging.LogRecord(self.service, levelno, "", 0, data, None, None))
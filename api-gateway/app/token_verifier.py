@@ -0,0 +1,43 @@
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Optional
+from jose import jwt, JWTError
+from config import JWT_SECRET, JWT_ALGORITHM, JWT_CACHE_SIZE, JWT_CACHE_TTL
+from metrics import JWT_VERIFICATIONS
+
+class TokenVerifier:
+    def __init__(self, max_size: int = JWT_CACHE_SIZE):
+        self.max_size = max_size
+        # digest du token -> (claims, expiration)
+        self.cache = OrderedDict()
+
+    def verify(self, token: str) -> Optional[dict]:
+        key = hashlib.sha256(token.encode()).digest()
+        now = time.time()
+
+        entry = self.cache.get(key)
+        if entry is not None:
+            claims, expires_at = entry
+            if expires_at > now:
+                self.cache.move_to_end(key)
+                JWT_VERIFICATIONS.labels(result="hit").inc()
+                return claims
+            del self.cache[key]
+
+        try:
+            claims = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        except JWTError:
+            JWT_VERIFICATIONS.labels(result="invalid").inc()
+            return None
+        if claims.get("sub") is None:
+            JWT_VERIFICATIONS.labels(result="invalid").inc()
+            return None
+
+        JWT_VERIFICATIONS.labels(result="miss").inc()
+        self.cache[key] = (claims, claims.get("exp", now + JWT_CACHE_TTL))
+        if len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
+        return claims
+
+token_verifier = TokenVerifier()
@@ -0,0 +1,233 @@
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(os.path.dirname(BENCH_DIR), "app")
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from stub_upstream import StubUpstream
+
+UPSTREAM_PREFIXES = ("AUTH_SERVICE", "USER_SERVICE", "MAP_SERVICE", "AI_SERVICE", "REPORT_SERVICE")
+
+# Chaque scénario isole une fonctionnalité du proxy ; setup() ajuste les modules déjà importés
+SCENARIOS = {
+    "health": {
+        "description": "GET /health (snapshot en mémoire, sans proxy) : coût plancher de la gateway",
+        "path": "/health",
+    },
+    "streaming": {
+        "description": "GET proxifié avec relais du corps en streaming",
+        "path": "/api/v1/users/items",
+        "setup": lambda modules: setattr(modules["proxy"], "PROXY_STREAMING", True),
+    },
+    "buffered": {
+        "description": "GET proxifié avec corps chargé en mémoire (PROXY_STREAMING=false)",
+        "path": "/api/v1/users/items",
+        "setup": lambda modules: setattr(modules["proxy"], "PROXY_STREAMING", False),
+        "teardown": lambda modules: setattr(modules["proxy"], "PROXY_STREAMING", True),
+    },
+    "cache_hit": {
+        "description": "GET servi par le cache de réponses (après un premier MISS)",
+        "path": "/api/v1/maps/items",
+        "setup": lambda modules: modules["response_cache"].RESPONSE_CACHE_ROUTES.update({"/api/v1/maps/": 3600}),
+        "teardown": lambda modules: modules["response_cache"].RESPONSE_CACHE_ROUTES.pop("/api/v1/maps/", None),
+    },
+    "breaker_open": {
+        "description": "Upstream en erreur : le circuit s'ouvre et les requêtes échouent sans appel upstream",
+        "path": "/api/v1/reports/items?status=503",
+    },
+    "compression": {
+        "description": "GET proxifié compressé en gzip à la volée",
+        "path": "/api/v1/ais/items",
+        "headers": {"Accept-Encoding": "gzip"},
+    },
+}
+
+def configure_environment(upstream_url: str, log_level: str):
+    for prefix in UPSTREAM_PREFIXES:
+        os.environ[f"{prefix}_URL"] = upstream_url
+    # Le limiteur adaptatif et le rate limiting rejetteraient la charge synthétique : mesurés à part si besoin
+    os.environ.setdefault("LIMITER_ENABLED", "false")
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+    os.environ.setdefault("POOL_WARMUP_CONNECTIONS", "0")
+    os.environ["LOG_LEVEL"] = log_level
+
+def percentile(ordered: list, fraction: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+async def send(client, scenario: dict, headers: dict):
+    response = await client.get(scenario["path"], headers={**headers, **scenario.get("headers", {})})
+    return response.status_code
+
+async def drive(client, scenario: dict, headers: dict, requests: int, concurrency: int) -> dict:
+    latencies = []
+    statuses = Counter()
+    pending = iter(range(requests))
+
+    async def worker():
+        for _ in pending:
+            start = time.perf_counter()
+            status_code = await send(client, scenario, headers)
+            latencies.append(time.perf_counter() - start)
+            statuses[status_code] += 1
+
+    gen0_before = gc.get_stats()[0]["collections"]
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    gen0_collections = gc.get_stats()[0]["collections"] - gen0_before
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(requests / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3),
+        "statuses": {str(code): count for code, count in sorted(statuses.items())},
+        # Une collecte gen0 toutes les ~700 allocations d'objets conteneurs : indicateur de pression d'allocation
+        "gc_gen0_per_1k_requests": round(gen0_collections * 1000 / requests, 2),
+    }
+
+async def measure_allocations(client, scenario: dict, headers: dict, samples: int) -> dict:
+    # Passe séquentielle séparée : tracemalloc ralentit fortement l'interpréteur et fausserait les latences.
+    # Le stub tourne dans le même processus, ses allocations sont donc incluses.
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    peaks = []
+    for _ in range(samples):
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        await send(client, scenario, headers)
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    retained = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    peaks.sort()
+    return {
+        "alloc_peak_bytes_p50": percentile(peaks, 0.50),
+        "alloc_peak_bytes_p99": percentile(peaks, 0.99),
+        "retained_bytes_per_request": round(retained / samples, 1),
+    }
+
+def reset_state(modules: dict):
+    modules["response_cache"].cache.entries.clear()
+    modules["response_cache"].cache.size = 0
+    modules["circuit_breakers"].breakers.clear()
+
+async def run(args) -> dict:
+    import httpx
+    import main
+    import circuit_breakers
+    import proxy
+    import response_cache
+    from config import JWT_SECRET, JWT_ALGORITHM
+    from jose import jwt
+
+    modules = {"proxy": proxy, "response_cache": response_cache, "circuit_breakers": circuit_breakers}
+    token = jwt.encode({"sub": "bench", "exp": int(time.time()) + 3600}, JWT_SECRET, algorithm=JWT_ALGORITHM)
+    headers = {"Authorization": f"Bearer {token}"}
+    results = {}
+
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://gateway", timeout=30) as client:
+            for name in args.scenarios:
+                scenario = SCENARIOS[name]
+                reset_state(modules)
+                if "setup" in scenario:
+                    scenario["setup"](modules)
+                try:
+                    for _ in range(args.warmup):
+                        await send(client, scenario, headers)
+                    result = await drive(client, scenario, headers, args.requests, args.concurrency)
+                    result.update(await measure_allocations(client, scenario, headers, args.alloc_samples))
+                finally:
+                    if "teardown" in scenario:
+                        scenario["teardown"](modules)
+                result["description"] = scenario["description"]
+                results[name] = result
+                print(
+                    f"{name:<14} {result['rps']:>9.1f} req/s  p50 {result['p50_ms']:>8.3f} ms  "
+                    f"p95 {result['p95_ms']:>8.3f} ms  p99 {result['p99_ms']:>8.3f} ms  "
+                    f"peak {result['alloc_peak_bytes_p50']:>8} B  statuses {result['statuses']}"
+                )
+    return results
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def compare(previous_path: str, results: dict):
+    with open(previous_path) as f:
+        previous = json.load(f)["results"]
+    print(f"\nComparaison avec {previous_path} :")
+    for name, result in results.items():
+        if name not in previous:
+            continue
+        before = previous[name]
+        print(
+            f"{name:<14} rps {result['rps'] / before['rps'] - 1:>+7.1%}  "
+            f"p99 {result['p99_ms'] / before['p99_ms'] - 1 if before['p99_ms'] else 0:>+7.1%}  "
+            f"peak {result['alloc_peak_bytes_p50'] - before['alloc_peak_bytes_p50']:>+8} B"
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la gateway contre des upstreams factices")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--warmup", type=int, default=100)
+    parser.add_argument("--alloc-samples", type=int, default=100)
+    parser.add_argument("--payload-size", type=int, default=4096, help="taille du corps renvoyé par le stub (octets)")
+    parser.add_argument("--upstream-latency", type=float, default=0.0, help="latence ajoutée par le stub (secondes)")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--output", help="fichier JSON de résultats (par défaut: benchmarks/results/<date>.json)")
+    parser.add_argument("--compare", help="résultats JSON précédents à comparer")
+    args = parser.parse_args()
+
+    stub = StubUpstream(args.payload_size, args.upstream_latency).start()
+    configure_environment(stub.url, args.log_level)
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        stub.stop()
+
+    output = args.output or os.path.join(BENCH_DIR, "results", f"{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({
+            "meta": {
+                "timestamp": datetime.now().isoformat(),
+                "git_revision": git_revision(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "payload_size": args.payload_size,
+                "upstream_latency": args.upstream_latency,
+                "log_level": args.log_level,
+            },
+            "results": results,
+        }, f, indent=2)
+    print(f"\nRésultats enregistrés dans {output}")
+    if args.compare:
+        compare(args.compare, results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import asyncio
+import threading
+import time
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route, WebSocketRoute
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+# Upstream factice : renvoie un payload JSON pré-calculé, de taille et latence configurables
+# (surchargeables par requête via ?size=, ?delay= et ?status=). Flux : SSE avec Accept: text/event-stream
+# (?events=, ?delay= entre événements) et écho WebSocket sur tout chemin
+class StubUpstream:
+    def __init__(self, payload_size: int = 1024, latency: float = 0.0, port: int = 0):
+        self.payload_size = payload_size
+        self.latency = latency
+        self.port = port
+        self.payloads = {}
+        self.calls = 0
+        self.server = None
+        self.thread = None
+        self.app = Starlette(routes=[
+            Route("/health", self.health),
+            Route("/{path:path}", self.handle, methods=["GET", "POST", "PUT", "PATCH", "DELETE"]),
+            WebSocketRoute("/{path:path}", self.echo),
+        ])
+
+    def payload(self, size: int) -> bytes:
+        if size not in self.payloads:
+            filler = max(0, size - len(b'{"data":""}'))
+            self.payloads[size] = b'{"data":"' + b"x" * filler + b'"}'
+        return self.payloads[size]
+
+    async def health(self, request: Request):
+        return JSONResponse({"status": "healthy", "service": "stub"})
+
+    async def handle(self, request: Request):
+        self.calls += 1
+        await request.body()
+        delay = float(request.query_params.get("delay", self.latency))
+        if "text/event-stream" in request.headers.get("accept", ""):
+            return StreamingResponse(self.events(int(request.query_params.get("events", 3)), delay), media_type="text/event-stream")
+        if delay:
+            await asyncio.sleep(delay)
+        status_code = int(request.query_params.get("status", 200))
+        size = int(request.query_params.get("size", self.payload_size))
+        return Response(self.payload(size), status_code=status_code, media_type="application/json")
+
+    async def events(self, count: int, delay: float):
+        for index in range(count):
+            if delay:
+                await asyncio.sleep(delay)
+            yield f"id: {index}\ndata: event {index}\n\n".encode()
+
+    async def echo(self, websocket: WebSocket):
+        self.calls += 1
+        await websocket.accept(subprotocol=(websocket.scope.get("subprotocols") or [None])[0])
+        try:
+            while True:
+                message = await websocket.receive_text()
+                if message == "close":
+                    await websocket.close(code=4000)
+                    return
+                await websocket.send_text(f"echo:{message}")
+        except WebSocketDisconnect:
+            pass
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self):
+        # Boucle asyncio propre dans un thread : l'upstream tourne dans le même processus que la gateway
+        self.server = uvicorn.Server(uvicorn.Config(self.app, host="127.0.0.1", port=self.port, log_level="error"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        self.port = self.server.servers[0].sockets[0].getsockname()[1]
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.should_exit = True
+            self.thread.join(timeout=5)
@@ -0,0 +1,47 @@
+import os
+import sys
+import time
+import pytest
+
+GATEWAY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(GATEWAY_DIR, "app"))
+sys.path.insert(0, os.path.join(GATEWAY_DIR, "benchmarks"))
+
+from stub_upstream import StubUpstream
+
+# Les modules de la gateway lisent leur configuration à l'import : l'upstream factice doit tourner avant
+stub = StubUpstream(payload_size=64).start()
+for prefix in ("AUTH_SERVICE", "USER_SERVICE", "MAP_SERVICE", "AI_SERVICE", "REPORT_SERVICE"):
+    os.environ[f"{prefix}_URL"] = stub.url
+os.environ.setdefault("POOL_WARMUP_CONNECTIONS", "0")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+os.environ.setdefault("ADMIN_TOKEN", "test-admin-token")
+
+@pytest.fixture(scope="session")
+def stub_upstream():
+    return stub
+
+@pytest.fixture(scope="module")
+def client():
+    from fastapi.testclient import TestClient
+    from main import app
+    with TestClient(app) as client:
+        yield client
+
+@pytest.fixture
+def auth_headers_for():
+    from jose import jwt
+    from config import JWT_SECRET, JWT_ALGORITHM
+
+    def auth_headers_for(subject: str) -> dict:
+        token = jwt.encode({"sub": subject, "exp": int(time.time()) + 60}, JWT_SECRET, algorithm=JWT_ALGORITHM)
+        return {"Authorization": f"Bearer {token}"}
+    return auth_headers_for
+
+@pytest.fixture
+def auth_headers(auth_headers_for):
+    return auth_headers_for("alice")
+
+@pytest.fixture
+def token(auth_headers):
+    return auth_headers["Authorization"].partition(" ")[2]
@@ -0,0 +1,47 @@
+import orjson
+from route_table import route_table
+from services.batch_service import encode_result
+
+def test_batch_returns_one_result_per_request(client, auth_headers):
+    response = client.post("/api/v1/batch", headers=auth_headers, json={"requests": [
+        {"id": "profile", "path": "/api/v1/users/batch"},
+        {"id": "missing", "path": "/api/v1/unknown"},
+        {"id": "encoding", "path": "/api/v1/users/€"},
+    ]})
+    assert response.status_code == 200
+    results = {result["id"]: result for result in response.json()["responses"]}
+    assert results["profile"]["status"] == 200
+    assert results["profile"]["body"] == {"data": "x" * 53}
+    assert results["missing"]["status"] == 404
+    assert results["encoding"]["status"] == 400
+
+def test_failing_sub_request_does_not_fail_batch(client, auth_headers, monkeypatch):
+    route, _ = route_table.match("/api/v1/reports/batch")
+
+    async def broken(path, request):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(route, "proxy", broken)
+    response = client.post("/api/v1/batch", headers=auth_headers, json={"requests": [
+        {"id": "broken", "path": "/api/v1/reports/batch"},
+        {"id": "healthy", "path": "/api/v1/users/batch"},
+    ]})
+    assert response.status_code == 200
+    results = {result["id"]: result["status"] for result in response.json()["responses"]}
+    assert results == {"broken": 502, "healthy": 200}
+
+def test_batch_streams_ndjson(client, auth_headers):
+    response = client.post(
+        "/api/v1/batch",
+        headers={**auth_headers, "Accept": "application/x-ndjson"},
+        json={"requests": [{"path": "/api/v1/users/ndjson"}, {"path": "/api/v1/users/ndjson?size=10"}]},
+    )
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [orjson.loads(line) for line in response.text.splitlines()]
+    assert sorted(line["id"] for line in lines) == ["0", "1"]
+
+def test_invalid_json_body_encoded_as_string():
+    result = orjson.loads(encode_result("a", 200, {}, b'{"truncated', "application/json"))
+    assert result["body"] == '{"truncated'
+    result = orjson.loads(encode_result("b", 200, {}, b'{"ok":true}', "application/json"))
+    assert result["body"] == {"ok": True}
@@ -0,0 +1,65 @@
+from types import SimpleNamespace
+import pytest
+import circuit_breakers
+from circuit_breakers import CLOSED, OPEN, HALF_OPEN, CircuitBreaker, get_breaker
+
+SETTINGS = {"min_calls": 4, "failure_rate": 0.5, "window": 10.0, "buckets": 10, "recovery_timeout": 5.0, "half_open_calls": 2}
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(circuit_breakers, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+def test_state_transitions(clock):
+    breaker = CircuitBreaker("unit", SETTINGS)
+    for success in (True, True, False):
+        breaker.record(breaker.allow(), success)
+    assert breaker.state == CLOSED
+    breaker.record(breaker.allow(), False)
+    assert breaker.state == OPEN
+    assert breaker.allow() is None
+
+    clock.now += SETTINGS["recovery_timeout"]
+    trials = [breaker.allow(), breaker.allow()]
+    assert trials == [HALF_OPEN, HALF_OPEN]
+    assert breaker.allow() is None
+    breaker.record(trials[0], False)
+    assert breaker.state == OPEN
+
+    clock.now += SETTINGS["recovery_timeout"]
+    for _ in range(SETTINGS["half_open_calls"]):
+        breaker.record(breaker.allow(), True)
+    assert breaker.state == CLOSED
+
+def test_failures_outside_window_are_forgotten(clock):
+    breaker = CircuitBreaker("unit", SETTINGS)
+    for _ in range(3):
+        breaker.record(breaker.allow(), False)
+    clock.now += SETTINGS["window"]
+    breaker.record(breaker.allow(), False)
+    assert breaker.state == CLOSED
+
+def test_breaker_recovers_through_gateway(client, auth_headers, stub_upstream):
+    breaker = get_breaker("map_service")
+    for _ in range(breaker.settings["min_calls"]):
+        client.post("/api/v1/maps/test?status=503", headers=auth_headers)
+    assert breaker.state == OPEN
+    assert client.post("/api/v1/maps/test", headers=auth_headers).status_code == 502
+
+    # Délai de récupération écoulé : les appels d'essai atteignent l'upstream et referment le circuit
+    breaker.opened_at -= breaker.settings["recovery_timeout"]
+    calls = stub_upstream.calls
+    for _ in range(breaker.settings["half_open_calls"]):
+        assert client.post("/api/v1/maps/test", headers=auth_headers).status_code == 200
+    assert breaker.state == CLOSED
+    assert stub_upstream.calls == calls + breaker.settings["half_open_calls"]
+
+def test_client_deadline_does_not_trip_breaker(client, auth_headers):
+    breaker = get_breaker("map_service")
+    assert client.post("/api/v1/maps/test", headers={**auth_headers, "X-Deadline-Ms": "0"}).status_code == 504
+    for _ in range(breaker.settings["min_calls"]):
+        response = client.post("/api/v1/maps/test?delay=0.2", headers={**auth_headers, "X-Deadline-Ms": "100"})
+        assert response.status_code == 504
+    assert breaker.state == CLOSED
+    assert client.post("/api/v1/maps/test", headers=auth_headers).status_code == 200
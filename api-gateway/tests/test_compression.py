@@ -0,0 +1,80 @@
+import gzip
+import zlib
+import pytest
+from fastapi.testclient import TestClient
+from starlette.applications import Starlette
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+from compression import CompressionMiddleware, negotiate
+from config import COMPRESSION_MIN_SIZE
+
+BODY = b'{"data":"' + b"x" * COMPRESSION_MIN_SIZE + b'"}'
+
+async def json_body(request):
+    size = int(request.query_params.get("size", len(BODY)))
+    return Response(BODY[:size], media_type="application/json")
+
+async def encoded(request):
+    return Response(gzip.compress(BODY), media_type="application/json", headers={"Content-Encoding": "gzip"})
+
+async def image(request):
+    return Response(BODY, media_type="image/png")
+
+async def stream(request):
+    async def chunks():
+        for _ in range(3):
+            yield BODY
+    return StreamingResponse(chunks(), media_type="application/x-ndjson")
+
+@pytest.fixture(scope="module")
+def client():
+    app = Starlette(routes=[Route("/json", json_body), Route("/encoded", encoded), Route("/image", image), Route("/stream", stream)])
+    app.add_middleware(CompressionMiddleware)
+    with TestClient(app) as client:
+        yield client
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    ("gzip", "gzip"),
+    ("gzip, br;q=0.5", "gzip"),
+    ("gzip;q=0.5, br", "br"),
+    ("gzip, br, zstd", "zstd"),  # qualités égales : préférence du serveur
+    ("*", "zstd"),
+    ("zstd;q=0, *;q=0.8", "br"),
+    ("identity;q=0, gzip", "gzip"),
+    ("gzip;q=0, identity", None),
+    ("*;q=0", None),
+    ("deflate", None),
+    ("", None),
+])
+def test_negotiation(accept_encoding, expected):
+    assert negotiate(accept_encoding) == expected
+
+def test_large_json_compressed(client):
+    response = client.get("/json", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert response.content == BODY
+
+def test_small_body_left_uncompressed(client):
+    response = client.get(f"/json?size={COMPRESSION_MIN_SIZE - 1}", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert response.content == BODY[:COMPRESSION_MIN_SIZE - 1]
+
+def test_uncompressed_response_still_varies(client):
+    response = client.get("/json", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in response.headers
+    assert response.headers["Vary"] == "Accept-Encoding"
+
+@pytest.mark.parametrize("path", ["/encoded", "/image"])
+def test_encoded_and_binary_types_skipped(client, path):
+    response = client.get(path, headers={"Accept-Encoding": "br"})
+    assert response.headers.get("Content-Encoding") != "br"
+    assert "Vary" not in response.headers
+
+def test_streamed_body_compressed_chunk_by_chunk(client):
+    with client.stream("GET", "/stream", headers={"Accept-Encoding": "gzip"}) as response:
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert "Content-Length" not in response.headers
+        raw = b"".join(response.iter_raw())
+    assert zlib.decompress(raw, 31) == BODY * 3
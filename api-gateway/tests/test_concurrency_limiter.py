@@ -0,0 +1,69 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+from starlette.responses import StreamingResponse
+from circuit_breakers import CircuitOpenError
+from concurrency_limiter import AdaptiveLimiter, concurrency_limit, get_limiter
+from config import LIMITER_BACKOFF_RATIO, LIMITER_PRIORITY_RESERVE
+
+def test_limit_grows_while_latency_stays_low():
+    limiter = AdaptiveLimiter("unit")
+    initial = limiter.limit
+    for _ in range(int(initial)):
+        assert limiter.try_acquire(priority=False)
+        limiter.release(0.01, True)
+    assert initial + 0.9 < limiter.limit < initial + 1.1
+
+def test_limit_backs_off_on_latency_and_failures():
+    limiter = AdaptiveLimiter("unit")
+    initial = limiter.limit
+    limiter.try_acquire(priority=False)
+    limiter.release(0.01, True)
+    limiter.try_acquire(priority=False)
+    limiter.release(0.5, True)
+    assert limiter.limit == pytest.approx((initial + 1 / initial) * LIMITER_BACKOFF_RATIO)
+
+    # Une seule réduction par RTT pour un même épisode de congestion
+    limiter.try_acquire(priority=False)
+    limiter.release(0.01, False)
+    assert limiter.limit == pytest.approx((initial + 1 / initial) * LIMITER_BACKOFF_RATIO)
+
+def test_permit_held_until_streamed_body_ends():
+    @concurrency_limit("unit-stream")
+    async def proxy(path, request):
+        async def body():
+            yield b"chunk"
+        return StreamingResponse(body())
+
+    async def scenario():
+        limiter = get_limiter("unit-stream")
+        response = await proxy("/", SimpleNamespace(method="GET"))
+        assert limiter.in_flight == 1
+        assert [chunk async for chunk in response.body_iterator] == [b"chunk"]
+        assert limiter.in_flight == 0
+
+    asyncio.run(scenario())
+
+def test_reads_shed_before_writes(client, auth_headers, monkeypatch):
+    limiter = get_limiter("report_service")
+    monkeypatch.setattr(limiter, "in_flight", int(limiter.limit * (1 - LIMITER_PRIORITY_RESERVE)))
+    response = client.get("/api/v1/reports/limited", headers=auth_headers)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"]
+    assert client.post("/api/v1/reports/limited", headers=auth_headers).status_code == 200
+
+def test_open_circuit_does_not_shrink_limit():
+    @concurrency_limit("unit-open")
+    async def proxy(path, request):
+        raise CircuitOpenError("unit-open")
+
+    async def scenario():
+        limiter = get_limiter("unit-open")
+        initial = limiter.limit
+        for _ in range(5):
+            with pytest.raises(CircuitOpenError):
+                await proxy("/", SimpleNamespace(method="GET"))
+        assert limiter.limit == initial
+        assert limiter.in_flight == 0
+
+    asyncio.run(scenario())
@@ -1,85 +1,65 @@
-# import pytest
-# from httpx import AsyncClient
-# from ..main import app
+from introspection import recent_requests
+from route_table import route_table
 
-# @pytest.mark.asyncio
-# async def test_health():
-#     async with AsyncClient(app=app, base_url="http://test") as ac:
-#         response = await ac.get("/health")
-#     assert response.status_code == 200
-#     assert response.json() == {"status": "ok"} 
-
-import pytest
-from fastapi.testclient import TestClient
-from unittest.mock import AsyncMock, patch
-from app.main import app
-
-client = TestClient(app)
-
-@pytest.fixture
-def mock_auth_service():
-    with patch("app.main.http_client.get", new_callable=AsyncMock) as mock_get:
-        mock_get.return_value.status_code = 200
-        mock_get.return_value.json.return_value = {"message": "Auth OK"}
-        yield mock_get
-
-@pytest.fixture
-def mock_user_service():
-    with patch("app.main.http_client.get", new_callable=AsyncMock) as mock_get:
-        mock_get.return_value.status_code = 200
-        mock_get.return_value.json.return_value = {"message": "User OK"}
-        yield mock_get
-
-def test_health_check():
+def test_health_check(client):
     response = client.get("/health")
     assert response.status_code == 200
-    assert response.json() == {"status": "ok"}
+    assert response.json()["service"] == "api-gateway"
 
-def test_metrics_exposed():
+def test_metrics_exposed(client):
+    client.get("/health")
     response = client.get("/metrics")
     assert response.status_code == 200
-    assert "gateway_request_duration_seconds" in response.text
+    assert "api_gateway_request_duration_seconds" in response.text
 
-def test_request_id_header():
-    response = client.get("/health")
-    assert "X-Request-ID" in response.headers
-    assert response.headers["X-Request-ID"] != ""
+def test_request_id_header(client):
+    response = client.get("/health", headers={"X-Request-ID": "abc"})
+    assert response.headers["X-Request-ID"] == "abc"
 
-def test_process_time_header():
+def test_process_time_header(client):
     response = client.get("/health")
-    assert "X-Process-Time" in response.headers
     assert float(response.headers["X-Process-Time"]) > 0
 
-@pytest.mark.asyncio
-async def test_auth_proxy(mock_auth_service):
-    with patch("app.main.http_client.request", new_callable=AsyncMock) as mock_request:
-        mock_request.return_value.status_code = 200
-        mock_request.return_value.json.return_value = {"message": "Auth Proxy OK"}
-
-        response = client.get("/auth/verify", headers={"Authorization": "Bearer dummy"})
-        assert response.status_code == 200
-        assert response.json() == {"message": "Auth Proxy OK"}
-
-@pytest.mark.asyncio
-async def test_user_proxy(mock_user_service):
-    with patch("app.main.http_client.request", new_callable=AsyncMock) as mock_request:
-        mock_request.return_value.status_code = 200
-        mock_request.return_value.json.return_value = {"message": "User Proxy OK"}
-
-        response = client.get("/users/profile", headers={"Authorization": "Bearer dummy"})
-        assert response.status_code == 200
-        assert response.json() == {"message": "User Proxy OK"}
-
-@pytest.mark.asyncio
-async def test_circuit_breaker_triggers():
-    with patch("app.main.http_client.request", new_callable=AsyncMock) as mock_request:
-        mock_request.side_effect = Exception("Service down")
-
-        for _ in range(3):
-            client.get("/users/test", headers={"Authorization": "Bearer dummy"})
+def test_auth_verify(client, auth_headers):
+    response = client.get("/auth/verify", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json() == {"username": "alice", "valid": True}
+    assert client.get("/auth/verify", headers={"Authorization": "Bearer dummy"}).status_code == 401
 
-        # Le circuit breaker est ouvert maintenant
-        response = client.get("/users/test", headers={"Authorization": "Bearer dummy"})
-        assert response.status_code == 503
-        assert response.json()["detail"] == "User Service temporarily unavailable"
+def test_auth_verify_on_unprotected_route(client, monkeypatch):
+    route, _ = route_table.match("/auth/verify")
+    monkeypatch.setattr(route, "auth", False)
+    assert client.get("/auth/verify").status_code == 401
 
+def test_user_proxy(client, auth_headers):
+    response = client.get("/api/v1/users/profile", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json()["data"]
+    assert client.get("/api/v1/users/profile").status_code == 401
+
+def test_cors_headers_on_rejection(client):
+    response = client.get("/api/v1/users/profile", headers={"Origin": "https://app.example"})
+    assert response.status_code == 401
+    assert response.headers["Access-Control-Allow-Origin"] == "*"
+
+def test_circuit_breaker_triggers(client, auth_headers, stub_upstream):
+    for _ in range(10):
+        client.get("/api/v1/reports/test?status=503", headers=auth_headers)
+
+    # Le circuit est ouvert : la requête échoue sans solliciter l'upstream
+    calls = stub_upstream.calls
+    response = client.get("/api/v1/reports/test", headers=auth_headers)
+    assert response.status_code == 502
+    assert "temporarily unavailable" in response.json()["detail"]
+    assert stub_upstream.calls == calls
+
+def test_admin_stats(client, auth_headers):
+    assert client.get("/admin/stats").status_code == 401
+    # Requêtes des autres modules de test écartées : /auth/verify doit figurer parmi les plus lentes
+    recent_requests.entries.clear()
+    client.get("/auth/verify", headers=auth_headers)
+    response = client.get("/admin/stats", headers={"Authorization": "Bearer test-admin-token"})
+    assert response.status_code == 200
+    stats = response.json()
+    assert stats["pools"]["auth_service"]["max"] > 0
+    assert any(request["route"] == "/auth/verify" for request in stats["slowest_requests"])
@@ -0,0 +1,53 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+import hedging
+from hedging import budgets, hedge_delay, latencies, send_hedged
+from load_balancer import LoadBalancer
+
+@pytest.fixture
+def hedged_route(monkeypatch):
+    monkeypatch.setattr(hedging, "HEDGE_ROUTES", ["/api/v1/users/"])
+
+def make_request(method, path="/api/v1/users/hedge"):
+    return SimpleNamespace(method=method, url=SimpleNamespace(path=path))
+
+def test_slow_primary_triggers_exactly_one_hedge():
+    balancer = LoadBalancer("unit-hedge", ["http://a", "http://b"])
+    primary = balancer.endpoints[0]
+    budgets["unit-hedge"].tokens = 5
+    attempts = []
+
+    async def attempt(endpoint):
+        attempts.append(endpoint)
+        await asyncio.sleep(1 if endpoint is primary else 0)
+
+        async def aclose():
+            pass
+        return SimpleNamespace(aclose=aclose)
+
+    async def scenario():
+        # P2C : force le choix du premier réplica comme primaire
+        balancer.endpoints[1].in_flight = 1
+        winner, _ = await send_hedged("unit-hedge", balancer, attempt, 0.01)
+        return winner
+
+    winner = asyncio.run(scenario())
+    assert len(attempts) == 2
+    assert attempts[0] is primary and winner is attempts[1] is not primary
+    assert budgets["unit-hedge"].tokens == 4
+
+def test_writes_never_hedged(hedged_route, monkeypatch):
+    balancer = LoadBalancer("unit-hedge", ["http://a", "http://b"])
+    monkeypatch.setattr(latencies["unit-hedge"], "threshold", 0.05)
+    assert hedge_delay("unit-hedge", balancer, make_request("GET")) == 0.05
+    for method in ("POST", "PUT", "PATCH", "DELETE"):
+        assert hedge_delay("unit-hedge", balancer, make_request(method)) is None
+
+def test_only_eligible_requests_feed_latency_percentile(client, auth_headers, hedged_route):
+    tracker = latencies["user_service"]
+    recorded = tracker.recorded
+    client.post("/api/v1/users/hedge", headers=auth_headers)
+    assert tracker.recorded == recorded
+    client.get("/api/v1/users/hedge", headers=auth_headers)
+    assert tracker.recorded == recorded + 1
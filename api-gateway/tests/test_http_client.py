@@ -0,0 +1,13 @@
+from types import SimpleNamespace
+from http_client import http_client
+
+def test_pool_stats_count_kept_alive_connections(client, auth_headers):
+    assert client.get("/api/v1/users/pooled", headers=auth_headers).status_code == 200
+    stats = http_client.pool_stats("user_service")
+    assert stats["idle"] >= 1
+    assert stats["active"] >= 0
+
+def test_pool_stats_without_pool_internals(monkeypatch):
+    monkeypatch.setitem(http_client.transports, "unit", SimpleNamespace())
+    assert http_client.pool_stats("unit") == {"active": 0, "idle": 0}
+    assert http_client.pool_stats("unknown") == {"active": 0, "idle": 0}
@@ -0,0 +1,15 @@
+def test_retry_replays_stored_response(client, stub_upstream):
+    headers = {"Idempotency-Key": "register-alice"}
+    first = client.post("/auth/register", json={"username": "alice"}, headers=headers)
+    calls = stub_upstream.calls
+    retry = client.post("/auth/register", json={"username": "alice"}, headers=headers)
+    assert retry.status_code == first.status_code == 200
+    assert retry.content == first.content
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert stub_upstream.calls == calls
+
+def test_key_reused_with_different_body(client):
+    headers = {"Idempotency-Key": "register-bob"}
+    client.post("/auth/register", json={"username": "bob"}, headers=headers)
+    response = client.post("/auth/register", json={"username": "mallory"}, headers=headers)
+    assert response.status_code == 422
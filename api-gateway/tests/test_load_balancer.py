@@ -0,0 +1,61 @@
+import socket
+import time
+from types import SimpleNamespace
+import pytest
+import load_balancer
+from circuit_breakers import get_breaker
+from config import LB_EJECTION_THRESHOLD, LB_EJECTION_TIME
+from load_balancer import LoadBalancer, balancers
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(load_balancer, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+def fail(balancer: LoadBalancer, endpoint):
+    endpoint.in_flight += 1
+    balancer.release(endpoint, False)
+
+def test_p2c_prefers_least_loaded():
+    balancer = LoadBalancer("unit", ["http://a", "http://b"])
+    busy, idle = balancer.endpoints
+    busy.in_flight = 3
+    assert all(balancer.choose() is idle for _ in range(20))
+
+def test_ejection_and_recovery(clock):
+    balancer = LoadBalancer("unit", ["http://a", "http://b"])
+    faulty, healthy = balancer.endpoints
+    for _ in range(LB_EJECTION_THRESHOLD):
+        fail(balancer, faulty)
+    assert all(balancer.choose() is healthy for _ in range(20))
+
+    clock.now += LB_EJECTION_TIME
+    assert any(balancer.choose() is faulty for _ in range(50))
+
+def test_single_replica_never_ejected(clock):
+    balancer = LoadBalancer("unit", ["http://a"])
+    for _ in range(LB_EJECTION_THRESHOLD):
+        fail(balancer, balancer.endpoints[0])
+    assert balancer.endpoints[0].is_available(clock.now)
+
+def test_dead_replica_ejected_through_gateway(client, auth_headers, stub_upstream, monkeypatch):
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        dead_url = f"http://127.0.0.1:{probe.getsockname()[1]}"
+    # Le breaker de l'upstream ne doit pas s'ouvrir pendant que le réplica mort accumule ses échecs
+    monkeypatch.setitem(get_breaker("user_service").settings, "min_calls", 10_000)
+    balancer = balancers["user_service"]
+    urls = balancer.urls
+    balancer.set_urls([dead_url, stub_upstream.url], False)
+    try:
+        dead = balancer.endpoints[0]
+        for index in range(100):
+            client.get(f"/api/v1/users/lb?n={index}", headers=auth_headers)
+            if not dead.is_available(time.monotonic()):
+                break
+        assert not dead.is_available(time.monotonic())
+        for index in range(10):
+            assert client.get(f"/api/v1/users/lb?after={index}", headers=auth_headers).status_code == 200
+    finally:
+        balancer.set_urls(urls, False)
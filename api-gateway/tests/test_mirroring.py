@@ -0,0 +1,69 @@
+import asyncio
+import socket
+from types import SimpleNamespace
+import httpx
+import pytest
+from starlette.requests import Request
+from starlette.responses import Response
+import mirroring
+from mirroring import ShadowTraffic, mirror
+
+def make_request(method="GET", query=b""):
+    scope = {
+        "type": "http", "method": method, "path": "/unit/items", "raw_path": b"/unit/items",
+        "query_string": query, "headers": [(b"host", b"gateway")], "state": {},
+    }
+    return Request(scope)
+
+async def primary(path, request):
+    return Response(b"primary", status_code=201)
+
+@pytest.fixture
+def shadow(monkeypatch):
+    settings = {"shadow_url": "", "shadow_sample_rate": 1.0}
+    monkeypatch.setitem(mirroring.UPSTREAMS, "unit-shadow", settings)
+    monkeypatch.setattr(mirroring, "random", SimpleNamespace(random=lambda: 0.5))
+    return settings
+
+@pytest.fixture(autouse=True)
+def restore_shadows(monkeypatch):
+    monkeypatch.setattr(mirroring, "shadows", mirroring.shadows)
+
+def replay(request, timeout=1.0):
+    # Réponse primaire, puis nombre de shadows lancés une fois tous terminés
+    async def scenario():
+        traffic = ShadowTraffic()
+        traffic.client = httpx.AsyncClient(timeout=timeout)
+        mirroring.shadows = traffic
+        try:
+            response = await mirror("unit-shadow", "/shadow")(primary)("/items", request)
+            pending = set(traffic.tasks)
+            await asyncio.gather(*pending)
+            return response, len(pending)
+        finally:
+            await traffic.stop()
+    return asyncio.run(scenario())
+
+def test_shadow_failure_never_reaches_client(shadow):
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        shadow["shadow_url"] = f"http://127.0.0.1:{probe.getsockname()[1]}"
+    response, mirrored = replay(make_request())
+    assert mirrored == 1
+    assert (response.status_code, response.body) == (201, b"primary")
+
+def test_slow_shadow_does_not_delay_primary(shadow, stub_upstream):
+    # Shadow encore en cours quand la réponse primaire est rendue, puis abandonné à l'expiration
+    shadow["shadow_url"] = stub_upstream.url
+    response, mirrored = replay(make_request(query=b"delay=0.5"), timeout=0.05)
+    assert mirrored == 1
+    assert (response.status_code, response.body) == (201, b"primary")
+
+def test_sampling_respected(shadow, stub_upstream):
+    shadow["shadow_url"] = stub_upstream.url
+    shadow["shadow_sample_rate"] = 0.4
+    assert replay(make_request())[1] == 0
+    shadow["shadow_sample_rate"] = 0.6
+    assert replay(make_request())[1] == 1
+    # Méthodes hors SHADOW_METHODS jamais rejouées
+    assert replay(make_request("POST"))[1] == 0
@@ -0,0 +1,39 @@
+import pytest
+from fastapi.testclient import TestClient
+import middlewares.rate_limit
+from main import app
+from rate_limiter import rate_limiter
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(middlewares.rate_limit, "RATE_LIMIT_ENABLED", True)
+    rate_limiter.buckets.clear()
+    with TestClient(app) as client:
+        yield client
+
+def test_token_bucket_refills():
+    rule = {"prefix": "/auth/login", "limit": 2, "window": 1.0, "key": "ip"}
+    assert rate_limiter.check_local(rule, "unit", 100.0).allowed
+    assert rate_limiter.check_local(rule, "unit", 100.0).allowed
+    refused = rate_limiter.check_local(rule, "unit", 100.0)
+    assert not refused.allowed and refused.headers["Retry-After"] == "1"
+    assert rate_limiter.check_local(rule, "unit", 100.5).allowed
+
+def test_login_limited_with_headers(client):
+    for remaining in range(4, -1, -1):
+        response = client.post("/auth/login", json={"username": "alice", "password": "x"})
+        assert response.headers["RateLimit-Limit"] == "5"
+        assert response.headers["RateLimit-Remaining"] == str(remaining)
+
+    response = client.post("/auth/login", json={"username": "alice", "password": "x"})
+    assert response.status_code == 429
+    assert response.headers["RateLimit-Remaining"] == "0"
+    assert int(response.headers["Retry-After"]) >= 1
+
+def test_refusal_carries_cors_headers(client):
+    origin = {"Origin": "https://app.example"}
+    for _ in range(5):
+        client.post("/auth/login", json={"username": "bob", "password": "x"}, headers=origin)
+    response = client.post("/auth/login", json={"username": "bob", "password": "x"}, headers=origin)
+    assert response.status_code == 429
+    assert response.headers["Access-Control-Allow-Origin"] == "*"
@@ -0,0 +1,121 @@
+import asyncio
+from types import SimpleNamespace
+import httpx
+import pytest
+from starlette.requests import Request
+from starlette.responses import Response
+import response_cache
+from config import RESPONSE_CACHE_STALE_WHILE_REVALIDATE
+from response_cache import CachedResponse, ResponseCache
+
+TTL = 30
+
+class Upstream:
+    def __init__(self):
+        self.calls = 0
+        self.status_code = 200
+        self.headers = {}
+        self.error = None
+
+    async def __call__(self, path, request):
+        self.calls += 1
+        await asyncio.sleep(0)
+        if self.error is not None:
+            raise self.error
+        return Response(b'{"call":%d}' % self.calls, status_code=self.status_code, media_type="application/json", headers=self.headers)
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(response_cache, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+@pytest.fixture
+def upstream(monkeypatch, clock):
+    monkeypatch.setattr(response_cache, "cache", ResponseCache())
+    upstream = Upstream()
+    upstream.proxy = response_cache.response_cache("/unit/", TTL)(upstream)
+    return upstream
+
+def make_request(method="GET", headers=None, subject="alice"):
+    raw_headers = [(key.lower().encode(), value.encode()) for key, value in (headers or {}).items()]
+    scope = {
+        "type": "http", "method": method, "path": "/unit/items", "raw_path": b"/unit/items",
+        "query_string": b"", "headers": raw_headers, "state": {"claims": {"sub": subject}},
+    }
+    return Request(scope)
+
+def fetch(upstream, method="GET", headers=None):
+    return asyncio.run(upstream.proxy("/items", make_request(method, headers)))
+
+def test_miss_then_hit(upstream):
+    first = fetch(upstream)
+    assert first.headers["X-Cache"] == "MISS"
+    second = fetch(upstream)
+    assert second.headers["X-Cache"] == "HIT"
+    assert second.body == first.body == b'{"call":1}'
+    assert upstream.calls == 1
+
+def test_conditional_hit_returns_304(upstream):
+    etag = fetch(upstream).headers["ETag"]
+    response = fetch(upstream, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert upstream.calls == 1
+
+def test_unsafe_methods_invalidate(upstream):
+    fetch(upstream)
+    for method in ("HEAD", "OPTIONS"):
+        fetch(upstream, method)
+    assert fetch(upstream).headers["X-Cache"] == "HIT"
+    fetch(upstream, "POST")
+    assert fetch(upstream).headers["X-Cache"] == "MISS"
+
+def test_lru_eviction_is_bounded_in_bytes(clock):
+    def entry():
+        return CachedResponse("/unit/", 200, [], b"x" * 100, '"e"', TTL)
+    cache = ResponseCache(max_bytes=250)
+    cache.set("a", entry())
+    cache.set("b", entry())
+    assert cache.get("a") is not None  # "a" redevient le plus récent
+    cache.set("c", entry())
+    assert list(cache.entries) == ["a", "c"]
+    assert cache.size == 200
+    cache.set("huge", CachedResponse("/unit/", 200, [], b"x" * 300, '"e"', TTL))
+    assert "huge" not in cache.entries
+
+def test_stale_while_revalidate_refreshes_once(upstream, clock):
+    fetch(upstream)
+    clock.now += TTL
+
+    async def scenario():
+        responses = await asyncio.gather(*(upstream.proxy("/items", make_request()) for _ in range(5)))
+        assert {response.headers["X-Cache"] for response in responses} == {"STALE"}
+        assert all(response.body == b'{"call":1}' for response in responses)
+        await asyncio.gather(*response_cache.cache.revalidating.values())
+
+    asyncio.run(scenario())
+    assert upstream.calls == 2
+    response = fetch(upstream)
+    assert response.headers["X-Cache"] == "HIT"
+    assert response.body == b'{"call":2}'
+
+@pytest.mark.parametrize("failure", ["status", "exception"])
+def test_stale_if_error(upstream, clock, failure):
+    fetch(upstream)
+    clock.now += TTL + RESPONSE_CACHE_STALE_WHILE_REVALIDATE
+    if failure == "status":
+        upstream.status_code = 503
+    else:
+        upstream.error = httpx.ConnectError("refused")
+    response = fetch(upstream)
+    assert response.status_code == 200
+    assert response.headers["X-Cache"] == "STALE"
+    assert response.body == b'{"call":1}'
+
+def test_must_revalidate_disables_stale_copies(upstream, clock):
+    upstream.headers = {"Cache-Control": "max-age=30, must-revalidate"}
+    fetch(upstream)
+    clock.now += TTL
+    upstream.status_code = 503
+    assert fetch(upstream).status_code == 503
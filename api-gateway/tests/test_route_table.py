@@ -0,0 +1,9 @@
+from route_table import Route, RouteTrie
+
+def test_longest_prefix_match():
+    trie = RouteTrie([Route("/api/v1/users", "user_service"), Route("/api/v1/users/admin", "auth_service")])
+    route, path = trie.match("/api/v1/users/42/")
+    assert route.upstream == "user_service" and path == "/42/"
+    route, path = trie.match("/api/v1/users/admin/audit")
+    assert route.upstream == "auth_service" and path == "/audit"
+    assert trie.match("/api/v1/usersX")[0] is None
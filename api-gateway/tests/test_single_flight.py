@@ -0,0 +1,45 @@
+import asyncio
+import pytest
+from starlette.requests import Request
+from starlette.responses import Response
+import single_flight
+
+@pytest.fixture
+def upstream(monkeypatch):
+    monkeypatch.setattr(single_flight, "SINGLE_FLIGHT_ROUTES", ["/unit/"])
+    calls = []
+
+    async def fetch(path, request):
+        calls.append(request.state.claims["sub"])
+        await asyncio.sleep(0.01)
+        return Response(b'{"ok":true}', media_type="application/json")
+
+    fetch.calls = calls
+    fetch.proxy = single_flight.single_flight("unit")(fetch)
+    return fetch
+
+def make_request(subject, method="GET"):
+    scope = {
+        "type": "http", "method": method, "path": "/unit/items", "raw_path": b"/unit/items",
+        "query_string": b"page=1", "headers": [], "state": {"claims": {"sub": subject}},
+    }
+    return Request(scope)
+
+def gather(upstream, requests):
+    async def scenario():
+        return await asyncio.gather(*(upstream.proxy("/items", request) for request in requests))
+    return asyncio.run(scenario())
+
+def test_identical_reads_collapse_into_one_call(upstream):
+    responses = gather(upstream, [make_request("alice") for _ in range(10)])
+    assert upstream.calls == ["alice"]
+    assert all(response.status_code == 200 and response.body == b'{"ok":true}' for response in responses)
+    assert not single_flight.flights.calls
+
+def test_subjects_never_share_a_flight(upstream):
+    gather(upstream, [make_request(subject) for subject in ("alice", "bob", "alice", "bob")])
+    assert sorted(upstream.calls) == ["alice", "bob"]
+
+def test_writes_not_coalesced(upstream):
+    gather(upstream, [make_request("alice", "POST") for _ in range(3)])
+    assert upstream.calls == ["alice"] * 3
@@ -0,0 +1,30 @@
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+def test_sse_pass_through(client, token):
+    headers = {"Authorization": f"Bearer {token}", "Accept": "text/event-stream", "Accept-Encoding": "identity"}
+    response = client.get("/api/v1/ais/progress?events=2", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.text == "id: 0\ndata: event 0\n\nid: 1\ndata: event 1\n\n"
+
+def test_sse_not_compressed(client, token):
+    headers = {"Authorization": f"Bearer {token}", "Accept": "text/event-stream", "Accept-Encoding": "gzip"}
+    response = client.get("/api/v1/ais/progress?events=2", headers=headers)
+    assert "content-encoding" not in response.headers
+    assert response.text.startswith("id: 0\ndata: event 0\n\n")
+
+def test_websocket_pass_through(client, token):
+    with client.websocket_connect(f"/api/v1/ais/live?access_token={token}") as websocket:
+        websocket.send_text("ping")
+        assert websocket.receive_text() == "echo:ping"
+        websocket.send_text("close")
+        with pytest.raises(WebSocketDisconnect) as closed:
+            websocket.receive_text()
+        assert closed.value.code == 4000
+
+def test_websocket_requires_token(client):
+    with pytest.raises(WebSocketDisconnect) as closed:
+        with client.websocket_connect("/api/v1/ais/live"):
+            pass
+    assert closed.value.code == 1008
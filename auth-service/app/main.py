@@ -4,14 +4,20 @@ from pydantic import BaseModel, EmailStr, validator
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
+import asyncio
 import asyncpg
 import os
 import logging
 import json
+import hmac
 from typing import Optional
 from contextlib import asynccontextmanager
 from prometheus_client import Counter, Histogram, generate_latest
-from fastapi.responses import PlainTextResponse
+from instrumentation import MetricsMiddleware, metrics_registry
+from deadline import DeadlineMiddleware, remaining
+from structured_logging import StructuredLogger
+from loop_monitor import LoopMonitor
+from fastapi.responses import PlainTextResponse, JSONResponse
 import time
 
 # Configuration
@@ -25,23 +31,23 @@ DB_HOST = os.getenv("POSTGRES_HOST", "postgres")
 DB_PORT = os.getenv("POSTGRES_PORT", "5432")
 ENVIRONMENT = os.getenv("ENVIRONMENT", "development")
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOOP_MONITOR_INTERVAL = float(os.getenv("LOOP_MONITOR_INTERVAL", "0.5"))
+LOOP_SLOW_CALLBACK_THRESHOLD = float(os.getenv("LOOP_SLOW_CALLBACK_THRESHOLD", "0.1"))
+INTERNAL_AUTH_TOKEN = os.getenv("INTERNAL_AUTH_TOKEN", "")
 
 # Logging configuration
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     level=getattr(logging, LOG_LEVEL.upper())
 )
-logger = logging.getLogger(__name__)
 
-def log_structured(message: str, **kwargs):
-    log_data = {
-        "timestamp": datetime.utcnow().isoformat(),
-        "environment": ENVIRONMENT,
-        "service": "auth-service",
-        "message": message,
-        **kwargs
-    }
-    logger.info(json.dumps(log_data))
+# JSON logs are queued and written by a background thread
+log_structured = StructuredLogger("auth-service", ENVIRONMENT, LOG_LEVEL, LOG_SAMPLE_RATES, LOG_QUEUE_SIZE)
+
+# Loop lag histogram, plus a stack snapshot of any callback blocking the loop longer than the threshold
+loop_monitor = LoopMonitor("auth-service", LOOP_MONITOR_INTERVAL, LOOP_SLOW_CALLBACK_THRESHOLD, log_structured)
 
 # Models
 class UserLogin(BaseModel):
@@ -120,7 +126,8 @@ class DatabaseConnection:
     
     @asynccontextmanager
     async def acquire(self):
-        async with self.pool.acquire() as connection:
+        # Waiting for a free connection counts against the request deadline too
+        async with self.pool.acquire(timeout=remaining()) as connection:
             yield connection
 
 db_connection = DatabaseConnection()
@@ -146,13 +153,28 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(HTTPBearer())):
+def trusted_gateway_claims(request: Request) -> Optional[dict]:
+    # Claims already verified by the API gateway, only trusted with the shared internal token
+    if not INTERNAL_AUTH_TOKEN:
+        return None
+    if not hmac.compare_digest(request.headers.get("x-internal-auth", ""), INTERNAL_AUTH_TOKEN):
+        return None
+    claims = request.headers.get("x-auth-claims")
+    return json.loads(claims) if claims else None
+
+async def get_current_user(request: Request, credentials: HTTPAuthorizationCredentials = Depends(HTTPBearer())):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     
+    claims = trusted_gateway_claims(request)
+    if claims is not None:
+        if claims.get("sub") is None:
+            raise credentials_exception
+        return TokenData(username=claims["sub"])
+    
     try:
         payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -172,10 +194,12 @@ REQUEST_LATENCY = Histogram('auth_service_request_duration_seconds', 'Request la
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
+    loop_monitor.start()
     await db_connection.init_pool()
     await init_database()
     yield
     # Shutdown
+    await loop_monitor.stop()
     await db_connection.close_pool()
 
 app = FastAPI(
@@ -185,20 +209,9 @@ app = FastAPI(
 ) 
 
 # Middleware for metrics
-@app.middleware("http")
-async def collect_metrics(request: Request, call_next):
-    start_time = time.time()
-    response = await call_next(request)
-    process_time = time.time() - start_time
-
-    endpoint = request.url.path
-    method = request.method
-    status_code = response.status_code
-
-    REQUEST_COUNT.labels(method=method, endpoint=endpoint, status_code=status_code).inc()
-    REQUEST_LATENCY.labels(method=method, endpoint=endpoint, status_code=status_code).observe(process_time)
-
-    return response
+# Enforces the gateway's X-Deadline-Ms and cancels work for disconnected clients
+app.add_middleware(DeadlineMiddleware)
+app.add_middleware(MetricsMiddleware, request_count=REQUEST_COUNT, request_latency=REQUEST_LATENCY)
 
 # Database initialization
 async def init_database():
@@ -239,7 +252,7 @@ async def health_check():
 
 @app.get("/metrics")
 async def metrics():
-    return PlainTextResponse(generate_latest())
+    return PlainTextResponse(generate_latest(metrics_registry()))
 
 @app.post("/register", response_model=dict, status_code=status.HTTP_201_CREATED)
 async def register(user: UserRegister):
@@ -249,7 +262,8 @@ async def register(user: UserRegister):
         # Check if user exists
         existing_user = await conn.fetchrow(
             "SELECT id FROM users WHERE username = $1 OR email = $2",
-            user.username, user.email
+            user.username, user.email,
+            timeout=remaining()
         )
         
         if existing_user:
@@ -269,12 +283,15 @@ async def register(user: UserRegister):
                 VALUES ($1, $2, $3, $4)
                 RETURNING id
                 """,
-                user.username, user.email, hashed_password, user.full_name
+                user.username, user.email, hashed_password, user.full_name,
+                timeout=remaining()
             )
             
             log_structured("User registered successfully", user_id=user_id, username=user.username)
             return {"message": "User registered successfully", "user_id": user_id}
             
+        except asyncio.TimeoutError:
+            raise
         except Exception as e:
             log_structured("Registration error", error=str(e), level="ERROR")
             raise HTTPException(
@@ -289,7 +306,8 @@ async def login(user_credentials: UserLogin):
     async with db_connection.acquire() as conn:
         db_user = await conn.fetchrow(
             "SELECT id, username, hashed_password, is_active FROM users WHERE username = $1",
-            user_credentials.username
+            user_credentials.username,
+            timeout=remaining()
         )
         
         if not db_user:
@@ -316,7 +334,8 @@ async def login(user_credentials: UserLogin):
         # Update last login
         await conn.execute(
             "UPDATE users SET updated_at = CURRENT_TIMESTAMP WHERE id = $1",
-            db_user["id"]
+            db_user["id"],
+            timeout=remaining()
         )
         
         access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -337,6 +356,11 @@ async def verify_token(current_user: TokenData = Depends(get_current_user)):
     return {"username": current_user.username,  "valid": True, }
 
 # Error handlers
+@app.exception_handler(asyncio.TimeoutError)
+async def timeout_error_handler(request, exc):
+    # asyncpg timeout= reached (query cancelled on the server): the caller's deadline has passed
+    return JSONResponse(status_code=504, content={"detail": "Deadline exceeded"})
+
 @app.exception_handler(ValueError)
 async def value_error_handler(request, exc):
     return HTTPException(status_code=400, detail=str(exc))
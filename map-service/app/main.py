@@ -7,9 +7,16 @@ from datetime import datetime, timezone
 import logging
 import os
 import json
+import hmac
 from prometheus_client import Counter, Histogram, generate_latest
+from instrumentation import MetricsMiddleware, metrics_registry
+from deadline import DeadlineMiddleware, max_time_ms, remaining
+from structured_logging import StructuredLogger
+from loop_monitor import LoopMonitor
 from contextlib import asynccontextmanager
 from bson import ObjectId
+import pymongo
+from pymongo.errors import ExecutionTimeout
 from fastapi.responses import PlainTextResponse, Response, JSONResponse
 import time
 from typing import Optional, List
@@ -23,6 +30,11 @@ SECRET_KEY = os.getenv("JWT_SECRET", "changeme")
 ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 ENVIRONMENT = os.getenv("ENVIRONMENT", "development")
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOOP_MONITOR_INTERVAL = float(os.getenv("LOOP_MONITOR_INTERVAL", "0.5"))
+LOOP_SLOW_CALLBACK_THRESHOLD = float(os.getenv("LOOP_SLOW_CALLBACK_THRESHOLD", "0.1"))
+INTERNAL_AUTH_TOKEN = os.getenv("INTERNAL_AUTH_TOKEN", "")
 
 
 # Logging configuration
@@ -30,18 +42,12 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     level=getattr(logging, LOG_LEVEL.upper())
 )
-logger = logging.getLogger(__name__)
 
+# JSON logs are queued and written by a background thread
+log_structured = StructuredLogger("map-service", ENVIRONMENT, LOG_LEVEL, LOG_SAMPLE_RATES, LOG_QUEUE_SIZE)
 
-def log_structured(message: str, **kwargs):
-    log_data = {
-        "timestamp": datetime.now(timezone.utc).isoformat(),
-        "environment": ENVIRONMENT,
-        "service": "map-service",
-        "message": message,
-        **kwargs
-    }
-    logger.info(json.dumps(log_data))
+# Loop lag histogram, plus a stack snapshot of any callback blocking the loop longer than the threshold
+loop_monitor = LoopMonitor("map-service", LOOP_MONITOR_INTERVAL, LOOP_SLOW_CALLBACK_THRESHOLD, log_structured)
 
 # MongoDB helpers
 class PyObjectId(ObjectId):
@@ -140,6 +146,7 @@ REQUEST_LATENCY = Histogram('map_service_request_duration_seconds', 'Request lat
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
+    loop_monitor.start()
     try:
         db.client = AsyncIOMotorClient(f"mongodb://{MONGO_HOST}:{MONGO_PORT}")
         db.database = db.client[MONGO_DB_NAME]
@@ -156,6 +163,7 @@ async def lifespan(app: FastAPI):
     yield
     
     # Shutdown  
+    await loop_monitor.stop()
     if db.client:
         db.client.close()
         log_structured("MongoDB connection closed")
@@ -168,32 +176,35 @@ app = FastAPI(
 )
 
 # Middleware for metrics
-@app.middleware("http")
-async def collect_metrics(request: Request, call_next):
-    start_time = time.time()
-    response = await call_next(request)
-    process_time = time.time() - start_time
-
-    # Metrics
-    endpoint = request.url.path
-    method = request.method
-    status_code = response.status_code
-
-    REQUEST_COUNT.labels(method=method, endpoint=endpoint, status_code=status_code).inc()
-    REQUEST_LATENCY.labels(method=method, endpoint=endpoint, status_code=status_code).observe(process_time)
-
-    return response
+# Enforces the gateway's X-Deadline-Ms and cancels work for disconnected clients
+app.add_middleware(DeadlineMiddleware)
+app.add_middleware(MetricsMiddleware, request_count=REQUEST_COUNT, request_latency=REQUEST_LATENCY)
 
 # Security
 security = HTTPBearer()
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> TokenData:
+def trusted_gateway_claims(request: Request) -> Optional[dict]:
+    # Claims already verified by the API gateway, only trusted with the shared internal token
+    if not INTERNAL_AUTH_TOKEN:
+        return None
+    if not hmac.compare_digest(request.headers.get("x-internal-auth", ""), INTERNAL_AUTH_TOKEN):
+        return None
+    claims = request.headers.get("x-auth-claims")
+    return json.loads(claims) if claims else None
+
+async def get_current_user(request: Request, credentials: HTTPAuthorizationCredentials = Depends(security)) -> TokenData:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )   
 
+    claims = trusted_gateway_claims(request)
+    if claims is not None:
+        if claims.get("sub") is None:
+            raise credentials_exception
+        return TokenData(username=claims["sub"], user_id=claims.get("user_id"))
+
     try:
         payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -236,7 +247,7 @@ async def health_check():
 
 @app.get("/metrics")
 async def metrics():
-    return PlainTextResponse(generate_latest())
+    return PlainTextResponse(generate_latest(metrics_registry()))
 
 @app.post('/', response_model=MapInDB, status_code=status.HTTP_201_CREATED)
 async def create_map(
@@ -249,8 +260,10 @@ async def create_map(
     map_dict['created_at'] = datetime.now(timezone.utc)
     map_dict['updated_at'] = datetime.now(timezone.utc)
 
-    result = await db.database.maps.insert_one(map_dict)
-    created_map = await db.database.maps.find_one({"_id": result.inserted_id})
+    # Writes take no maxTimeMS argument: the client-side timeout carries the caller's deadline
+    with pymongo.timeout(remaining()):
+        result = await db.database.maps.insert_one(map_dict)
+    created_map = await db.database.maps.find_one({"_id": result.inserted_id}, max_time_ms=max_time_ms())
     return MapInDB(**created_map)
 
 @app.get('/', response_model=List[MapInDB])
@@ -259,13 +272,13 @@ async def list_maps(
     limit: int = 100,
     current_user: TokenData = Depends(get_current_user)
 ):
-    maps = await db.database.maps.find().skip(skip).limit(limit).to_list(length=limit)
+    maps = await db.database.maps.find(max_time_ms=max_time_ms()).skip(skip).limit(limit).to_list(length=limit)
     return maps
 
 @app.get('/{map_id}', response_model=MapInDB)
 async def get_map(map_id: str, current_user: TokenData = Depends(get_current_user)):
     map_obj_id = validate_object_id(map_id)
-    map_doc = await db.database.maps.find_one({"_id": map_obj_id})
+    map_doc = await db.database.maps.find_one({"_id": map_obj_id}, max_time_ms=max_time_ms())
     if not map_doc:
         raise HTTPException(status_code=404, detail="Map not found")
     return MapInDB(**map_doc)
@@ -273,7 +286,7 @@ async def get_map(map_id: str, current_user: TokenData = Depends(get_current_use
 @app.put('/{map_id}', response_model=MapInDB)
 async def update_map(map_id: str, map: MapUpdate, current_user: TokenData = Depends(get_current_user)):
     map_obj_id = validate_object_id(map_id)
-    map_doc = await db.database.maps.find_one({"_id": map_obj_id})
+    map_doc = await db.database.maps.find_one({"_id": map_obj_id}, max_time_ms=max_time_ms())
     if not map_doc:
         raise HTTPException(status_code=404, detail="Map not found")
     if map_doc["created_by"] != current_user.username:
@@ -281,25 +294,32 @@ async def update_map(map_id: str, map: MapUpdate, current_user: TokenData = Depe
     update_data = {k: v for k, v in map.model_dump().items() if v is not None}
     update_data['updated_by'] = current_user.username
     update_data['updated_at'] = datetime.now(timezone.utc)
-    result = await db.database.maps.update_one({"_id": map_obj_id}, {"$set": update_data})
+    with pymongo.timeout(remaining()):
+        result = await db.database.maps.update_one({"_id": map_obj_id}, {"$set": update_data})
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Map not found")
-    updated_map = await db.database.maps.find_one({"_id": map_obj_id})
+    updated_map = await db.database.maps.find_one({"_id": map_obj_id}, max_time_ms=max_time_ms())
     return MapInDB(**updated_map)
 
 @app.delete('/{map_id}', status_code=status.HTTP_204_NO_CONTENT)
 async def delete_map(map_id: str, current_user: TokenData = Depends(get_current_user)):
     map_obj_id = validate_object_id(map_id)
-    map_doc = await db.database.maps.find_one({"_id": map_obj_id})
+    map_doc = await db.database.maps.find_one({"_id": map_obj_id}, max_time_ms=max_time_ms())
     if not map_doc:
         raise HTTPException(status_code=404, detail="Map not found")
     if map_doc["created_by"] != current_user.username:
         raise HTTPException(status_code=403, detail="Not authorized to delete this map")
-    result = await db.database.maps.delete_one({"_id": map_obj_id})
+    with pymongo.timeout(remaining()):
+        result = await db.database.maps.delete_one({"_id": map_obj_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Map not found")
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
+@app.exception_handler(ExecutionTimeout)
+async def execution_timeout_handler(request, exc):
+    # maxTimeMS reached: the caller's deadline has passed
+    return JSONResponse(status_code=504, content={"detail": "Deadline exceeded"})
+
 @app.exception_handler(ValueError)
 async def value_error_handler(request, exc):
     return JSONResponse(status_code=400, content={"detail": str(exc)})
@@ -7,10 +7,17 @@ from datetime import datetime, timezone
 import logging
 import os
 import json
+import hmac
 from prometheus_client import Counter, Histogram, generate_latest
+from instrumentation import MetricsMiddleware, metrics_registry
+from deadline import DeadlineMiddleware, max_time_ms, remaining
+from structured_logging import StructuredLogger
+from loop_monitor import LoopMonitor
 from contextlib import asynccontextmanager
 from bson import ObjectId
-from fastapi.responses import PlainTextResponse
+import pymongo
+from pymongo.errors import ExecutionTimeout
+from fastapi.responses import PlainTextResponse, JSONResponse
 import time
 from typing import Optional, List
 
@@ -22,23 +29,23 @@ SECRET_KEY = os.getenv("JWT_SECRET", "changeme")
 ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 ENVIRONMENT = os.getenv("ENVIRONMENT", "development")
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOOP_MONITOR_INTERVAL = float(os.getenv("LOOP_MONITOR_INTERVAL", "0.5"))
+LOOP_SLOW_CALLBACK_THRESHOLD = float(os.getenv("LOOP_SLOW_CALLBACK_THRESHOLD", "0.1"))
+INTERNAL_AUTH_TOKEN = os.getenv("INTERNAL_AUTH_TOKEN", "")
 
 # Logging configuration
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     level=getattr(logging, LOG_LEVEL.upper())
 )
-logger = logging.getLogger(__name__)
-
-def log_structured(message: str, **kwargs):
-    log_data = {
-        "timestamp": datetime.now(timezone.utc).isoformat(),
-        "environment": ENVIRONMENT,
-        "service": "report-service",
-        "message": message,
-        **kwargs
-    }
-    logger.info(json.dumps(log_data))
+
+# JSON logs are queued and written by a background thread
+log_structured = StructuredLogger("report-service", ENVIRONMENT, LOG_LEVEL, LOG_SAMPLE_RATES, LOG_QUEUE_SIZE)
+
+# Loop lag histogram, plus a stack snapshot of any callback blocking the loop longer than the threshold
+loop_monitor = LoopMonitor("report-service", LOOP_MONITOR_INTERVAL, LOOP_SLOW_CALLBACK_THRESHOLD, log_structured)
 
 # MongoDB helpers
 class PyObjectId(ObjectId):
@@ -100,6 +107,7 @@ REQUEST_LATENCY = Histogram('report_service_request_duration_seconds', 'Request
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
+    loop_monitor.start()
     try:
         db.client = AsyncIOMotorClient(f"mongodb://{MONGO_HOST}:{MONGO_PORT}")
         db.database = db.client[MONGO_DB_NAME]
@@ -116,6 +124,7 @@ async def lifespan(app: FastAPI):
     yield
     
     # Shutdown  
+    await loop_monitor.stop()
     if db.client:
         db.client.close()
         log_structured("MongoDB connection closed")
@@ -127,32 +136,35 @@ app = FastAPI(
 )
 
 # Middleware for metrics
-@app.middleware("http")
-async def collect_metrics(request: Request, call_next):
-    start_time = time.time()
-    response = await call_next(request)
-    process_time = time.time() - start_time
-
-    # Metrics
-    endpoint = request.url.path
-    method = request.method
-    status_code = response.status_code
-
-    REQUEST_COUNT.labels(method=method, endpoint=endpoint, status_code=status_code).inc()
-    REQUEST_LATENCY.labels(method=method, endpoint=endpoint, status_code=status_code).observe(process_time)
-
-    return response
+# Enforces the gateway's X-Deadline-Ms and cancels work for disconnected clients
+app.add_middleware(DeadlineMiddleware)
+app.add_middleware(MetricsMiddleware, request_count=REQUEST_COUNT, request_latency=REQUEST_LATENCY)
 
 # Security
 security = HTTPBearer()
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> TokenData:
+def trusted_gateway_claims(request: Request) -> Optional[dict]:
+    # Claims already verified by the API gateway, only trusted with the shared internal token
+    if not INTERNAL_AUTH_TOKEN:
+        return None
+    if not hmac.compare_digest(request.headers.get("x-internal-auth", ""), INTERNAL_AUTH_TOKEN):
+        return None
+    claims = request.headers.get("x-auth-claims")
+    return json.loads(claims) if claims else None
+
+async def get_current_user(request: Request, credentials: HTTPAuthorizationCredentials = Depends(security)) -> TokenData:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )   
 
+    claims = trusted_gateway_claims(request)
+    if claims is not None:
+        if claims.get("sub") is None:
+            raise credentials_exception
+        return TokenData(username=claims["sub"], user_id=claims.get("user_id"))
+
     try:
         payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -189,7 +201,7 @@ async def health_check():
 
 @app.get("/metrics")
 async def metrics():
-    return PlainTextResponse(generate_latest())
+    return PlainTextResponse(generate_latest(metrics_registry()))
 
 @app.post('/', response_model=ReportInDB, status_code=status.HTTP_201_CREATED)
 async def create_report(
@@ -202,8 +214,10 @@ async def create_report(
     report_dict['created_at'] = datetime.now(timezone.utc)
     report_dict['updated_at'] = datetime.now(timezone.utc)
 
-    result = await db.database.reports.insert_one(report_dict)
-    created_report = await db.database.reports.find_one({"_id": result.inserted_id})
+    # Writes take no maxTimeMS argument: the client-side timeout carries the caller's deadline
+    with pymongo.timeout(remaining()):
+        result = await db.database.reports.insert_one(report_dict)
+    created_report = await db.database.reports.find_one({"_id": result.inserted_id}, max_time_ms=max_time_ms())
     return ReportInDB(**created_report)
 
 @app.get('/', response_model=List[ReportInDB])
@@ -212,9 +226,14 @@ async def list_reports(
     limit: int = 100,
     current_user: TokenData = Depends(get_current_user)
 ):
-    reports = await db.database.reports.find().skip(skip).limit(limit).to_list(length=limit)
+    reports = await db.database.reports.find(max_time_ms=max_time_ms()).skip(skip).limit(limit).to_list(length=limit)
     return reports
 
+@app.exception_handler(ExecutionTimeout)
+async def execution_timeout_handler(request, exc):
+    # maxTimeMS reached: the caller's deadline has passed
+    return JSONResponse(status_code=504, content={"detail": "Deadline exceeded"})
+
 @app.exception_handler(ValueError)
 async def value_error_handler(request, exc):
     return HTTPException(status_code=400, detail=str(exc))
@@ -0,0 +1,63 @@
+import math
+import os
+import shutil
+
+APP_MODULE = os.getenv("APP_MODULE", "main:app")
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+GRACEFUL_SHUTDOWN_TIMEOUT = int(os.getenv("GRACEFUL_SHUTDOWN_TIMEOUT", "20"))
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus_multiproc")
+
+def available_cpus() -> int:
+    # Container cgroup v2 quota (docker --cpus), otherwise the cores visible to the process
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            return max(1, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    return len(os.sched_getaffinity(0))
+
+def worker_count() -> int:
+    return int(os.getenv("WEB_CONCURRENCY") or available_cpus())
+
+def prepare_metrics_dir():
+    # Every worker writes its metrics here and /metrics aggregates them; files from a previous run are removed
+    shutil.rmtree(PROMETHEUS_MULTIPROC_DIR, ignore_errors=True)
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR)
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = PROMETHEUS_MULTIPROC_DIR
+
+def main():
+    import uvicorn
+
+    workers = worker_count()
+    config = uvicorn.Config(
+        APP_MODULE,
+        host=HOST,
+        port=PORT,
+        workers=workers,
+        timeout_graceful_shutdown=GRACEFUL_SHUTDOWN_TIMEOUT,
+    )
+    if workers == 1:
+        uvicorn.Server(config).run()
+        return
+
+    # Before prometheus_client is imported anywhere: workers inherit the environment variable
+    prepare_metrics_dir()
+    from prometheus_client import multiprocess
+    from uvicorn.supervisors import Multiprocess
+
+    class Supervisor(Multiprocess):
+        # SIGTERM is relayed to every worker, which drains in-flight requests and runs its shutdown
+        # before the supervisor exits; a dead worker is replaced and its "live" gauges are dropped
+        def keep_subprocess_alive(self):
+            before = {process.pid for process in self.processes}
+            super().keep_subprocess_alive()
+            for pid in before - {process.pid for process in self.processes}:
+                multiprocess.mark_process_dead(pid)
+
+    Supervisor(config, target=uvicorn.Server(config).run, sockets=[config.bind_socket()]).run()
+
+if __name__ == "__main__":
+    main()
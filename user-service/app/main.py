@@ -7,11 +7,18 @@ from datetime import datetime
 import logging
 import os
 import json
+import hmac
 from typing import Optional, List
 from bson import ObjectId
+import pymongo
+from pymongo.errors import ExecutionTimeout
 from contextlib import asynccontextmanager
 from prometheus_client import Counter, Histogram, generate_latest
-from fastapi.responses import PlainTextResponse
+from instrumentation import MetricsMiddleware, metrics_registry
+from deadline import DeadlineMiddleware, max_time_ms, remaining
+from structured_logging import StructuredLogger
+from loop_monitor import LoopMonitor
+from fastapi.responses import PlainTextResponse, JSONResponse
 import time
 
 # Configuration
@@ -22,23 +29,23 @@ SECRET_KEY = os.getenv("JWT_SECRET", "changeme")
 ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 ENVIRONMENT = os.getenv("ENVIRONMENT", "development")
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOOP_MONITOR_INTERVAL = float(os.getenv("LOOP_MONITOR_INTERVAL", "0.5"))
+LOOP_SLOW_CALLBACK_THRESHOLD = float(os.getenv("LOOP_SLOW_CALLBACK_THRESHOLD", "0.1"))
+INTERNAL_AUTH_TOKEN = os.getenv("INTERNAL_AUTH_TOKEN", "")
 
 # Logging configuration
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     level=getattr(logging, LOG_LEVEL.upper())
 )
-logger = logging.getLogger(__name__)
-
-def log_structured(message: str, **kwargs):
-    log_data = {
-        "timestamp": datetime.utcnow().isoformat(),
-        "environment": ENVIRONMENT,
-        "service": "user-service",
-        "message": message,
-        **kwargs
-    }
-    logger.info(json.dumps(log_data))
+
+# JSON logs are queued and written by a background thread
+log_structured = StructuredLogger("user-service", ENVIRONMENT, LOG_LEVEL, LOG_SAMPLE_RATES, LOG_QUEUE_SIZE)
+
+# Loop lag histogram, plus a stack snapshot of any callback blocking the loop longer than the threshold
+loop_monitor = LoopMonitor("user-service", LOOP_MONITOR_INTERVAL, LOOP_SLOW_CALLBACK_THRESHOLD, log_structured)
 
 # MongoDB helpers
 class PyObjectId(ObjectId):
@@ -115,6 +122,7 @@ REQUEST_LATENCY = Histogram('user_service_request_duration_seconds', 'Request la
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
+    loop_monitor.start()
     try:
         db.client = AsyncIOMotorClient(f"mongodb://{MONGO_HOST}:{MONGO_PORT}")
         db.database = db.client[MONGO_DB_NAME]
@@ -132,6 +140,7 @@ async def lifespan(app: FastAPI):
     yield
     
     # Shutdown
+    await loop_monitor.stop()
     if db.client:
         db.client.close()
         log_structured("MongoDB connection closed")
@@ -143,30 +152,34 @@ app = FastAPI(
 )
 
 # Middleware for metrics
-@app.middleware("http")
-async def collect_metrics(request: Request, call_next):
-    start_time = time.time()
-    response = await call_next(request)
-    process_time = time.time() - start_time
-
-    endpoint = request.url.path
-    method = request.method
-    status_code = response.status_code
-
-    REQUEST_COUNT.labels(method=method, endpoint=endpoint, status_code=status_code).inc()
-    REQUEST_LATENCY.labels(method=method, endpoint=endpoint, status_code=status_code).observe(process_time)
-
-    return response
+# Enforces the gateway's X-Deadline-Ms and cancels work for disconnected clients
+app.add_middleware(DeadlineMiddleware)
+app.add_middleware(MetricsMiddleware, request_count=REQUEST_COUNT, request_latency=REQUEST_LATENCY)
 
 # Security
 security = HTTPBearer()
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> TokenData:
+def trusted_gateway_claims(request: Request) -> Optional[dict]:
+    # Claims already verified by the API gateway, only trusted with the shared internal token
+    if not INTERNAL_AUTH_TOKEN:
+        return None
+    if not hmac.compare_digest(request.headers.get("x-internal-auth", ""), INTERNAL_AUTH_TOKEN):
+        return None
+    claims = request.headers.get("x-auth-claims")
+    return json.loads(claims) if claims else None
+
+async def get_current_user(request: Request, credentials: HTTPAuthorizationCredentials = Depends(security)) -> TokenData:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+    claims = trusted_gateway_claims(request)
+    if claims is not None:
+        if claims.get("sub") is None:
+            raise credentials_exception
+        return TokenData(username=claims["sub"], user_id=claims.get("user_id"))
     
     try:
         payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
@@ -204,7 +217,7 @@ async def health_check():
 
 @app.get("/metrics")
 async def metrics():
-    return PlainTextResponse(generate_latest())
+    return PlainTextResponse(generate_latest(metrics_registry()))
 
 @app.post("/", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
 async def create_user(
@@ -219,7 +232,7 @@ async def create_user(
             {"username": user.username},
             {"email": user.email}
         ]
-    })
+    }, max_time_ms=max_time_ms())
     
     if existing_user:
         log_structured("User creation failed - duplicate", username=user.username)
@@ -235,8 +248,10 @@ async def create_user(
     )
     
     try:
-        result = await db.database.users.insert_one(user_doc.dict(by_alias=True))
-        created_user = await db.database.users.find_one({"_id": result.inserted_id})
+        # Writes take no maxTimeMS argument: the client-side timeout carries the caller's deadline
+        with pymongo.timeout(remaining()):
+            result = await db.database.users.insert_one(user_doc.dict(by_alias=True))
+        created_user = await db.database.users.find_one({"_id": result.inserted_id}, max_time_ms=max_time_ms())
         
         log_structured("User created successfully", user_id=str(result.inserted_id))
         
@@ -250,6 +265,8 @@ async def create_user(
             is_active=created_user["is_active"],
             role=created_user["role"]
         )
+    except ExecutionTimeout:
+        raise
     except Exception as e:
         log_structured("User creation error", error=str(e), level="ERROR")
         raise HTTPException(
@@ -272,7 +289,7 @@ async def list_users(
         query["is_active"] = is_active
     
     try:
-        cursor = db.database.users.find(query).skip(skip).limit(limit).sort("created_at", -1)
+        cursor = db.database.users.find(query, max_time_ms=max_time_ms()).skip(skip).limit(limit).sort("created_at", -1)
         users = await cursor.to_list(length=limit)
         
         log_structured("Users retrieved", count=len(users))
@@ -290,6 +307,8 @@ async def list_users(
             )
             for user in users
         ]
+    except ExecutionTimeout:
+        raise
     except Exception as e:
         log_structured("Error listing users", error=str(e), level="ERROR")
         raise HTTPException(
@@ -310,7 +329,7 @@ async def get_user(
             detail="Invalid user ID format"
         )
     
-    user = await db.database.users.find_one({"_id": ObjectId(user_id)})
+    user = await db.database.users.find_one({"_id": ObjectId(user_id)}, max_time_ms=max_time_ms())
     
     if not user:
         log_structured("User not found", user_id=user_id)
@@ -356,10 +375,11 @@ async def update_user(
     update_data["updated_at"] = datetime.utcnow()
     
     try:
-        result = await db.database.users.update_one(
-            {"_id": ObjectId(user_id)},
-            {"$set": update_data}
-        )
+        with pymongo.timeout(remaining()):
+            result = await db.database.users.update_one(
+                {"_id": ObjectId(user_id)},
+                {"$set": update_data}
+            )
         
         if result.matched_count == 0:
             raise HTTPException(
@@ -367,7 +387,7 @@ async def update_user(
                 detail="User not found"
             )
         
-        updated_user = await db.database.users.find_one({"_id": ObjectId(user_id)})
+        updated_user = await db.database.users.find_one({"_id": ObjectId(user_id)}, max_time_ms=max_time_ms())
         
         log_structured("User updated successfully", user_id=user_id)
         
@@ -381,6 +401,8 @@ async def update_user(
             is_active=updated_user["is_active"],
             role=updated_user["role"]
         )
+    except ExecutionTimeout:
+        raise
     except Exception as e:
         log_structured("User update error", error=str(e), level="ERROR")
         raise HTTPException(
@@ -402,10 +424,11 @@ async def delete_user(
         )
     
     # Soft delete - just mark as inactive
-    result = await db.database.users.update_one(
-        {"_id": ObjectId(user_id)},
-        {"$set": {"is_active": False, "updated_at": datetime.utcnow()}}
-    )
+    with pymongo.timeout(remaining()):
+        result = await db.database.users.update_one(
+            {"_id": ObjectId(user_id)},
+            {"$set": {"is_active": False, "updated_at": datetime.utcnow()}}
+        )
     
     if result.matched_count == 0:
         raise HTTPException(
@@ -416,6 +439,11 @@ async def delete_user(
     log_structured("User deleted successfully", user_id=user_id)
 
 # Error handlers
+@app.exception_handler(ExecutionTimeout)
+async def execution_timeout_handler(request, exc):
+    # maxTimeMS reached: the caller's deadline has passed
+    return JSONResponse(status_code=504, content={"detail": "Deadline exceeded"})
+
 @app.exception_handler(ValueError)
 async def value_error_handler(request, exc):
     return HTTPException(status_code=400, detail=str(exc))
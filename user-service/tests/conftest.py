@@ -0,0 +1,5 @@
+import os
+import sys
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(SERVICE_DIR, "app"))
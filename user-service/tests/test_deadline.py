@@ -0,0 +1,56 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+from fastapi.testclient import TestClient
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from deadline import DeadlineMiddleware, max_time_ms, remaining
+
+async def sleepy(request):
+    await asyncio.sleep(float(request.query_params.get("delay", 0)))
+    return JSONResponse({"remaining": remaining(), "max_time_ms": max_time_ms()})
+
+@pytest.fixture(scope="module")
+def client():
+    app = Starlette(routes=[Route("/sleepy", sleepy)])
+    app.add_middleware(DeadlineMiddleware)
+    with TestClient(app) as client:
+        yield client
+
+def test_no_deadline_header(client):
+    response = client.get("/sleepy")
+    assert response.status_code == 200
+    assert response.json() == {"remaining": None, "max_time_ms": None}
+
+def test_budget_exposed_to_handler(client):
+    response = client.get("/sleepy", headers={"X-Deadline-Ms": "5000"})
+    assert response.status_code == 200
+    assert 4000 < response.json()["max_time_ms"] <= 5000
+
+def test_expired_deadline_rejected(client):
+    response = client.get("/sleepy", headers={"X-Deadline-Ms": "0"})
+    assert response.status_code == 504
+    assert response.json() == {"detail": "Deadline exceeded"}
+
+def test_slow_handler_cut_at_deadline(client):
+    response = client.get("/sleepy?delay=1", headers={"X-Deadline-Ms": "50"})
+    assert response.status_code == 504
+
+def test_mongo_time_limit_maps_to_504(monkeypatch):
+    pytest.importorskip("motor")
+    from pymongo.errors import ExecutionTimeout
+    import main
+
+    def find(*args, **kwargs):
+        raise ExecutionTimeout("operation exceeded time limit", 50)
+
+    monkeypatch.setattr(main.db, "database", SimpleNamespace(users=SimpleNamespace(find=find)))
+    main.app.dependency_overrides[main.get_current_user] = lambda: main.TokenData(username="alice")
+    try:
+        # No lifespan: the service must not try to reach MongoDB
+        response = TestClient(main.app).get("/", headers={"X-Deadline-Ms": "5000"})
+    finally:
+        main.app.dependency_overrides.clear()
+    assert response.status_code == 504
+    assert response.json() == {"detail": "Deadline exceeded"}
@@ -0,0 +1,30 @@
+import asyncio
+import time
+from loop_monitor import LoopMonitor
+
+def block_loop(seconds: float):
+    time.sleep(seconds)
+
+def test_watchdog_reports_blocked_loop():
+    records = []
+
+    def log(message, **fields):
+        records.append((message, fields))
+
+    async def scenario():
+        monitor = LoopMonitor("user-service", 0.02, 0.1, log)
+        monitor.start()
+        await asyncio.sleep(0.05)
+        block_loop(0.4)
+        await asyncio.sleep(0.05)
+        await monitor.stop()
+        return monitor
+
+    monitor = asyncio.run(scenario())
+    blocked = [fields for message, fields in records if message == "Event loop blocked"]
+    # One report per stall, with the stack captured while the loop was blocked
+    assert len(blocked) == 1
+    assert blocked[0]["blocked_ms"] >= 100
+    assert any("block_loop" in line for line in blocked[0]["stack"])
+    assert max(monitor.lags) >= 0.3
+    assert monitor.snapshot()["samples"] == len(monitor.lags)
@@ -0,0 +1,33 @@
+import json
+import logging
+import time
+from types import SimpleNamespace
+import structured_logging
+from structured_logging import StructuredLogger
+
+class SlowCapture(logging.Handler):
+    # Slower than the callers: records pile up in the queue until shutdown
+    def __init__(self):
+        super().__init__()
+        self.lines = []
+
+    def emit(self, record):
+        time.sleep(0.001)
+        self.lines.append(self.format(record))
+
+def test_queue_flushed_on_shutdown(monkeypatch):
+    exit_hooks = []
+    monkeypatch.setattr(structured_logging, "atexit", SimpleNamespace(register=exit_hooks.append))
+    log = StructuredLogger("user-service", "test")
+    capture = SlowCapture()
+    capture.setFormatter(structured_logging.JsonFormatter("%(message)s"))
+    log.listener.handlers = (capture,)
+
+    for index in range(200):
+        log("Queued record", index=index)
+    assert len(capture.lines) < 200
+
+    for hook in exit_hooks:
+        hook()
+    assert [json.loads(line)["index"] for line in capture.lines] == list(range(200))
+    assert json.loads(capture.lines[0])["service"] == "user-service"